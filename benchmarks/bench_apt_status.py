@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+""" Benchmark: replay recorded APT::Status-Fd transcripts through the apt status parser
+
+Checks that the progress of every transcript in benchmarks/fixtures/*.status never goes
+backwards and ends at 100%, then measures the parse rate of the streamed lines.
+Record a new transcript with:
+apt-get -o APT::Status-Fd=3 -o Dpkg::Progress-Fancy=0 install <package> 3>new.status
+
+Usage: python3 benchmarks/bench_apt_status.py [repeat]
+"""
+
+import io
+import sys
+import timeit
+from glob import glob
+from os.path import join, abspath, dirname, basename
+
+BENCH_DIR = dirname(abspath(__file__))
+sys.path.insert(0, join(dirname(BENCH_DIR), 'usr/lib/solydxk/system'))
+from utils import stream_apt_status
+
+
+def replay(transcript, download_weight):
+    """ Return the progress dictionaries of a transcript """
+    progress_list = []
+    with open(file=transcript, mode='r', encoding='utf-8') as status_fle:
+        stream_apt_status(status_fle, progress_list.append, download_weight)
+    return progress_list
+
+
+def check(transcript):
+    """ Progress only moves forward and the transcript ends at 100% """
+    download_weight = 1 if 'update' in basename(transcript) else 0.5
+    progress_list = replay(transcript, download_weight)
+    fractions = [progress['fraction'] for progress in progress_list]
+    assert fractions, f"{transcript}: no status lines"
+    assert fractions == sorted(fractions), f"{transcript}: progress goes backwards"
+    assert fractions[-1] == 1.0, f"{transcript}: ends at {fractions[-1]}"
+    errors = [progress['package'] for progress in progress_list if progress['status'] == 'pmerror']
+    return len(progress_list), errors
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    lines = []
+    for transcript in sorted(glob(join(BENCH_DIR, 'fixtures', '*.status'))):
+        nr_lines, errors = check(transcript)
+        print(f"{basename(transcript)}: {nr_lines} status lines, errors: {', '.join(errors) or '-'}")
+        with open(file=transcript, mode='r', encoding='utf-8') as status_fle:
+            lines.extend(status_fle.readlines())
+
+    text = ''.join(lines * 1000)
+    best = min(timeit.repeat(lambda: stream_apt_status(io.StringIO(text)), number=1, repeat=repeat))
+    nr_lines = len(lines) * 1000
+    print(f"{nr_lines} lines, best of {repeat}: {best * 1000:.2f} ms ({nr_lines / best:,.0f} lines/s)")
+
+
+if __name__ == '__main__':
+    main()
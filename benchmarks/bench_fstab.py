@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+""" Benchmark: partition lookups against synthetic 200-entry fstab and crypttab files
+
+Compares the old per-partition approach (re-read and re-sort fstab, regex search,
+re-read crypttab and resolve every UUID) with the parsed-once FstabModel/CrypttabModel.
+
+Usage: python3 benchmarks/bench_fstab.py [nr_entries] [repeat]
+"""
+
+import re
+import sys
+import uuid
+import timeit
+import tempfile
+from os.path import join, abspath, dirname, basename
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'usr/lib/solydxk/system'))
+from fstab import FstabModel, CrypttabModel
+
+
+def create_files(tmp_dir, nr_entries):
+    """ Write fstab and crypttab with nr_entries devices and return the partitions """
+    partitions = []
+    uuid_devices = {}
+    fstab = ['# /etc/fstab: static file system information.', '# <file system> <mount point> <type> <options> <dump> <pass>']
+    crypttab = ['# <target name> <source device> <key file> <options>']
+    for i in range(nr_entries):
+        dev_uuid = str(uuid.UUID(int=i + 1))
+        device = f"/dev/sd{chr(97 + i // 16)}{i % 16 + 1}"
+        uuid_devices[dev_uuid] = device
+        fstab.append(f"UUID={dev_uuid}\t/media/data{i:03d}\text4\tdefaults\t0\t2")
+        crypttab.append(f"{basename(device)} UUID={dev_uuid} /.lukskey luks")
+        partitions.append({'device': device, 'old_device': device, 'old_uuid': dev_uuid})
+        if i % 50 == 49:
+            fstab.append(f"# Group {i // 50}")
+    fstab_path = join(tmp_dir, 'fstab')
+    crypttab_path = join(tmp_dir, 'crypttab')
+    with open(file=fstab_path, mode='w', encoding='utf-8') as fstab_fle:
+        fstab_fle.write('\n'.join(fstab) + '\n')
+    with open(file=crypttab_path, mode='w', encoding='utf-8') as crypttab_fle:
+        crypttab_fle.write('\n'.join(crypttab) + '\n')
+    return fstab_path, crypttab_path, partitions, uuid_devices
+
+
+def legacy_sort_fstab(fstab_path):
+    """ The old SolydXKSystemSettings.sort_fstab """
+    sort_lst = []
+    sorted_lst = []
+    with open(file=fstab_path, mode='r', encoding='utf-8') as fstab_fle:
+        fstab_lines = fstab_fle.readlines()
+    for line in fstab_lines:
+        line = line.strip()
+        if line[0:1] == '#':
+            line_added = False
+            if not sorted_lst:
+                sorted_lst.append(line)
+                line_added = True
+            for sort_line in sorted(sort_lst, key=lambda x: x[1]):
+                sorted_lst.append('\t'.join(sort_line))
+            sort_lst = []
+            if not line_added:
+                sorted_lst.append('')
+                sorted_lst.append(line)
+        else:
+            lst = line.split()
+            if len(lst) == 6:
+                sort_lst.append(lst)
+    for sort_line in sorted(sort_lst, key=lambda x: x[1]):
+        sorted_lst.append('\t'.join(sort_line))
+    return '\n'.join(sorted_lst) + '\n' if sorted_lst else ''
+
+
+def legacy_lookup(fstab_path, crypttab_path, partitions, uuid_devices):
+    """ Old flow: parse everything again for every partition """
+    found = 0
+    for partition in partitions:
+        fstab_cont = legacy_sort_fstab(fstab_path)
+        regexp = rf"^\s*(UUID={partition['old_uuid']}|{partition['old_device']})\s+(\S+)"
+        if re.search(regexp, fstab_cont, re.M):
+            with open(file=crypttab_path, mode='r', encoding='utf-8') as crypttab_fle:
+                lines = crypttab_fle.readlines()
+            for line in lines:
+                line_data = line.strip().split()
+                if len(line_data) <= 1:
+                    continue
+                match = re.search(r'[0-9a-z]{8}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{12}',
+                                  line_data[1])
+                # Dictionary lookup instead of blkid -U: the real cost was a process per line
+                if match and basename(uuid_devices.get(match.group(0), '')) == basename(partition['device']):
+                    found += 1
+                    break
+    return found
+
+
+def model_lookup(fstab_path, crypttab_path, partitions, uuid_devices):
+    """ New flow: parse once, look up in O(1) """
+    found = 0
+    fstab_model = FstabModel(fstab_path)
+    crypttab_model = CrypttabModel(crypttab_path, uuid_devices)
+    fstab_model.sorted_content()
+    for partition in partitions:
+        if fstab_model.find(uuid=partition['old_uuid'], device=partition['old_device']):
+            if crypttab_model.find(partition['device']):
+                found += 1
+    return found
+
+
+def main():
+    nr_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        args = create_files(tmp_dir, nr_entries)
+        assert legacy_lookup(*args) == model_lookup(*args) == nr_entries
+        legacy = min(timeit.repeat(lambda: legacy_lookup(*args), number=1, repeat=repeat))
+        model = min(timeit.repeat(lambda: model_lookup(*args), number=1, repeat=repeat))
+    print(f"{nr_entries} entries, best of {repeat}")
+    print(f"legacy: {legacy * 1000:9.2f} ms")
+    print(f"model:  {model * 1000:9.2f} ms ({legacy / model:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+""" Benchmark: startup and refresh operations against fixture sysroots
+
+Builds a sysroot from benchmarks/fixtures/sysroot for each data size: the fixture files
+(fstab, crypttab, locale.gen, SUPPORTED, zone.tab, dpkg status, sources.list(.d),
+grub defaults) are extended with generated entries. The modules read the sysroot
+instead of the live system through utils.set_root; UDisks, the apt cache and the
+mirrors download are mocked.
+The modules are imported from a copy of usr/lib/solydxk/system: get_mirror_data
+writes the downloaded mirrors list next to apt_sources.py.
+
+Cases that need a missing module (python-apt, PyGObject) or a display are skipped.
+The median of each case is compared with the stored baseline: a case that is more
+than --threshold slower is reported as a regression (exit code 1).
+
+Usage: python3 benchmarks/bench_startup.py [--sizes 10,100,1000] [--repeat 5]
+                                           [--threshold 0.25] [--save] [--case NAME]
+"""
+
+import os
+import sys
+import json
+import shutil
+import timeit
+import argparse
+import tempfile
+import statistics
+from contextlib import contextmanager
+from os.path import join, abspath, dirname, exists, isdir
+
+BENCH_DIR = dirname(abspath(__file__))
+SYSTEM_DIR = join(dirname(BENCH_DIR), 'usr/lib/solydxk/system')
+FIXTURE_ROOT = join(BENCH_DIR, 'fixtures', 'sysroot')
+BASELINE = join(BENCH_DIR, 'fixtures', 'startup-baseline.json')
+KERNEL_RELEASE = '6.1.0-20-amd64'
+
+
+class SkipCase(Exception):
+    pass
+
+
+class NullLog():
+    def write(self, *args, **kwargs):
+        pass
+
+
+# ===============================================
+# Fixture sysroot
+# ===============================================
+
+def append_lines(path, lines):
+    os.makedirs(dirname(path), exist_ok=True)
+    with open(file=path, mode='a', encoding='utf-8') as fle:
+        fle.write('\n'.join(lines) + '\n')
+
+
+def create_sysroot(root, size):
+    """ Copy the fixture sysroot to root and add size generated entries.
+        Returns {devices, mirrors}: the mocked UDisks devices and mirrors list. """
+    shutil.copytree(FIXTURE_ROOT, root)
+    uuids = [f"{i:08x}-0000-4000-8000-{i:012x}" for i in range(size)]
+    devices = {f"/dev/sd{chr(98 + i // 100 % 24)}{i % 100 + 1}": uuid for i, uuid in enumerate(uuids)}
+
+    append_lines(join(root, 'etc/fstab'),
+                 [f"UUID={uuid}\t/media/data{i}\text4\tdefaults,noatime\t0\t2" for i, uuid in enumerate(uuids)])
+    append_lines(join(root, 'etc/crypttab'),
+                 [f"{device[5:]}_crypt\tUUID={uuid}\tnone\tluks"
+                  for i, (device, uuid) in enumerate(devices.items()) if i % 4 == 0])
+    append_lines(join(root, 'usr/share/i18n/SUPPORTED'),
+                 [f"x{i}_X{i}.UTF-8 UTF-8" for i in range(size)])
+    append_lines(join(root, 'usr/share/zoneinfo/zone.tab'),
+                 [f"X{i % 10}\t+0000+00000\tRegion{i % 10}/City{i}" for i in range(size)])
+    append_lines(join(root, 'etc/apt/sources.list.d/mirrors.list'),
+                 [f"deb https://mirror{i}.debian.org/debian/ bookworm main" for i in range(max(1, size // 10))])
+
+    # Installed packages: libraries nothing depends on, auto installed packages and old kernels
+    status = []
+    auto = []
+    for i in range(size):
+        section = ('libs', 'utils', 'oldlibs', 'net')[i % 4]
+        depends = f"Depends: pkg{i + 1}\n" if i % 4 == 1 and i + 1 < size else ''
+        status.append(f"Package: pkg{i}\nStatus: install ok installed\nSection: {section}\n"
+                      f"Installed-Size: {100 + i}\nArchitecture: amd64\nVersion: 1.{i}-1\n{depends}")
+        if i % 5 == 0:
+            auto.append(f"Package: pkg{i}\nArchitecture: amd64\nAuto-Installed: 1\n")
+    for i in range(max(1, size // 100)):
+        status.append(f"Package: linux-image-6.1.0-{i + 1}-amd64\nStatus: install ok installed\n"
+                      f"Section: kernel\nInstalled-Size: 398000\nArchitecture: amd64\nVersion: 6.1.{i}-1\n")
+    append_lines(join(root, 'var/lib/dpkg/status'), status)
+    append_lines(join(root, 'var/lib/apt/extended_states'), auto)
+    os.makedirs(join(root, 'var/cache/apt/archives/partial'))
+    for i in range(max(1, size // 10)):
+        with open(join(root, f"var/cache/apt/archives/pkg{i}_1.{i}-1_amd64.deb"), 'wb') as deb:
+            deb.truncate(1024 * (i + 1))
+
+    # udev by-uuid links
+    os.makedirs(join(root, 'dev/disk/by-uuid'))
+    for device, uuid in devices.items():
+        os.symlink(device, join(root, 'dev/disk/by-uuid', uuid))
+
+    mirrors = [f"Country{i},{'Debian' if i % 2 else 'SolydXK'},mirror{i}.example.org/{'debian' if i % 2 else 'solydxk'}"
+               for i in range(size)]
+    return {'devices': devices, 'mirrors': '\n'.join(mirrors)}
+
+
+# ===============================================
+# Mocks
+# ===============================================
+
+@contextmanager
+def sysroot(root):
+    """ Temporarily configure the modules for the system in root """
+    import utils
+    utils.set_root(root)
+    try:
+        yield
+    finally:
+        utils.set_root('/')
+
+
+@contextmanager
+def patched(*patches):
+    """ Temporarily set attributes: patches are (object, name, value) """
+    missing = object()
+    saved = [(obj, name, getattr(obj, name, missing)) for obj, name, value in patches]
+    for obj, name, value in patches:
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for obj, name, value in reversed(saved):
+            if value is missing:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, value)
+
+
+class FakeDependency():
+    def __init__(self, name):
+        self.name = name
+        self.or_dependencies = [self]
+
+
+class FakeVersion():
+    def __init__(self, fields):
+        self.section = fields.get('Section', '')
+        self.installed_size = int(fields.get('Installed-Size', 0)) * 1024
+        self.provides = [provide.strip() for provide in fields.get('Provides', '').split(',') if provide.strip()]
+        self.depends = [FakeDependency(depend.split()[0]) for depend in fields.get('Depends', '').split(',')
+                        if depend.strip()]
+
+    def get_dependencies(self, *types):
+        return self.depends
+
+
+class FakePackage():
+    def __init__(self, fields, auto):
+        self.name = self.shortname = fields['Package']
+        self.is_installed = fields.get('Status', '').endswith(' installed')
+        self.installed = FakeVersion(fields) if self.is_installed else None
+        self.auto = auto
+        self.is_auto_removable = False
+
+
+class FakeCache():
+    """ Minimal apt cache read from the dpkg status and apt extended states of the sysroot """
+    def __init__(self, root):
+        auto = {fields['Package'] for fields in self.read_stanzas(join(root, 'var/lib/apt/extended_states'))
+                if fields.get('Auto-Installed') == '1'}
+        self.packages = {}
+        for fields in self.read_stanzas(join(root, 'var/lib/dpkg/status')):
+            self.packages[fields['Package']] = FakePackage(fields, fields['Package'] in auto)
+        required = {dependency.name for package in self.packages.values() if package.is_installed
+                    for dependency in package.installed.depends}
+        for package in self.packages.values():
+            package.is_auto_removable = package.auto and package.name not in required
+
+    @staticmethod
+    def read_stanzas(path):
+        stanzas = []
+        with open(file=path, mode='r', encoding='utf-8') as fle:
+            for stanza in fle.read().split('\n\n'):
+                fields = dict(line.split(': ', 1) for line in stanza.splitlines() if ': ' in line)
+                if 'Package' in fields:
+                    stanzas.append(fields)
+        return stanzas
+
+    def __iter__(self):
+        return iter(self.packages.values())
+
+    def __contains__(self, name):
+        return name in self.packages
+
+    def __getitem__(self, name):
+        return self.packages[name]
+
+
+class FakeSnapshot():
+    def refresh(self):
+        pass
+
+    def is_swap(self, device):
+        return False
+
+
+class FakeUdisks2():
+    """ UDisks with mounted ext4 partitions """
+    def __init__(self, devices):
+        self.snapshot = FakeSnapshot()
+        self.devices = {}
+        self.uuids = devices
+
+    def fill_devices(self, include_drives=True, include_flash=True):
+        self.devices = {device: {'mount_point': f"/media/data{i}", 'fs_type': 'ext4', 'label': f"data{i}",
+                                 'total_size': 1024, 'free_size': 512, 'used_size': 512, 'uuid': uuid,
+                                 'removable': False, 'has_grub': False}
+                        for i, (device, uuid) in enumerate(self.uuids.items())}
+
+    def get_mount_size(self, mount):
+        return 1024, 512, 512
+
+
+def settings_object():
+    """ SolydXKSystemSettings without its window """
+    try:
+        import solydxk_system
+    except ImportError as detail:
+        raise SkipCase(detail)
+    settings = solydxk_system.SolydXKSystemSettings.__new__(solydxk_system.SolydXKSystemSettings)
+    settings.log = NullLog()
+    settings.failed_mount_devices = []
+    settings.boot_partition = None
+    settings.holdback = []
+    return solydxk_system, settings
+
+
+def treeview_handler():
+    try:
+        import gi
+        gi.require_version('Gtk', '3.0')
+        from gi.repository import Gtk
+        from treeview import TreeViewHandler
+        if not Gtk.init_check()[0]:
+            raise SkipCase('no display')
+    except (ImportError, ValueError) as detail:
+        raise SkipCase(detail)
+    return Gtk, TreeViewHandler(Gtk.TreeView())
+
+
+def import_apt_sources(root):
+    try:
+        import apt_pkg
+        import apt_sources
+    except ImportError as detail:
+        raise SkipCase(detail)
+    apt_pkg.config.set('Dir::State::status', join(root, 'var/lib/dpkg/status'))
+    return apt_sources
+
+
+# ===============================================
+# Cases: return the function to time
+# ===============================================
+
+def case_locale_info(root, data):
+    import localize
+    def run():
+        with sysroot(root):
+            return localize.LocaleInfo()
+    return run
+
+
+def case_apt(root, data):
+    apt_sources = import_apt_sources(root)
+    patches = [(apt_sources, 'has_deb822', lambda: False),
+               (apt_sources, 'supported_architectures', lambda: ['amd64'])]
+    def run():
+        with sysroot(root), patched(*patches):
+            return apt_sources.Apt()
+    return run
+
+
+def case_get_mirror_data(root, data):
+    apt_sources = import_apt_sources(root)
+    patches = [(apt_sources, 'has_deb822', lambda: False),
+               (apt_sources, 'supported_architectures', lambda: ['amd64']),
+               (apt_sources, 'get_value_from_url', lambda url, *args, **kwargs: data['mirrors'])]
+    with sysroot(root), patched(*patches):
+        apt = apt_sources.Apt()
+    def run():
+        with sysroot(root), patched(*patches):
+            apt.get_mirror_data(exclude_mirrors=['backports', 'security', 'updates'])
+            apt.get_mirror_data(get_dead_mirrors=True)
+    return run
+
+
+def case_cleanup_candidates(root, data):
+    from cleanup import get_cleanup_candidates, get_archives_size
+    def run():
+        get_cleanup_candidates(cache=FakeCache(root), kernel_release=KERNEL_RELEASE)
+        get_archives_size(join(root, 'var/cache/apt/archives'))
+    return run
+
+
+def case_fill_partitions(root, data):
+    solydxk_system, settings = settings_object()
+    import fstab
+    settings._udisks2 = FakeUdisks2(data['devices'])
+    # UUID symlinks are read from the running system
+    patches = [(solydxk_system, 'is_encrypted', lambda device: False),
+               (fstab, 'UUID_DIR', join(root, 'dev/disk/by-uuid'))]
+    def run():
+        with sysroot(root), patched(*patches):
+            settings.fill_partitions(check_encryptable=False)
+    return run
+
+
+def case_fill_treeview_cleanup(root, data):
+    solydxk_system, settings = settings_object()
+    Gtk, settings.tvCleanupHandler = treeview_handler()
+    import cleanup
+    settings.lblCleanupText = Gtk.Label()
+    settings.cleanup_text = 'Unneeded packages'
+    settings.tvCleanup = settings.tvCleanupHandler.treeview
+    patches = [(solydxk_system, 'get_cleanup_candidates',
+                lambda exclude=None: cleanup.get_cleanup_candidates(exclude, FakeCache(root), KERNEL_RELEASE)),
+               (solydxk_system, 'get_archives_size',
+                lambda: cleanup.get_archives_size(join(root, 'var/cache/apt/archives')))]
+    def run():
+        with patched(*patches):
+            settings.fill_treeview_cleanup()
+    return run
+
+
+def case_fill_treeview_locale(root, data):
+    solydxk_system, settings = settings_object()
+    Gtk, settings.tvLocaleHandler = treeview_handler()
+    settings.locale_info = case_locale_info(root, data)()
+    settings.installed_title, settings.locale_title = 'Installed', 'Locale'
+    settings.language_title, settings.default_title = 'Language', 'Default'
+    def run():
+        settings.fill_treeview_locale()
+    return run
+
+
+def case_fill_treeview_mirrors(root, data):
+    solydxk_system, settings = settings_object()
+    Gtk, settings.tvMirrorsHandler = treeview_handler()
+    settings.nbPref = Gtk.Notebook()
+    settings.mirrors = [['Current', 'Country', 'Repository', 'URL']] + \
+                       [[i == 0, *line.split(',')] for i, line in enumerate(data['mirrors'].splitlines())]
+    def run():
+        settings.fill_treeview_mirrors()
+    return run
+
+
+CASES = {'LocaleInfo': case_locale_info,
+         'Apt': case_apt,
+         'get_mirror_data': case_get_mirror_data,
+         'get_cleanup_candidates': case_cleanup_candidates,
+         'fill_partitions': case_fill_partitions,
+         'fill_treeview_cleanup': case_fill_treeview_cleanup,
+         'fill_treeview_locale': case_fill_treeview_locale,
+         'fill_treeview_mirrors': case_fill_treeview_mirrors}
+
+
+# ===============================================
+# Run and compare
+# ===============================================
+
+def load_baseline(path):
+    if not exists(path):
+        return {}
+    with open(file=path, mode='r', encoding='utf-8') as fle:
+        return json.load(fle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark against fixture sysroots")
+    parser.add_argument('--sizes', default='10,100,1000', help="Comma separated data sizes.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per case (median is reported).")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Report a regression when a case is this much slower than the baseline.")
+    parser.add_argument('--save', action='store_true', help=f"Store the results as baseline in {BASELINE}.")
+    parser.add_argument('--case', action='append', choices=list(CASES), help="Run only this case.")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    tmp_dir = tempfile.mkdtemp(prefix='solydxk-bench-')
+    # Import the modules from a copy: get_mirror_data writes next to apt_sources.py
+    shutil.copytree(SYSTEM_DIR, join(tmp_dir, 'system'), ignore=shutil.ignore_patterns('__pycache__'))
+    sys.path.insert(0, join(tmp_dir, 'system'))
+    # Command output of the modules is not part of the report
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+
+    baseline = load_baseline(BASELINE)
+    results = {}
+    regressions = []
+    try:
+        print(f"{'case':<24}{'size':>6}{'median (ms)':>14}{'baseline':>12}", file=stdout)
+        for size in sizes:
+            root = join(tmp_dir, f"sysroot-{size}")
+            data = create_sysroot(root, size)
+            for name in args.case or CASES:
+                key = f"{name}/{size}"
+                try:
+                    run = CASES[name](root, data)
+                    times = timeit.repeat(run, number=1, repeat=args.repeat)
+                except SkipCase as detail:
+                    print(f"{name:<24}{size:>6}{'skipped':>14}  {detail}", file=stdout)
+                    continue
+                median = statistics.median(times) * 1000
+                results[key] = round(median, 3)
+                reference = baseline.get(key)
+                flag = ''
+                if reference and median > reference * (1 + args.threshold):
+                    flag = f"  REGRESSION +{(median / reference - 1) * 100:.0f}%"
+                    regressions.append(key)
+                reference = f"{reference:.1f}" if reference else '-'
+                print(f"{name:<24}{size:>6}{median:>14.1f}{reference:>12}{flag}", file=stdout)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        if isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+    if args.save:
+        baseline.update(results)
+        with open(file=BASELINE, mode='w', encoding='utf-8') as fle:
+            json.dump(baseline, fle, indent=2, sort_keys=True)
+            fle.write('\n')
+        print(f"Baseline saved: {BASELINE}")
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
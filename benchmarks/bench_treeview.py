@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+""" Benchmark: fill a treeview with 10k rows, eval based (old) and typed (new)
+
+The legacy function is a condensed copy of the old row loop of
+TreeViewHandler.fillTreeview: it builds and evals a Python string per row,
+decodes the icon for each row and logs every row.
+
+Usage: python3 benchmarks/bench_treeview.py [nr_rows] [repeat]
+Needs a display (Gtk).
+"""
+
+import sys
+import timeit
+from os.path import join, abspath, dirname, isfile
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, join(ROOT, 'usr/lib/solydxk/system'))
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+from treeview import TreeViewHandler
+from imagecache import IMAGE_CACHE
+
+ICONS = [join(ROOT, 'usr/share/solydxk/system/icons', icon) for icon in
+         ('encrypted.png', 'unencrypted.png', 'encrypted-usb.png', 'unencrypted-usb.png')]
+COLUMN_TYPES = ['GdkPixbuf.Pixbuf', 'bool', 'str', 'str']
+
+
+class NullLog():
+    def write(self, *args, **kwargs):
+        pass
+
+
+def create_rows(nr_rows):
+    return [[ICONS[i % 4], i % 2 == 0, f"/dev/sd{i}", f'Label "{i}"'] for i in range(nr_rows)]
+
+
+def legacy_fill(treeview, rows, log):
+    """ Old eval based list store creation """
+    liststore = eval('Gtk.ListStore(' + ', '.join(COLUMN_TYPES) + ', int, int)')
+    for row in rows:
+        dyn_append = 'liststore.append(['
+        for j, val in enumerate(row):
+            val = str(val).strip()
+            if COLUMN_TYPES[j] == 'str':
+                val = '"' + val.replace('\n', ' ').replace('\r', '').replace('"', '\\"') + '"'
+            if COLUMN_TYPES[j] == 'GdkPixbuf.Pixbuf':
+                val = f'GdkPixbuf.Pixbuf.new_from_file("{val}")' if isfile(val) else None
+            dyn_append += f'{val}, '
+        dyn_append += '400, 10000])'
+        log.write(f"Add data to list store: {dyn_append}", 'fillTreeview', 'debug')
+        eval(dyn_append)
+    treeview.set_model(liststore)
+
+
+def typed_fill(handler, rows):
+    """ New typed fill with a shared pixbuf cache """
+    handler.fillTreeview(contentList=rows, columnTypesList=COLUMN_TYPES, setCursor=-1)
+
+
+def main():
+    if not Gtk.init_check(sys.argv)[0]:
+        print("No display available")
+        sys.exit(1)
+    nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    rows = create_rows(nr_rows)
+    log = NullLog()
+    treeview = Gtk.TreeView()
+    handler = TreeViewHandler(Gtk.TreeView(), log)
+
+    legacy = min(timeit.repeat(lambda: legacy_fill(treeview, rows, log), number=1, repeat=repeat))
+    IMAGE_CACHE.clear()
+    typed_cold = timeit.timeit(lambda: typed_fill(handler, rows), number=1)
+    typed = min(timeit.repeat(lambda: typed_fill(handler, rows), number=1, repeat=repeat))
+    assert len(handler.getModel()) == len(treeview.get_model()) == nr_rows
+
+    print(f"{nr_rows} rows, best of {repeat}")
+    print(f"legacy (eval):      {legacy * 1000:9.1f} ms")
+    print(f"typed (cold cache): {typed_cold * 1000:9.1f} ms")
+    print(f"typed:              {typed * 1000:9.1f} ms ({legacy / typed:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+""" Benchmark: module import time measured with python -X importtime
+
+Each module is imported in a fresh interpreter. Reports the cumulative import time
+(best of repeat), the slowest imported modules and checks that importing does not
+load the heavy modules (python-apt, aptsources, UDisks, GdkPixbuf) or start processes:
+those are loaded and run on first use.
+Modules that cannot be imported here (e.g. no PyGObject) are skipped.
+
+Usage: python3 benchmarks/importtime.py [repeat] [module ...]
+"""
+
+import os
+import sys
+import subprocess
+from os.path import join, abspath, dirname
+
+BENCH_DIR = dirname(abspath(__file__))
+SYSTEM_DIR = join(dirname(BENCH_DIR), 'usr/lib/solydxk/system')
+MODULES = ['utils', 'apt_sources', 'cleanup', 'hardware', 'udisks2', 'localize',
+           'plymouth', 'fstab', 'adjust', 'cli', 'solydxk_system', 'main']
+# Loaded on first use only
+HEAVY_MODULES = ['apt', 'aptsources', 'gi.repository.UDisks', 'gi.repository.GdkPixbuf']
+# Modules that must not load Gtk
+NO_GTK = ['utils', 'apt_sources', 'cleanup', 'hardware', 'udisks2', 'localize',
+          'plymouth', 'fstab', 'adjust', 'cli', 'logger']
+
+# Fail on any process started while importing
+IMPORT_CODE = """
+import sys, subprocess
+def no_process(*args, **kwargs):
+    raise RuntimeError(f"process started at import: {args[1] if len(args) > 1 else kwargs.get('args')}")
+subprocess.Popen.__init__ = no_process
+import {module}
+print(' '.join(sorted(sys.modules)))
+"""
+
+
+def import_module(module):
+    """ Return (cumulative us, [(self us, name)], loaded modules) or raise RuntimeError """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_CODE.replace('{module}', module)],
+                             cwd=SYSTEM_DIR, capture_output=True, text=True,
+                             env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'))
+    times = []
+    cumulative = 0
+    errors = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            errors.append(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            # Header line
+            continue
+        name = fields[2].strip()
+        times.append((self_us, name))
+        if name == module:
+            cumulative = cumulative_us
+    if process.returncode != 0:
+        raise RuntimeError(errors[-1] if errors else f"returned {process.returncode}")
+    return cumulative, times, set(process.stdout.split())
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    modules = sys.argv[2:] or MODULES
+    failed = False
+    print(f"{'module':<16}{'import (ms)':>12}  slowest imports")
+    for module in modules:
+        try:
+            results = [import_module(module) for i in range(repeat)]
+        except RuntimeError as detail:
+            if 'process started' in str(detail):
+                print(f"{module:<16}{'FAIL':>12}  {detail}")
+                failed = True
+            else:
+                print(f"{module:<16}{'skipped':>12}  {detail}")
+            continue
+        cumulative, times, loaded = min(results, key=lambda result: result[0])
+        slowest = ', '.join(f"{name} {self_us / 1000:.1f}" for self_us, name in sorted(times, reverse=True)[:3])
+        print(f"{module:<16}{cumulative / 1000:>12.1f}  {slowest}")
+
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        if module in NO_GTK and 'gi.repository.Gtk' in loaded:
+            heavy.append('gi.repository.Gtk')
+        if heavy:
+            print(f"{'':<16}{'FAIL':>12}  loaded at import: {', '.join(heavy)}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,8 +7,7 @@
 # New supported cards (GCN): https://en.wikipedia.org/wiki/Graphics_Core_Next
 # ==============================================
 
-# URL to lkddb files
-LKDDB="https://downloads.solydxk.com/lkddb"
+# lkddb files: the amdgpu card ID list is downloaded by hardware.py (AMD_ID_URL)
 # KV=$(uname -r)
 # KV=${KV%.*}
 # URL="https://downloads.solydxk.com/lkddb/lkddb-$KV.list"
@@ -16,14 +15,8 @@ LKDDB="https://downloads.solydxk.com/lkddb"
 # AMDGPU=$(grep -oP '(?<=1002\s)[a-z0-9]*(?=\s.*CONFIG_DRM_AMDGPU)' lkddb.list)
 # AMDRAD=$(grep -oP '(?<=1002\s)[a-z0-9]*(?=\s.*CONFIG_DRM_RADEON)' lkddb.list)
 
-# AMDGPU supported code names
-GCN1='Oland Cape Pitcairn Tahiti Hainan Curacao Trinidad Iceland Topaz Opal Venus Neptune'
-GCN2='Bonaire Hawaii Samoa Tobago Malta Zealand Vesuvius Saturn Grenada Temash Kabini Kaveri Godavari Beema Mullins Carrizo-L'
-GCN3='Tonga Fiji Antigua Carrizo Bristol Stoney Amethyst'
-GCN4='Polaris Lexa Baffin Ellesmere Neo Scorpio'
-GCN5='Vega Greenland Instinct Raven'
-NGM='Navi'
-SUPPORTEDCARDS="$GCN1 $GCN2 $GCN3 $GCN4 $GCN5 $NGM"
+# AMDGPU supported code names and device ids: /usr/lib/solydxk/system/hardware.py
+HARDWARE='/usr/lib/solydxk/system/hardware.py'
 
 # Default value to use backports
 BACKPORTS=false
@@ -61,16 +54,9 @@ SHOW=false
 # ==============================================
 
 # Log file for traceback
-MAX_SIZE_KB=5120
-LOG_SIZE_KB=0
 LOG=/var/log/solydxk-system.log
-LOG2=/var/log/solydxk-system.log.1
-if [ -f $LOG ]; then
-  LOG_SIZE_KB=$(($(stat -c%s $LOG) / 1024))
-  if [ $LOG_SIZE_KB -gt $MAX_SIZE_KB ]; then
-    mv -f $LOG $LOG2
-  fi
-fi
+# Shared rotation with solydxk-system (gzip compressed generations)
+python3 /usr/lib/solydxk/system/loghandlers.py $LOG 2>/dev/null
 
 # ==============================================
 
@@ -192,53 +178,16 @@ fi
 # Default to old packages
 PCKS=$OLDAMD
 
-# Check on device id
-CODENAME=$(lsb_release -cs)
-FILENAME="${CODENAME}_amdgpu.txt"
-SAVEPATH="/tmp/$FILENAME"
-# Download ID list from server if not already downloaded
-if [ ! -f "$SAVEPATH" ]; then
-    URL="$LKDDB/$FILENAME"
-    echo "[AMD] Download card ID list from $URL." | tee -a $LOG 2>/dev/null
-    wget -q -O "$SAVEPATH.0" "$URL"
-    if [ -f "$SAVEPATH.0" ]; then
-        # Check that file is not empty
-        if [ -s "$SAVEPATH.0" ]; then
-            mv -f "$SAVEPATH.0" "$SAVEPATH"
-        fi
-    fi
-fi
-# Save the IDs in a variable
-if [ -f "$SAVEPATH" ]; then
-    SUPPORTEDIDS=$(cat $SAVEPATH)
-fi
-# Check if card ID is found in ID list
-CARDFOUND=false
-if [ "$SUPPORTEDIDS" != '' ]; then
-    DEVICEID=$(echo "$HWCARD" | grep -oP '(?<=:)[a-z0-9]*(?=\])')
-    for SID in $SUPPORTEDIDS; do
-        if [ "$SID" == "$DEVICEID" ]; then
-            echo "[AMD] Card ID $DEVICEID found in $SAVEPATH." | tee -a $LOG 2>/dev/null
-            PCKS=$NEWAMD
-            CARDFOUND=true
-            break
-        fi
-    done
+# Look up the packages in the driver support database (/usr/share/solydxk/system/drivers.list)
+# Falls back to the amdgpu card ID list (downloaded once per boot) and the AMDGPU supported code names
+HWARGS='-p'
+if $TEST; then
+  HWARGS='-t -p'
 fi
-
-# Could not find card in ID list: fall back to card names
-if ! $CARDFOUND; then
-    # Turn on a case-insensitive matching
-    shopt -s nocasematch
-    for SCARD in $SUPPORTEDCARDS; do
-        if [[ "$HWCARD" =~ "$SCARD" ]]; then
-            echo "[AMD] Card name $SCARD found in $HWCARD." | tee -a $LOG 2>/dev/null
-            PCKS=$NEWAMD
-            break
-        fi
-    done
-    # Turn off a case-insensitive matching
-    shopt -u nocasematch
+HWPCKS=$(python3 $HARDWARE $HWARGS amd | head -n 1)
+if [ "$HWPCKS" != '' ]; then
+  echo "[AMD] Packages for $HWCARD: $HWPCKS." | tee -a $LOG 2>/dev/null
+  PCKS=$HWPCKS
 fi
 
 # Show supported hardware only (include drivers)
@@ -7,12 +7,8 @@
 # Last update: 04-09-2017
 # ==============================================
 
-# Broadcom hardware list (device ids)
-B43='|4307|4311|4312|4315|4318|4319|4320|4321|4322|4324|4328|4329|432b|432c|4331|4350|4353|4357|4358|4359|43a9|43aa|a8d8|a8db|'
-B43LEGACY='|4301|4306|4325|'
-WLDEBIAN='|0576|4313|432a|432d|4365|43a0|43b1|435a|4727|a8d6|a99d|'
-BRCMDEBIAN=''
-UNKNOWN='|4360|'
+# Supported device ids and their packages: /usr/share/solydxk/system/drivers.list
+HARDWARE='/usr/lib/solydxk/system/hardware.py'
 
 # Default value to use backports
 BACKPORTS=false
@@ -31,16 +27,9 @@ SHOW=false
 # ==============================================
 
 # Log file for traceback
-MAX_SIZE_KB=5120
-LOG_SIZE_KB=0
 LOG=/var/log/solydxk-system.log
-LOG2=/var/log/solydxk-system.log.1
-if [ -f $LOG ]; then
-  LOG_SIZE_KB=$(ls -s $LOG | awk '{print $1}')
-  if [ $LOG_SIZE_KB -gt $MAX_SIZE_KB ]; then
-    mv -f $LOG $LOG2
-  fi
-fi
+# Shared rotation with solydxk-system (gzip compressed generations)
+python3 /usr/lib/solydxk/system/loghandlers.py $LOG 2>/dev/null
 
 # ==============================================
 
@@ -165,21 +154,29 @@ fi
 if ! $TEST && ! $SHOW; then
   apt-get update
 fi
+HWARGS=''
+if $TEST; then
+  HWARGS='-t'
+fi
+# Detect once: name [vendor:device] [packages] per supported device
+HWPCKS=$(python3 $HARDWARE $HWARGS broadcom)
 for DID in $DEVICEIDS; do
-  if [[ "$B43" =~ "|$DID|" ]] ; then
-    PCKS='firmware-b43-installer'
-    MODPROBE='b43'
-  elif [[ "$B43LEGACY" =~ "|$DID|" ]] ; then
-    PCKS='firmware-b43legacy-installer'
-    MODPROBE='b43legacy'
-  elif [[ "$WLDEBIAN" =~ "|$DID|" ]] ; then
-    PCKS='broadcom-sta-dkms'
-    BLACKLIST='blacklist b43 brcmsmac bcma ssb'
-    MODPROBE='wl'
-  elif [[ "$BRCMDEBIAN" =~ "|$DID|" ]] ; then
-    PCKS='firmware-brcm80211'
-    MODPROBE='brcmsmac'
-  fi
+  PCKS=$(echo "$HWPCKS" | grep -i ":$DID\]" | head -n 1 | sed -n 's/.*\[\([^]]*\)\]$/\1/p')
+  case $PCKS in
+    firmware-b43-installer)
+      MODPROBE='b43'
+      ;;
+    firmware-b43legacy-installer)
+      MODPROBE='b43legacy'
+      ;;
+    broadcom-sta-dkms)
+      BLACKLIST='blacklist b43 brcmsmac bcma ssb'
+      MODPROBE='wl'
+      ;;
+    firmware-brcm80211)
+      MODPROBE='brcmsmac'
+      ;;
+  esac
   
   # Show supported hardware only
   if [ "$HWCARDS" != '' ] && $SHOW; then
@@ -25,16 +25,9 @@ SHOW=false
 # ==============================================
 
 # Log file for traceback
-MAX_SIZE_KB=5120
-LOG_SIZE_KB=0
 LOG=/var/log/solydxk-system.log
-LOG2=/var/log/solydxk-system.log.1
-if [ -f $LOG ]; then
-  LOG_SIZE_KB=$(ls -s $LOG | awk '{print $1}')
-  if [ $LOG_SIZE_KB -gt $MAX_SIZE_KB ]; then
-    mv -f $LOG $LOG2
-  fi
-fi
+# Shared rotation with solydxk-system (gzip compressed generations)
+python3 /usr/lib/solydxk/system/loghandlers.py $LOG 2>/dev/null
 
 # ==============================================
 
@@ -3,12 +3,9 @@
 
 import os
 from os.path import exists, dirname, isdir
-from utils import get_apt_force, is_package_installed, \
+from utils import get_apt_force, get_apt_cache, \
                   get_apt_cache_locked_program, get_debian_version
 
-# --force-yes is deprecated in stretch
-APT_FORCE = get_apt_force()
-
 # Fix some programs:
 # [package, what to fix, options(1), exec from debian version(2)
 # (1): touch/mkdir/purge/install|owner:group|permissions
@@ -28,47 +25,59 @@ fix_progs = [['login', '/var/log/btmp', 'touch|root:utmp|600', 0],
              ['usbguard', '/etc/usbguard/rules.conf', 'touch|root:root|600', 0],
              ['ntpsec', '/var/log/ntpsec', 'mkdir|ntpsec:ntpsec|755', 0]]
 
-try:
-    ver = get_debian_version()
-    for prog in fix_progs:
-        if ver >= prog[3] or prog[3] == 0:
-            if is_package_installed(prog[0]):
-                options = prog[2].split('|')
-                if options[0] == 'purge' or options[0] == 'install':
-                    if not get_apt_cache_locked_program():
+
+def fix_programs():
+    """ Create missing log files and directories of installed programs """
+    try:
+        # --force-yes is deprecated in stretch
+        apt_force = get_apt_force()
+        # One apt cache for all programs
+        cache = get_apt_cache()
+        ver = get_debian_version()
+        for prog in fix_progs:
+            if ver >= prog[3] or prog[3] == 0:
+                if prog[0] in cache and cache[prog[0]].is_installed:
+                    options = prog[2].split('|')
+                    if options[0] == 'purge' or options[0] == 'install':
+                        if not get_apt_cache_locked_program():
+                            os.system(
+                                f"apt-get {options[0]} {apt_force} {prog[1]}")
+                    elif options[0] == 'touch' and not exists(prog[1]):
+                        dir_name = dirname(prog[1])
+                        if not isdir(dir_name):
+                            os.system(
+                                f"mkdir -p {dir_name}; chown {options[1]} {dir_name}; chmod {options[2]} {dir_name}")
                         os.system(
-                            f"apt-get {options[0]} {APT_FORCE} {prog[1]}")
-                elif options[0] == 'touch' and not exists(prog[1]):
-                    dir_name = dirname(prog[1])
-                    if not isdir(dir_name):
+                            f"touch {prog[1]}; chown {options[1]} {prog[1]}; chmod  {options[2]} {prog[1]}")
+                    elif options[0] == 'mkdir' and not isdir(prog[1]):
                         os.system(
-                            f"mkdir -p {dir_name}; chown {options[1]} {dir_name}; chmod {options[2]} {dir_name}")
-                    os.system(
-                        f"touch {prog[1]}; chown {options[1]} {prog[1]}; chmod  {options[2]} {prog[1]}")
-                elif options[0] == 'mkdir' and not isdir(prog[1]):
-                    os.system(
-                        f"mkdir -p {prog[1]}; chown {options[1]} {prog[1]}; chmod {options[2]} {prog[1]}")
-except Exception as detail:
-    print(detail)
-
-def get_info_line(par_name):
+                            f"mkdir -p {prog[1]}; chown {options[1]} {prog[1]}; chmod {options[2]} {prog[1]}")
+    except Exception as detail:
+        print(detail)
+
+
+def get_info_line(info, par_name):
     """ Return the info per line """
     matches = [match for match in info if par_name in match]
     return '' if not matches else matches[0]
 
-if exists('/usr/share/solydxk/info'):
+
+def restore_info():
+    """ Restore the LSB, os-release and issue files from the SolydXK info file """
+    if not exists('/usr/share/solydxk/info'):
+        return
+
     with open(file='/usr/share/solydxk/info', mode='r', encoding='utf-8') as f:
         info = f.readlines()
 
-    codename = get_info_line("CODENAME")
-    edition = get_info_line("EDITION")
-    release = get_info_line("RELEASE")
-    distrib_id = get_info_line("DISTRIB_ID")
-    description = get_info_line("DESCRIPTION")
-    pretty_name = get_info_line("PRETTY_NAME")
-    home_url = get_info_line("HOME_URL")
-    support_url = get_info_line("SUPPORT_URL")
-    bug_report_url = get_info_line("BUG_REPORT_URL")
+    codename = get_info_line(info, "CODENAME")
+    release = get_info_line(info, "RELEASE")
+    distrib_id = get_info_line(info, "DISTRIB_ID")
+    description = get_info_line(info, "DESCRIPTION")
+    pretty_name = get_info_line(info, "PRETTY_NAME")
+    home_url = get_info_line(info, "HOME_URL")
+    support_url = get_info_line(info, "SUPPORT_URL")
+    bug_report_url = get_info_line(info, "BUG_REPORT_URL")
 
     try:
         # Restore LSB information
@@ -103,3 +112,12 @@ if exists('/usr/share/solydxk/info'):
             f.writelines(issue)
     except Exception as detail:
         print(detail)
+
+
+def main():
+    fix_programs()
+    restore_info()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,78 @@
 #!/usr/bin/env python3
 """Classes to handle apt:
-    FilteredSourcesList: Used by Apt class - creates a list with debian and solydxk source entries.
+    filtered_sources_list: Used by Apt class - creates a list with debian and solydxk source entries.
     Apt: main apt class
+
+aptsources and the apt cache are only loaded when the sources are first read.
 """
 
 import re
 from copy import deepcopy
 from os.path import join, abspath, dirname, exists, basename
 from utils import get_config_dict, get_value_from_url, getoutput, \
-                  get_installed_file_path, validate_package_version
-
-# https://apt-team.pages.debian.net/python-apt/library/aptsources.sourceslist.html
-from aptsources.sourceslist import SourcesList, SourceEntry
-# Deb822SourceEntry is only available on systems that already support the deb822 .sources format
-try:
-    from aptsources.sourceslist import Deb822SourceEntry
-    # python-apt can be ready for deb822, but apt not
-    DEB822 = validate_package_version(package_name='apt', min_package_version='2.9.29')
-except ImportError:
-    DEB822 = False
-
-# Get all supported architectures
-# Used as default if no architectures are provided
-def __list_supported_architectures():
-    arch = getoutput(command='dpkg --print-architecture')
-    arch += getoutput(command='dpkg --print-foreign-architectures')
-    return arch
-SUPPORTED_ARCHS = __list_supported_architectures()
-
-
-class FilteredSourcesList(SourcesList):
-    """Filtered SourcesList: only allow debian and solydxk sources"""
-    def __init__(self):
-        SourcesList.__init__(self)
-        self.__include_repos = ['debian', 'solydxk']
-        self.list = self.__filtered_sources_list()
-
-    def __filtered_sources_list(self):
-        filtered_list = []
-        sources_list = SourcesList(deb822=DEB822).list
-        for source_entry in sources_list:
-            # SourcesList appears to return empty lines and comments as well
-            if source_entry.type not in ['deb', 'deb-src']:
-                continue
+                  get_installed_file_path, validate_package_version, traced, \
+                  get_root, root_path
 
-            # Only save repos that are listed in self.include_repos
-            if not any(x in source_entry.uri for x in self.__include_repos):
-                continue
+# Keyed on the configured root (see utils.set_root)
+_DEB822 = {}
+_SUPPORTED_ARCHS = {}
 
-            # If not provided, set the supported architectures
-            if not source_entry.architectures:
-                source_entry.architectures = SUPPORTED_ARCHS
 
-            filtered_list.append(source_entry)
-        return filtered_list
+def has_deb822():
+    """ Checked once: deb822 .sources support in python-apt and apt """
+    root = get_root()
+    if root not in _DEB822:
+        # https://apt-team.pages.debian.net/python-apt/library/aptsources.sourceslist.html
+        # Deb822SourceEntry is only available on systems that already support the deb822 .sources format
+        try:
+            from aptsources import sourceslist
+        except ImportError:
+            sourceslist = None
+        if hasattr(sourceslist, 'Deb822SourceEntry'):
+            # python-apt can be ready for deb822, but apt not
+            _DEB822[root] = validate_package_version(package_name='apt', min_package_version='2.9.29')
+        else:
+            _DEB822[root] = False
+    return _DEB822[root]
+
+
+def supported_architectures():
+    """ Listed once: all supported architectures
+        Used as default if no architectures are provided """
+    root = get_root()
+    if root not in _SUPPORTED_ARCHS:
+        dpkg = f"dpkg --root='{root}'"
+        _SUPPORTED_ARCHS[root] = getoutput(command=f'{dpkg} --print-architecture')
+        _SUPPORTED_ARCHS[root] += getoutput(command=f'{dpkg} --print-foreign-architectures')
+    return _SUPPORTED_ARCHS[root]
+
+
+def filtered_sources_list():
+    """ Return SourcesList with only the debian and solydxk sources in its list """
+    import apt_pkg
+    from aptsources.sourceslist import SourcesList
+    include_repos = ['debian', 'solydxk']
+    if get_root() != '/':
+        # Read the sources of the configured root (aptsources initialized apt_pkg)
+        apt_pkg.config.set('Dir', get_root())
+    sources_list = SourcesList(deb822=has_deb822())
+    filtered_list = []
+    for source_entry in sources_list.list:
+        # SourcesList appears to return empty lines and comments as well
+        if source_entry.type not in ['deb', 'deb-src']:
+            continue
+
+        # Only save repos that are listed in include_repos
+        if not any(x in source_entry.uri for x in include_repos):
+            continue
+
+        # If not provided, set the supported architectures
+        if not source_entry.architectures:
+            source_entry.architectures = supported_architectures()
+
+        filtered_list.append(source_entry)
+    sources_list.list = filtered_list
+    return sources_list
 
 class Apt():
     """Apt class"""
@@ -81,7 +100,7 @@ class Apt():
             list[dict]: [{source, signed-by}]
         """
         apt_sources = []
-        sources_list = FilteredSourcesList().list
+        sources_list = filtered_sources_list().list
 
         for source_entry in sources_list:
             # Save source_entry in dict and add signed-by which is not in source_entry
@@ -122,7 +141,7 @@ class Apt():
         match = re.search(pattern=r'signed-by[=:\s]+([^\]\n]+)', string=line, flags=re.IGNORECASE)
         if match:
             # Keyring can be moved: check if it still exists
-            if exists(match.group(1)):
+            if exists(root_path(match.group(1))):
                 keyring = match.group(1)
 
         # Keyring not found: check if installed on system
@@ -162,7 +181,7 @@ class Apt():
         # Create the options string
         options = ''
         if not architectures:
-            architectures = SUPPORTED_ARCHS
+            architectures = supported_architectures()
         if architectures:
             options = f"arch={','.join(architectures)}"
         if options:
@@ -198,7 +217,7 @@ class Apt():
             str: deb822 section for the repo
         """
         if not architectures:
-            architectures = SUPPORTED_ARCHS
+            architectures = supported_architectures()
         if not signed_by:
             signed_by = self.__get_signed_by(uri)
 
@@ -242,7 +261,7 @@ class Apt():
                  in code to save the original state of the source_entry object when updated.
         """
         # Check current used system
-        sources_list = FilteredSourcesList().list
+        sources_list = filtered_sources_list().list
         for source_entry in sources_list:
             #deb822_instance = isinstance(source_entry, Deb822SourceEntry)
             if not file and \
@@ -250,7 +269,7 @@ class Apt():
                ('solydxk' in source_entry.uri and 'solydxk' in uri)):
                 file=source_entry.file
 
-        if DEB822:
+        if has_deb822():
             # Get the deb822 section string
             source_section = self.deb822_section(types=types,
                                                  uri=uri,
@@ -260,6 +279,7 @@ class Apt():
                                                  signed_by=signed_by,
                                                  disabled=disabled,
                                                  comment=comment)
+            from aptsources.sourceslist import Deb822SourceEntry
             new_source_entry = Deb822SourceEntry(section=source_section, file=file)
         else:
             source_line = self.source_line(types=types,
@@ -268,6 +288,7 @@ class Apt():
                                            comps=comps,
                                            architectures=architectures,
                                            disabled=disabled)
+            from aptsources.sourceslist import SourceEntry
             new_source_entry = SourceEntry(line=source_line, file=file)
 
         new_entry = {
@@ -286,8 +307,8 @@ class Apt():
         Args:
             sources_list (list[dict]): Saves list returned by get_apt_sources
         """
-        filtered_sources_list = FilteredSourcesList()
-        sources_list = filtered_sources_list.list
+        sources = filtered_sources_list()
+        sources_list = sources.list
 
         for new_source in new_sources_list:
             # Check first if this is an update
@@ -312,10 +333,10 @@ class Apt():
                 sources_list.append(new_source['source-entry'])
 
         # Set the filtered sources list with the new list
-        filtered_sources_list.list = sources_list
+        sources.list = sources_list
         # Backup and save
-        filtered_sources_list.backup(backup_ext='.bak')
-        filtered_sources_list.save()
+        sources.backup(backup_ext='.bak')
+        sources.save()
         # Save the new sources
         self.__apt_sources = self.__save_apt_sources()
 
@@ -362,7 +383,7 @@ class Apt():
 
         # Just setting the uri property does not change the line.
         # You need to change it manually to actually save that line to sources.list
-        if not DEB822:
+        if not has_deb822():
             apt_source['source-entry'].line = apt_source['source-entry'].line.replace(
                 apt_source['org-entry'].uri, uri)
 
@@ -380,7 +401,7 @@ class Apt():
 
         # Just setting the disabled property does not change the line.
         # You need to change it manually to actually save that line to sources.list
-        if not DEB822:
+        if not has_deb822():
             line = apt_source['source-entry'].line
             if disabled:
                 if not line.startswith('#'):
@@ -408,6 +429,63 @@ class Apt():
                 backports.append(apt_source)
         return backports
 
+    def set_backports(self, enable, debian_name, debian_repo=''):
+        """Enable (or add) or disable the backports repo of the debian repo
+
+        Args:
+            enable (bool): enable or disable backports
+            debian_name (str): debian release name, e.g. bookworm
+            debian_repo (str, optional): current debian repo uri.
+                                         Defaults to the first enabled debian.org repo.
+
+        Returns:
+            list[str]: uris of the changed backports repos
+        """
+        changed = []
+        backports_name = f"{debian_name}-backports"
+        if enable:
+            if not debian_repo:
+                for apt_source in self.get_apt_sources(include_repos=['debian.org'],
+                                                       exclude_suites=['backports', 'security']):
+                    if not apt_source['source-entry'].disabled:
+                        debian_repo = apt_source['source-entry'].uri
+                        break
+            # Check which regular repository is enabled
+            debian_domain = ''
+            match = re.search(r"([a-z0-9\.]+)debian\.org", debian_repo)
+            if match:
+                debian_domain = f"{match.group(1)}debian.org"
+            if not debian_name or not debian_domain:
+                return changed
+            backports = self.get_backports(exclude_disabled=False)
+            for backport_source in backports:
+                if debian_domain in backport_source['source-entry'].uri:
+                    if backport_source['source-entry'].disabled:
+                        # Enable disabled backports repo
+                        self.set_disable(apt_source=backport_source, disabled=False)
+                        self.save(backports)
+                        changed.append(backport_source['source-entry'].uri)
+                    return changed
+            # Add new backports repo
+            new_apt_source = self.new_apt_source(types=['deb'],
+                                                 uri=f"https://{debian_domain}/debian/",
+                                                 suites=[backports_name],
+                                                 comps=self.distro_comps['debian'])
+            backports.append(new_apt_source)
+            self.save(backports)
+            changed.append(new_apt_source['source-entry'].uri)
+        else:
+            # Comment the backports repository entry in sources.list
+            backports = self.get_backports()
+            for backport_source in backports:
+                if backports_name in backport_source['suites']:
+                    self.set_disable(apt_source=backport_source, disabled=True)
+                    changed.append(backport_source['source-entry'].uri)
+            if changed:
+                self.save(backports)
+        return changed
+
+    @traced
     def get_mirror_data(self, exclude_mirrors=None, get_dead_mirrors=False):
         """ Returns mirror data
 
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+""" Cleanup candidates: auto-removable packages, orphaned libraries and old kernels
+    computed in one pass over the python-apt cache """
+
+import re
+import os
+from utils import compare_package_versions, VersionComparison, get_apt_cache
+
+# Sections deborphan and aptitude (~slibs|~soldlibs|~sintrospection) look at
+ORPHAN_SECTIONS = ('libs', 'oldlibs', 'introspection')
+KERNEL_PATTERN = re.compile(r'^linux-(image|headers)-[0-9]')
+KERNEL_VERSION_PATTERN = re.compile(r'[0-9][0-9\.\-]+[0-9]')
+SKIP_KERNEL_PATTERN = re.compile(r'[a-z]-(486|586|686)')
+ARCHIVES_DIR = '/var/cache/apt/archives'
+
+
+def get_kernel_version(release=None):
+    """ Return the version part of the booted kernel release """
+    if release is None:
+        release = os.uname().release
+    match = KERNEL_VERSION_PATTERN.search(release)
+    return match.group(0) if match else ''
+
+
+def get_kbuild_version(kernel_version):
+    """ Return upstream version used by linux-kbuild (6.1.0-18 -> 6.1) """
+    kbuild_version = kernel_version.split('-')[0]
+    while kbuild_version.endswith('.0'):
+        kbuild_version = kbuild_version[:-2]
+    return kbuild_version
+
+
+def get_cleanup_candidates(exclude=None, cache=None, kernel_release=None):
+    """ Return list of dictionaries {package, reason, installed_size (KB), preselect}
+        reason: autoremove, orphan or kernel """
+    exclude = set(exclude or [])
+    if cache is None:
+        cache = get_apt_cache()
+
+    installed = [pkg for pkg in cache if pkg.is_installed]
+
+    # Names (and virtual names) that installed packages depend on
+    required = set()
+    for pkg in installed:
+        for dependency in pkg.installed.get_dependencies('Depends', 'PreDepends'):
+            for base_dep in dependency.or_dependencies:
+                required.add(base_dep.name)
+
+    cur_version = get_kernel_version(kernel_release)
+    kbuild_version = get_kbuild_version(cur_version)
+
+    autoremove = []
+    orphans = []
+    kernels = []
+    kbuilds = []
+    for pkg in installed:
+        if pkg.name in exclude or pkg.shortname in exclude:
+            continue
+        version = pkg.installed
+        if pkg.is_auto_removable:
+            autoremove.append(pkg)
+        elif version.section.split('/')[-1] in ORPHAN_SECTIONS:
+            if pkg.shortname not in required \
+               and not any(provide in required for provide in version.provides):
+                orphans.append(pkg)
+        elif KERNEL_PATTERN.match(pkg.shortname):
+            if cur_version in pkg.shortname or SKIP_KERNEL_PATTERN.search(pkg.shortname):
+                continue
+            match = KERNEL_VERSION_PATTERN.search(pkg.shortname)
+            if match and compare_package_versions(match.group(0), cur_version) == VersionComparison.SMALLER:
+                kernels.append(pkg)
+        elif pkg.shortname.startswith('linux-kbuild') and kbuild_version not in pkg.shortname:
+            kbuilds.append(pkg)
+
+    # Only remove kbuild packages together with old kernels
+    if kernels:
+        kernels.extend(kbuilds)
+
+    candidates = []
+    seen = set()
+    for reason, packages in (('autoremove', autoremove), ('orphan', orphans), ('kernel', kernels)):
+        for pkg in sorted(packages, key=lambda x: x.name):
+            if pkg.name in seen:
+                continue
+            seen.add(pkg.name)
+            candidates.append({'package': pkg.name,
+                               'reason': reason,
+                               'installed_size': pkg.installed.installed_size // 1024,
+                               'preselect': reason == 'autoremove'})
+    return candidates
+
+
+def get_archives_size(archives_dir=ARCHIVES_DIR):
+    """ Return the size (KB) of the downloaded packages apt-get clean removes """
+    size = 0
+    try:
+        with os.scandir(archives_dir) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and entry.name.endswith('.deb'):
+                    size += entry.stat(follow_symlinks=False).st_size
+                elif entry.is_dir(follow_symlinks=False) and entry.name == 'partial':
+                    size += get_archives_size(entry.path) * 1024
+    except OSError:
+        pass
+    return size // 1024
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3 -OO
+""" Headless SolydXK System: apply the System Settings from a JSON configuration file
+    without loading Gtk. The result is written as JSON to stdout.
+
+    solydxk-system-cli config.json
+    solydxk-system-cli --status
+    solydxk-system-cli --root /mnt/target config.json
+
+    Configuration (all sections are optional):
+    {
+        "backports": true,
+        "mirrors": {"http://deb.debian.org/debian": "https://ftp.nl.debian.org/debian"},
+        "holdback": {"hold": ["firefox-esr"], "unhold": []},
+        "cleanup": "all",
+        "drivers": {"install": ["nvidia"], "purge": [], "backports": false},
+        "fstab": {"add": ["/dev/sdb1"], "remove": []},
+        "passphrase": {"devices": {"/dev/sda5": "current passphrase"}, "new": "new passphrase"},
+        "locale": {"locales": ["en_US", "nl_NL"], "default": "nl_NL", "timezone": "Europe/Amsterdam"},
+        "splash": {"plymouth": "solydk-logo", "grub": "solydk-grub", "resolution": "1920x1080"}
+    }
+"""
+
+import os
+import sys
+import json
+import argparse
+from queue import Queue, Empty
+from os.path import join, abspath, dirname, basename, exists
+from utils import run_apt, run_apt_commands, get_apt_force, get_debian_name, \
+                  get_logged_user, has_internet_connection, shell_exec, \
+                  get_uuid, get_filesystem, get_label, DpkgSelections, MountSnapshot, \
+                  set_root, get_root, root_path, root_command
+from logger import Logger
+from loghandlers import get_log_config
+
+# Sections in the order they are applied
+SECTIONS = ['backports', 'mirrors', 'holdback', 'cleanup', 'drivers',
+            'fstab', 'passphrase', 'locale', 'splash']
+SCRIPT_DIR = abspath(dirname(__file__))
+LOG_FILE = '/var/log/solydxk-system.log'
+# Driver commands that act on the running kernel and services only
+LIVE_COMMANDS = ('modprobe', 'service')
+
+
+def get_timezone():
+    if exists(root_path('/etc/timezone')):
+        with open(root_path('/etc/timezone'), encoding='utf-8') as timezone_fle:
+            return timezone_fle.read().strip()
+    return ''
+
+
+def run_in_root(cmd, log):
+    """ Run a command in the configured root: skip live system commands when a root is set """
+    if get_root() != '/' and cmd.split()[0] in LIVE_COMMANDS:
+        log.write(f"Skipped in {get_root()}: {cmd}", 'run_in_root', 'info')
+        return
+    shell_exec(root_command(cmd))
+
+
+def apt_update(log):
+    """ Update the apt cache after changing the sources """
+    if not has_internet_connection():
+        raise RuntimeError("No internet connection: update the apt cache manually with: apt-get update")
+    returncode = run_apt(['update'], download_weight=1)
+    log.write(f"apt-get update returned: {returncode}", 'apt_update')
+    if returncode != 0:
+        raise RuntimeError(f"apt-get update returned {returncode}")
+
+
+def apply_backports(enable, log):
+    from apt_sources import Apt
+    changed = Apt().set_backports(bool(enable), get_debian_name())
+    for uri in changed:
+        log.write(f"{'Enable' if enable else 'Disable'} backports source: {uri}", 'apply_backports', 'info')
+    if changed:
+        apt_update(log)
+    return {'changed': bool(changed), 'sources': changed}
+
+
+def apply_mirrors(mirrors, log):
+    # mirrors: {current uri: new uri}
+    from apt_sources import Apt
+    apt_sources = Apt()
+    sources = apt_sources.get_apt_sources()
+    replaced = []
+    for old_uri, new_uri in mirrors.items():
+        for apt_source in sources:
+            if old_uri.rstrip('/') == apt_source['source-entry'].uri.rstrip('/'):
+                apt_sources.set_uri(apt_source=apt_source, uri=new_uri)
+                replaced.append(new_uri)
+                log.write(f"Replace mirror {old_uri} with {new_uri}", 'apply_mirrors', 'info')
+    if replaced:
+        apt_sources.save(new_sources_list=sources)
+        apt_update(log)
+    return {'changed': bool(replaced), 'sources': replaced}
+
+
+def apply_holdback(holdback, log):
+    selections = DpkgSelections()
+    held = selections.set_hold(holdback.get('hold', []), True)
+    released = selections.set_hold(holdback.get('unhold', []), False)
+    if held or released:
+        log.write(f"Hold back: {' '.join(held)} - remove hold back: {' '.join(released)}",
+                  'apply_holdback', 'info')
+    return {'changed': bool(held or released), 'hold': held, 'unhold': released}
+
+
+def apply_cleanup(packages, log):
+    # packages: "all" (the preselected candidates) or a list of candidates
+    from cleanup import get_cleanup_candidates
+    candidates = get_cleanup_candidates(exclude=DpkgSelections().hold)
+    if packages == 'all':
+        packages = [candidate['package'] for candidate in candidates if candidate['preselect']]
+    else:
+        names = {candidate['package'] for candidate in candidates}
+        packages = [package for package in packages if package in names]
+    commands = [['clean']]
+    if packages:
+        commands.insert(0, ['purge'] + get_apt_force().split() + packages)
+        log.write(f"Remove {len(packages)} packages: {' '.join(packages)}", 'apply_cleanup', 'info')
+    returncodes = run_apt_commands(commands)
+    if any(returncodes):
+        raise RuntimeError(f"apt-get returned {max(returncodes)}")
+    return {'changed': bool(packages), 'purged': packages}
+
+
+def apply_drivers(drivers, log):
+    # drivers: {install: [driver], purge: [driver], backports: bool}
+    from apt_sources import Apt
+    from hardware import detect_hardware, get_driver_changes
+    hardware = detect_hardware()
+    install = [hw for hw in hardware if hw['driver'] in drivers.get('install', []) and not hw['installed']]
+    purge = [hw for hw in hardware if hw['driver'] in drivers.get('purge', []) and hw['installed']]
+    if not install and not purge:
+        return {'changed': False}
+    if install and not has_internet_connection():
+        raise RuntimeError("No internet connection: cannot install the drivers")
+
+    use_backports = drivers.get('backports', False) \
+                    or any(hw['backports'] or 'backports' in ' '.join(hw['packages']) for hw in install)
+    backports = Apt().get_repo_suite('backports') if install and use_backports else ''
+    changes = get_driver_changes(install, purge, user=get_logged_user())
+    log.write(f"Driver changes: {changes}", 'apply_drivers', 'info')
+
+    env = dict(os.environ, DEBIAN_FRONTEND='noninteractive')
+    for selection in changes['debconf']:
+        run_in_root(f"echo '{selection}' | debconf-set-selections", log)
+    if changes['install']:
+        run_apt(['update'], download_weight=1, env=env)
+    for cmd in changes['pre']:
+        run_in_root(cmd, log)
+    arguments = ['install', '--purge'] + get_apt_force().split()
+    if backports:
+        arguments += ['-t', backports]
+    arguments += changes['install'] + [f'{package}-' for package in changes['purge']]
+    returncode = run_apt(arguments, env=env)
+    log.write(f"apt-get returned: {returncode}", 'apply_drivers')
+    if returncode != 0:
+        raise RuntimeError(f"apt-get returned {returncode}")
+    for cmd in changes['post']:
+        run_in_root(cmd, log)
+    return {'changed': True, 'install': changes['install'], 'purge': changes['purge']}
+
+
+def apply_fstab(fstab, log):
+    # fstab: {add: [device], remove: [device]} - unencrypted devices only
+    from fstab import FstabModel, save_models
+    fstab_path = root_path('/etc/fstab')
+    fstab_model = FstabModel(fstab_path)
+    added = []
+    removed = []
+    for device in fstab.get('add', []):
+        uuid = get_uuid(device)
+        fs_type = get_filesystem(device)
+        if not fs_type:
+            raise RuntimeError(f"Could not add {device} to {fstab_path}: missing fs type")
+        if fstab_model.find(uuid=uuid, device=device):
+            continue
+        label = get_label(device).strip()
+        mount = join('/media', label.replace(' ', '_') if label else basename(device))
+        if not exists(root_path(mount)):
+            os.makedirs(root_path(mount))
+        if get_root() == '/':
+            shell_exec(f'mount {device} {mount}')
+        fsck = 0 if fs_type in ('ntfs', 'swap', 'vfat') else 2
+        opts = 'defaults,noatime' if 'ext' in fs_type else 'sw' if fs_type == 'swap' else 'defaults'
+        entry = fstab_model.add(f'UUID={uuid}' if uuid else device, mount, fs_type, opts, 0, fsck)
+        log.write(f"Add new line to {fstab_path}: {' '.join(entry.fields())}", 'apply_fstab', 'info')
+        added.append(device)
+    for device in fstab.get('remove', []):
+        entry = fstab_model.find(uuid=get_uuid(device), device=device)
+        if entry:
+            fstab_model.remove(entry)
+            log.write(f"Remove device from {fstab_path}: {device}", 'apply_fstab', 'info')
+            removed.append(device)
+    errors = save_models([fstab_model])
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+    return {'changed': bool(added or removed), 'added': added, 'removed': removed}
+
+
+def apply_passphrase(passphrase, log):
+    # passphrase: {devices: {device: current passphrase}, new: new passphrase}
+    from fstab import CrypttabModel
+    from endecrypt_partitions import ChangePassphrase
+    new_passphrase = passphrase.get('new', '')
+    if not new_passphrase:
+        raise RuntimeError("No new passphrase given")
+    crypttab_model = CrypttabModel(root_path('/etc/crypttab'))
+    mounts = MountSnapshot()
+    partitions = []
+    errors = []
+    for device, current in passphrase.get('devices', {}).items():
+        if not current:
+            # No passphrase dialog in headless mode
+            errors.append(f"No current passphrase given for {device}")
+            continue
+        entry = crypttab_model.find(device)
+        # Remounted after the passphrase was changed
+        mount_points = mounts.get_mount_points(device) \
+                       or mounts.get_mount_points(join('/dev/mapper', basename(device)))
+        partitions.append({'device': device,
+                           'passphrase': current,
+                           'keyfile_path': entry.keyfile if entry else '',
+                           'mount_point': mount_points[0] if mount_points else ''})
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+    queue = Queue()
+    ChangePassphrase(partitions, new_passphrase, queue, log).run()
+    # Queue items: [fraction, error_code, partition_index, partition, message]
+    changed = []
+    while True:
+        try:
+            item = queue.get_nowait()
+        except Empty:
+            break
+        if item[1] > 0:
+            errors.append(item[4])
+        if item[3] is not None and item[3]['device'] not in changed:
+            changed.append(item[3]['device'])
+    if not errors:
+        # Devices that were skipped without an error
+        errors = [f"Passphrase not changed: {partition['device']}" for partition in partitions
+                  if partition['device'] not in changed]
+    if errors:
+        raise RuntimeError('\n'.join(errors + [f"Passphrase changed: {device}" for device in changed]))
+    return {'changed': bool(changed), 'devices': changed}
+
+
+def apply_locale(locale, log):
+    # locale: {locales: [locale], default: locale, timezone: continent/city}
+    from localize import Localize
+    if not has_internet_connection():
+        raise RuntimeError("No internet connection: cannot install the localization packages")
+    default = locale.get('default', '')
+    locales = [[True, loc, '', loc == default] for loc in locale.get('locales', [])]
+    timezone = locale.get('timezone') or get_timezone()
+    Localize(locales, timezone).run()
+    log.write(f"Localized: {' '.join(locale.get('locales', []))} ({timezone})", 'apply_locale', 'info')
+    return {'changed': True}
+
+
+def apply_splash(splash, log):
+    # splash: {plymouth: theme, grub: theme, resolution: WxH}
+    from plymouth import Plymouth, save_boot_splash
+    from lightdm import LightDM
+    plymouth = Plymouth(log)
+    plymouth_theme = splash.get('plymouth', plymouth.current_theme())
+    grub_theme = splash.get('grub', plymouth.grub.theme)
+    resolution = splash.get('resolution', plymouth.grub.resolution)
+    save_boot_splash(plymouth, LightDM(log), plymouth_theme, grub_theme, resolution)
+    return {'changed': True, 'plymouth': plymouth_theme, 'grub': grub_theme, 'resolution': resolution}
+
+
+def get_status():
+    """ Return the current settings for each section """
+    from apt_sources import Apt
+    from cleanup import get_cleanup_candidates
+    from hardware import detect_hardware
+    from plymouth import Plymouth
+    hold = sorted(DpkgSelections().hold)
+    plymouth = Plymouth()
+    return {'backports': bool(Apt().get_backports()),
+            'holdback': hold,
+            'cleanup': [candidate['package'] for candidate in get_cleanup_candidates(exclude=hold)],
+            'drivers': [{'driver': hw['driver'], 'name': hw['name'], 'installed': hw['installed']}
+                        for hw in detect_hardware()],
+            'locale': {'default': os.environ.get('LANG', ''), 'timezone': get_timezone()},
+            'splash': {'plymouth': plymouth.current_theme(), 'grub': plymouth.grub.theme,
+                       'resolution': plymouth.grub.resolution}}
+
+
+def apply_config(config, log):
+    """ Apply each section of the configuration and return (results, success) """
+    results = {}
+    success = True
+    for section in SECTIONS:
+        if section not in config:
+            continue
+        try:
+            results[section] = globals()[f"apply_{section}"](config[section], log)
+        except Exception as detail:
+            log.write(f"{section}: {detail}", 'apply_config', 'error')
+            results[section] = {'changed': False, 'error': str(detail)}
+            success = False
+    return results, success
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SolydXK System command line")
+    parser.add_argument('config', nargs='?', help="JSON configuration file (- for stdin).")
+    parser.add_argument('-s', '--status', action="store_true", help="Print the current settings.")
+    parser.add_argument('-l', '--log', default=LOG_FILE, help=f"Log file (default: {LOG_FILE}).")
+    parser.add_argument('-r', '--root', help="Configure the system mounted at ROOT instead of the running system.")
+    args = parser.parse_args()
+    if not args.config and not args.status:
+        parser.error("a configuration file or --status is required")
+    if args.root:
+        if not os.path.isdir(args.root):
+            parser.error(f"root is not a directory: {args.root}")
+        set_root(args.root)
+
+    # Command output goes to stderr: stdout is reserved for the JSON result
+    stdout = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    if args.status:
+        json.dump(get_status(), stdout, indent=2)
+        stdout.write('\n')
+        return 0
+
+    if os.getuid() != 0:
+        parser.error("run as root to apply a configuration")
+    if args.config == '-':
+        config = json.load(sys.stdin)
+    else:
+        with open(args.config, encoding='utf-8') as config_fle:
+            config = json.load(config_fle)
+    unknown = set(config) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {' '.join(sorted(unknown))}")
+
+    log_config = get_log_config(join(SCRIPT_DIR, 'solydxk-system.conf'))
+    log = Logger(args.log, addLogTime=True, maxSizeKB=log_config['max_size_kb'],
+                 generations=log_config['generations'], jsonFormat=log_config['json'],
+                 showErrorDialogs=False)
+    results, success = apply_config(config, log)
+    json.dump({'results': results, 'success': success}, stdout, indent=2)
+    stdout.write('\n')
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
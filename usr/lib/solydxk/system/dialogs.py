@@ -4,7 +4,8 @@
 # Make sure the right Gtk version is loaded
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GLib, GdkPixbuf
+from gi.repository import Gtk, GLib
+from imagecache import get_pixbuf
 
 
 class Dialog(Gtk.MessageDialog):
@@ -165,9 +166,11 @@ class SelectFileDialog():
         def image_preview_cb(dialog):
             filename = dialog.get_preview_filename()
             try:
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(filename, 128, 128)
-                image.set_from_pixbuf(pixbuf)
-                valid_preview = True
+                # None for directories and files that are not images
+                pixbuf = get_pixbuf(filename, 128, 128)
+                if pixbuf is not None:
+                    image.set_from_pixbuf(pixbuf)
+                valid_preview = pixbuf is not None
             except Exception:
                 valid_preview = False
             dialog.set_preview_widget_active(valid_preview)
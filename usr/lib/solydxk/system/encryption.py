@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 """ Encryption functions """
 
-import re
 from os.path import basename, exists, join
 from utils import shell_exec, getoutput, get_uuid, \
                   get_filesystem, get_device_from_uuid, \
                   get_package_version, compare_package_versions, \
-                  VersionComparison
+                  VersionComparison, shell_exec_popen, MountSnapshot, root_path
+from fstab import CrypttabModel
+
+# Devices unlocked in this session: {device: mapped_device}
+UNLOCKED_DEVICES = {}
 
 
 def clear_partition(device):
@@ -42,23 +45,61 @@ def unmount_partition(device):
     shell_exec(f"umount -f {device}")
     if is_connected(device):
         shell_exec(f"cryptsetup close {device} 2>/dev/null")
-    ret = getoutput(f"grep '{device} ' /proc/mounts")[0]
-    if not device in ret:
-        return True
-    return False
+    return not MountSnapshot().is_mounted(device)
 
 
 def connect_block_device(device, passphrase):
     if exists(device):
+        # Reuse the mapping when it was already unlocked in this session
+        mapped_device = get_unlocked_device(device)
+        if mapped_device:
+            return (mapped_device, get_filesystem(mapped_device))
         mapped_name = basename(device)
         shell_exec(f"printf \"{passphrase}\" | cryptsetup open --type luks {device} {mapped_name}")
         # Collect info to return
         mapped_device = join('/dev/mapper', mapped_name)
         if exists(mapped_device):
+            UNLOCKED_DEVICES[device] = mapped_device
             filesystem = get_filesystem(mapped_device)
             return (mapped_device, filesystem)
     return ('', '')
 
+
+def connect_block_devices(devices, passphrase):
+    """ Unlock several devices with one passphrase.
+        Every cryptsetup process runs at the same time so that
+        the key derivation of each device runs on its own core.
+        Returns dictionary {device: (mapped_device, filesystem)} """
+    connected = {}
+    processes = {}
+    for device in devices:
+        if not exists(device):
+            continue
+        if get_unlocked_device(device):
+            connected[device] = connect_block_device(device, passphrase)
+            continue
+        processes[device] = shell_exec_popen(f"printf \"{passphrase}\" | "
+                                             f"cryptsetup open --type luks {device} {basename(device)}")
+    for device, process in processes.items():
+        process.communicate()
+        mapped_device = join('/dev/mapper', basename(device))
+        if process.returncode == 0 and exists(mapped_device):
+            UNLOCKED_DEVICES[device] = mapped_device
+            connected[device] = (mapped_device, get_filesystem(mapped_device))
+        else:
+            connected[device] = ('', '')
+    return connected
+
+
+def get_unlocked_device(device):
+    """ Return the mapped device if device was unlocked in this session """
+    mapped_device = UNLOCKED_DEVICES.get(device, '')
+    if mapped_device and exists(mapped_device):
+        return mapped_device
+    UNLOCKED_DEVICES.pop(device, None)
+    return ''
+
+
 def is_connected(device):
     mapped_name = basename(device)
     if exists(join("/dev/mapper", mapped_name)):
@@ -110,40 +151,26 @@ def create_keyfile(keyfile_path, device, passphrase):
     shell_exec(f"printf \"{passphrase}\" | cryptsetup luksAddKey {device} {keyfile_path}")
 
 
-def write_crypttab(device, fs_type, crypttab_path=None, keyfile_path=None, remove_device=False):
-    if crypttab_path is None or not '/' in crypttab_path:
-        crypttab_path = '/etc/crypttab'
+def update_crypttab(crypttab_model, device, fs_type, keyfile_path=None, remove_device=False):
+    """ Add, replace or remove device in a CrypttabModel without writing it """
     device = device.replace('/mapper', '')
+    uuid = get_uuid(device)
+    if remove_device:
+        crypttab_model.remove(uuid=uuid)
+        return
+    swap = ''
+    if fs_type == 'swap':
+        swap = 'swap,'
+    crypttab_model.set_device(basename(device), uuid, keyfile_path, f"{swap}luks,timeout=60")
 
-    if not exists(crypttab_path):
-        with open(file=crypttab_path, mode='w', encoding='utf-8') as crypttab_fle:
-            crypttab_fle.write('# <target name>\t<source device>\t<key file>\t<options>\n')
-
-    if keyfile_path is None or keyfile_path == '':
-        keyfile_path = 'none'
-    crypttab_uuid = f"UUID={get_uuid(device)}"
-    new_line = ''
-    if not remove_device:
-        swap = ''
-        if fs_type == 'swap':
-            swap = 'swap,'
-        new_line = f"{basename(device)} {crypttab_uuid} {keyfile_path} {swap}luks,timeout=60\n"
-
-    # Create new crypttab contents
-    cont = ''
-    with open(file=crypttab_path, mode='r', encoding='utf-8') as crypttab_fle:
-        cont = crypttab_fle.read()
-    regexp = rf".*\s{crypttab_uuid}\s.*"
-    match = re.search(regexp, cont)
-    if match:
-        cont = re.sub(regexp, new_line, cont)
-    else:
-        if not remove_device:
-            cont += new_line
-
-    # Save the new crypttab
-    with open(file=crypttab_path, mode='w', encoding='utf-8') as crypttab_fle:
-        crypttab_fle.write(cont)
+
+def write_crypttab(device, fs_type, crypttab_path=None, keyfile_path=None, remove_device=False):
+    if crypttab_path is None or not '/' in crypttab_path:
+        crypttab_path = root_path('/etc/crypttab')
+    crypttab_model = CrypttabModel(crypttab_path)
+    update_crypttab(crypttab_model, device, fs_type, keyfile_path, remove_device)
+    if crypttab_model.changed or not exists(crypttab_path):
+        crypttab_model.save()
 
 
 # Returns dictionary {device: {target_name, uuid, key_file}}
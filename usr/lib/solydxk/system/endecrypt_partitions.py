@@ -6,12 +6,11 @@ import time
 from shutil import rmtree
 import os
 import math
-from dialogs import InputDialog
 from os.path import exists, join, basename, isdir
 from udisks2 import Udisks2
 from utils import shell_exec, get_logged_user, get_uuid, \
                   get_nr_files_in_dir, shell_exec_popen, \
-                  get_debian_version
+                  get_debian_version, traced
 from encryption import encrypt_partition, create_keyfile
 
 # i18n: http://docs.python.org/3/library/gettext.html
@@ -32,6 +31,7 @@ class EnDecryptPartitions(threading.Thread):
         # Queue returns list: [fraction, error_code, partition_index, partition, message]
         self.queue = queue
 
+    @traced
     def run(self):
         # Loop on index: need that when queueing a changed partition object
         steps = 10
@@ -264,10 +264,13 @@ class ChangePassphrase(threading.Thread):
         passphrase_title = _("Partition passphrase")
         passphrase_text = _("Please, provide the current passphrase\n"
                             "for the encrypted partition")
+        # Only needed in the GUI: do not import Gtk for the command line
+        from dialogs import InputDialog
         return InputDialog(title=passphrase_title,
                            text=f"{passphrase_text}:\n\n<b>{device_path}</b>",
-                           is_password=True).show()
+                           is_password=True).show_dialog()
 
+    @traced
     def run(self):
         steps = 4
         nr_partitions = len(self.my_partitions)
@@ -329,3 +332,7 @@ class ChangePassphrase(threading.Thread):
                         partition['mount_point'] = ''
                         step = (i + 1) * 4
                         self.queue.put([1 / (total_steps / step), 130, i, partition, self.mount_error.format(device)])
+            else:
+                msg = _("Could not unmount {0}\n"
+                        "Please, close all programs that use {0} and try again.").format(partition['device'])
+                self.queue.put([1, 135, None, None, msg])
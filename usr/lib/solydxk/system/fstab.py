@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+""" Fstab and crypttab models: parse once, look up by uuid, device or mount point """
+
+import re
+from os import listdir
+from os.path import exists, join, realpath, basename
+from utils import get_device_from_uuid, write_file_atomic
+
+UUID_PATTERN = re.compile(r'[0-9a-z]{8}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{12}')
+# File system UUIDs: RFC-4122, vfat (ABCD-1234) and NTFS (16 hex digits)
+FS_UUID_PATTERN = re.compile(r'[0-9a-f]+(-[0-9a-f]+)*')
+UUID_DIR = '/dev/disk/by-uuid'
+NO_MOUNT_POINTS = ('swap', 'none')
+CRYPTTAB_HEADER = '# <target name>\t<source device>\t<key file>\t<options>'
+
+
+def uuid_device_index():
+    """ Return dictionary {uuid: device} from the udev by-uuid links """
+    uuid_devices = {}
+    try:
+        for uuid in listdir(UUID_DIR):
+            uuid_devices[uuid] = realpath(join(UUID_DIR, uuid))
+    except OSError:
+        pass
+    return uuid_devices
+
+
+def resolve_uuid(uuid, uuid_devices=None):
+    """ Return device from UUID: use the index and only call blkid when it is missing """
+    uuid = uuid.replace('UUID=', '')
+    if uuid_devices is not None and uuid in uuid_devices:
+        return uuid_devices[uuid]
+    return get_device_from_uuid(uuid)
+
+
+class FstabEntry():
+    """ A single mount line in fstab """
+    def __init__(self, fields):
+        # Fill up missing dump and pass fields
+        fields = fields + ['0'] * (6 - len(fields))
+        self.device, self.mount_point, self.fs_type, \
+            self.options, self.dump, self.pass_nr = fields[:6]
+
+    @property
+    def uuid(self):
+        if self.device.startswith('UUID='):
+            return self.device[5:]
+        return ''
+
+    def fields(self):
+        return [self.device, self.mount_point, self.fs_type,
+                self.options, self.dump, self.pass_nr]
+
+
+class FstabModel():
+    """ Parsed fstab with indexes on uuid, device and mount point """
+    def __init__(self, fstab_path):
+        self.path = fstab_path
+        self.lines = []
+        self.changed = False
+        self.by_uuid = {}
+        self.by_device = {}
+        self.by_mount = {}
+        self._sorted_content = None
+        self.refresh()
+
+    def refresh(self):
+        """ (Re-)read the fstab file """
+        self.lines = []
+        self.changed = False
+        if exists(self.path):
+            with open(file=self.path, mode='r', encoding='utf-8') as fstab_fle:
+                for line in fstab_fle.read().splitlines():
+                    fields = line.split()
+                    if line.strip()[0:1] == '#' or len(fields) < 4:
+                        self.lines.append(line)
+                    else:
+                        self.lines.append(FstabEntry(fields))
+        self._build_index()
+
+    def _build_index(self):
+        self.by_uuid = {}
+        self.by_device = {}
+        self.by_mount = {}
+        self._sorted_content = None
+        # Rank the entries in the sorted order: first entry wins
+        for rank, entry in enumerate(self.sorted_entries()):
+            entry.rank = rank
+            if entry.uuid:
+                self.by_uuid.setdefault(entry.uuid, entry)
+            self.by_device.setdefault(entry.device, entry)
+            self.by_mount.setdefault(entry.mount_point, entry)
+
+    def entries(self):
+        return [line for line in self.lines if isinstance(line, FstabEntry)]
+
+    def sorted_entries(self):
+        """ Entries in the order of sorted_content """
+        entries = []
+        group = []
+        for line in self.lines:
+            if isinstance(line, FstabEntry):
+                group.append(line)
+            elif line.strip()[0:1] == '#':
+                entries.extend(sorted(group, key=lambda x: x.mount_point))
+                group = []
+        entries.extend(sorted(group, key=lambda x: x.mount_point))
+        return entries
+
+    def find(self, uuid='', device='', mapped_device=''):
+        """ Return the first matching entry (uuid, device or mapped device) or None """
+        found = []
+        if uuid and uuid in self.by_uuid:
+            found.append(self.by_uuid[uuid])
+        for dev in (device, mapped_device):
+            if dev and dev in self.by_device:
+                found.append(self.by_device[dev])
+        if found:
+            return min(found, key=lambda x: x.rank)
+        return None
+
+    def has_mount_point(self, mount_point):
+        return mount_point in self.by_mount
+
+    def add(self, device, mount_point, fs_type, options='defaults', dump='0', pass_nr='0'):
+        """ Append a new entry """
+        entry = FstabEntry([device, mount_point, fs_type, options, str(dump), str(pass_nr)])
+        self.lines.append(entry)
+        self.changed = True
+        self._build_index()
+        return entry
+
+    def remove(self, entry):
+        """ Remove an entry (returned by find) """
+        if entry in self.lines:
+            self.lines.remove(entry)
+            self.changed = True
+            self._build_index()
+
+    def replace_device(self, old_device, new_device):
+        """ Replace the device field of all entries of old_device """
+        for entry in self.entries():
+            if entry.device == old_device and old_device != new_device:
+                entry.device = new_device
+                self.changed = True
+        self._build_index()
+
+    def validate(self):
+        """ Return a list with errors, a subset of the findmnt --verify checks """
+        errors = []
+        mount_points = set()
+        for entry in self.entries():
+            if not entry.device:
+                errors.append(f"{self.path}: missing source")
+            if entry.device.startswith('UUID=') and not FS_UUID_PATTERN.fullmatch(entry.uuid.lower()):
+                errors.append(f"{self.path}: {entry.device}: invalid UUID")
+            if entry.mount_point not in NO_MOUNT_POINTS:
+                if entry.mount_point[:1] != '/':
+                    errors.append(f"{self.path}: {entry.mount_point}: target is not an absolute path")
+                elif entry.mount_point in mount_points:
+                    errors.append(f"{self.path}: {entry.mount_point}: duplicate target")
+                mount_points.add(entry.mount_point)
+            if not entry.fs_type:
+                errors.append(f"{self.path}: {entry.mount_point}: missing file system type")
+            if not entry.dump.isdigit() or not entry.pass_nr.isdigit():
+                errors.append(f"{self.path}: {entry.mount_point}: dump and pass must be numbers")
+        return errors
+
+    def content(self, sort=False):
+        """ Return the fstab contents """
+        if sort:
+            return self.sorted_content()
+        lines = []
+        for line in self.lines:
+            if isinstance(line, FstabEntry):
+                line = '\t'.join(line.fields())
+            lines.append(line)
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def save(self, sort=False):
+        """ Write fstab at once: use save_models to validate before saving """
+        write_file_atomic(self.path, self.content(sort))
+        self.changed = False
+
+    def sorted_content(self):
+        """ Return the fstab contents sorted on mount point between comment lines """
+        if self._sorted_content is not None:
+            return self._sorted_content
+        sort_lst = []
+        sorted_lst = []
+        for line in self.lines:
+            if isinstance(line, FstabEntry):
+                # Add mount device line
+                sort_lst.append(line.fields())
+                continue
+            line = line.strip()
+            if line[0:1] == '#':
+                line_added = False
+                if not sorted_lst:
+                    # First line in fstab is commented
+                    sorted_lst.append(line)
+                    line_added = True
+                # Sort list on mount point and add sorted lines to list
+                for sort_line in sorted(sort_lst, key=lambda x: x[1]):
+                    sorted_lst.append('\t'.join(sort_line))
+                # Cleanup before next iteration
+                sort_lst = []
+                if not line_added:
+                    # Add empty line for readability and add comment
+                    sorted_lst.append('')
+                    sorted_lst.append(line)
+
+        # Add left overs
+        for sort_line in sorted(sort_lst, key=lambda x: x[1]):
+            sorted_lst.append('\t'.join(sort_line))
+
+        # Create the sorted fstab contents
+        self._sorted_content = '\n'.join(sorted_lst) + '\n' if sorted_lst else ''
+        return self._sorted_content
+
+
+class CrypttabEntry():
+    """ A single line in crypttab """
+    def __init__(self, fields, device=''):
+        fields = fields + [''] * (4 - len(fields))
+        self.target, self.source, self.keyfile, self.options = fields[:4]
+        self.device = device
+
+    @property
+    def uuid(self):
+        match = UUID_PATTERN.search(self.source)
+        return match.group(0) if match else ''
+
+
+class CrypttabModel():
+    """ Parsed crypttab with indexes on uuid, source device and target name """
+    def __init__(self, crypttab_path, uuid_devices=None):
+        self.path = crypttab_path
+        self.uuid_devices = uuid_device_index() if uuid_devices is None else uuid_devices
+        self.lines = []
+        self.changed = False
+        self.by_uuid = {}
+        self.by_device_name = {}
+        self.by_target = {}
+        self.refresh()
+
+    def refresh(self):
+        """ (Re-)read the crypttab file """
+        self.lines = []
+        self.changed = False
+        if exists(self.path):
+            with open(file=self.path, mode='r', encoding='utf-8') as crypttab_fle:
+                for line in crypttab_fle.read().splitlines():
+                    fields = line.split()
+                    if line.strip()[0:1] == '#' or len(fields) <= 1:
+                        self.lines.append(line)
+                    else:
+                        self.lines.append(CrypttabEntry(fields))
+        else:
+            self.lines.append(CRYPTTAB_HEADER)
+        self._build_index()
+
+    def _build_index(self):
+        self.by_uuid = {}
+        self.by_device_name = {}
+        self.by_target = {}
+        for entry in self.entries():
+            if entry.uuid:
+                entry.device = resolve_uuid(entry.uuid, self.uuid_devices)
+                self.by_uuid.setdefault(entry.uuid, entry)
+            elif entry.source.startswith('/'):
+                entry.device = entry.source
+            if entry.device:
+                self.by_device_name.setdefault(basename(entry.device), entry)
+            self.by_target.setdefault(entry.target, entry)
+
+    def entries(self):
+        return [line for line in self.lines if isinstance(line, CrypttabEntry)]
+
+    def find(self, device):
+        """ Return the entry of device (mapped or not) or None """
+        return self.by_device_name.get(basename(device))
+
+    def set_device(self, target, uuid, keyfile='none', options='luks'):
+        """ Add or replace the entry of the device with uuid """
+        entry = self.by_uuid.get(uuid)
+        new_entry = CrypttabEntry([target, f"UUID={uuid}", keyfile or 'none', options])
+        if entry:
+            self.lines[self.lines.index(entry)] = new_entry
+        else:
+            self.lines.append(new_entry)
+        self.changed = True
+        self._build_index()
+        return new_entry
+
+    def remove(self, device='', uuid=''):
+        """ Remove all entries of device (target name or source) or uuid """
+        name = basename(device)
+        for entry in self.entries():
+            if (name and (entry.target == name or basename(entry.device) == name)) \
+               or (uuid and entry.uuid == uuid):
+                self.lines.remove(entry)
+                self.changed = True
+        self._build_index()
+
+    def replace_keyfile(self, old_keyfile, new_keyfile='none'):
+        """ Replace old_keyfile in all entries """
+        for entry in self.entries():
+            if entry.keyfile == old_keyfile:
+                entry.keyfile = new_keyfile
+                self.changed = True
+
+    def validate(self):
+        """ Return a list with errors """
+        errors = []
+        targets = set()
+        for entry in self.entries():
+            if not entry.source:
+                errors.append(f"{self.path}: {entry.target}: missing source device")
+            if entry.target in targets:
+                errors.append(f"{self.path}: {entry.target}: duplicate target name")
+            targets.add(entry.target)
+        return errors
+
+    def content(self):
+        """ Return the crypttab contents """
+        lines = []
+        for line in self.lines:
+            if isinstance(line, CrypttabEntry):
+                line = ' '.join([line.target, line.source, line.keyfile or 'none', line.options]).strip()
+            lines.append(line)
+        return '\n'.join(lines) + '\n'
+
+    def save(self):
+        """ Write crypttab at once: use save_models to validate before saving """
+        write_file_atomic(self.path, self.content())
+        self.changed = False
+
+
+def save_models(models, sort_fstab=False):
+    """ Validate all changed models and only save them when all are valid.
+        Returns a list with errors """
+    changed = [model for model in models if model.changed]
+    errors = []
+    for model in changed:
+        errors.extend(model.validate())
+    if not errors:
+        for model in changed:
+            if isinstance(model, FstabModel):
+                model.save(sort_fstab)
+            else:
+                model.save()
+    return errors
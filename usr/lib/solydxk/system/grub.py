@@ -2,7 +2,7 @@
 
 import re
 import os
-from utils import shell_exec, replace_pattern_in_file
+from utils import shell_exec, replace_pattern_in_file, traced, root_path, root_command
 
 # i18n: http://docs.python.org/3/library/gettext.html
 import gettext
@@ -13,8 +13,13 @@ _ = gettext.translation('solydxk-system', fallback=True).gettext
 class Grub():
     def __init__(self, logger_object=None):
         self.log = logger_object
-        self.grub_default = '/etc/default/grub' if os.path.isfile('/etc/default/grub') else None
-        self.grub_cfg = '/boot/grub/grub.cfg' if os.path.isfile('/boot/grub/grub.cfg') else None
+        # Paths in the configured root (see utils.set_root)
+        self.grub_default = root_path('/etc/default/grub')
+        self.grub_cfg = root_path('/boot/grub/grub.cfg')
+        if not os.path.isfile(self.grub_default):
+            self.grub_default = None
+        if not os.path.isfile(self.grub_cfg):
+            self.grub_cfg = None
         self.installed_themes = self._installed_themes()
         self.resolution = self._current_resolution()
         self.theme = self._current_theme()
@@ -37,12 +42,12 @@ class Grub():
     def _installed_themes(self):
         themes = []
         for theme_dir in ['/usr/share/grub/themes', '/boot/grub/themes']:
-            if not os.path.exists(theme_dir):
+            if not os.path.exists(root_path(theme_dir)):
                 continue
 
-            for theme in set(next(os.walk(theme_dir))[1]):
+            for theme in set(next(os.walk(root_path(theme_dir)))[1]):
                 theme_path = os.path.join(theme_dir, theme + "/theme.txt")
-                if os.path.exists(theme_path):
+                if os.path.exists(root_path(theme_path)):
                     themes.append(theme_path)
         themes.sort()
         return themes
@@ -55,7 +60,7 @@ class Grub():
 
     def _current_theme(self):
         theme = self._grub_default_value(r'^GRUB_THEME\s*=(.*)', 1)
-        if os.path.exists(str(theme)):
+        if theme and os.path.exists(root_path(theme)):
             self.write_log(f"Current grub theme: {theme}")
             return theme
         return None
@@ -78,10 +83,11 @@ class Grub():
         return False
 
     # Save given grub resolution
+    @traced
     def save(self, theme=None, resolution=None, splash=True):
         if self.grub_default:
             theme_path = self.theme_path(theme) if not '/' in theme else theme
-            if os.path.exists(str(theme_path)):
+            if theme_path and os.path.exists(root_path(theme_path)):
                 replace_pattern_in_file(r'^#?GRUB_THEME\s*=.*',
                                         f'GRUB_THEME={theme_path}',
                                         self.grub_default)
@@ -121,7 +127,7 @@ class Grub():
                 cmd = f"sed -i -e '/^GRUB_CMDLINE_LINUX_DEFAULT=/ s/\"$/ nosplash\"/' {self.grub_default}"
                 shell_exec(cmd)
 
-            shell_exec('update-grub')
+            shell_exec(root_command('update-grub'))
 
     def write_log(self, message, level='debug'):
         if self.log:
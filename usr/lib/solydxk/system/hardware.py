@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+""" Hardware detection for the Device Driver tab and ddm -s.
+    PCI devices are read once from sysfs and looked up in the driver support
+    database (drivers.list) for the drivers the ddm-*.sh scripts install.
+
+    Print supported hardware: hardware.py [-t] [-p] [driver ...]
+    -t: test devices, -p: packages only
+"""
+
+import os
+import re
+import sys
+from bisect import bisect_right
+from os.path import join, exists, abspath, dirname
+from utils import getoutput, get_apt_cache, get_value_from_url, write_file_atomic
+
+PCI_DIR = '/sys/bus/pci/devices'
+PCI_IDS = ('/usr/share/misc/pci.ids', '/usr/share/hwdata/pci.ids')
+CPUINFO = '/proc/cpuinfo'
+LSB_RELEASE = '/etc/lsb-release'
+OS_RELEASE = '/etc/os-release'
+
+# PCI class codes (first 4 hex digits of the class file)
+CLASS_VGA = '0300'
+CLASS_3D = '0302'
+
+# Vendor ids
+AMD = '1002'
+NVIDIA = '10de'
+BROADCOM = '14e4'
+INTEL = '8086'
+
+DRIVERS_LIST = join(abspath(dirname(__file__)).replace('lib', 'share'), 'drivers.list')
+
+# Fall back to amdgpu for these code names or for ids in the list ddm-amd.sh downloads
+AMD_NEW = ['xserver-xorg-video-amdgpu']
+AMD_CODE_NAMES = ('Oland Cape Pitcairn Tahiti Hainan Curacao Trinidad Iceland Topaz Opal Venus Neptune '
+                  'Bonaire Hawaii Samoa Tobago Malta Zealand Vesuvius Saturn Grenada Temash Kabini Kaveri '
+                  'Godavari Beema Mullins Carrizo-L Tonga Fiji Antigua Carrizo Bristol Stoney Amethyst '
+                  'Polaris Lexa Baffin Ellesmere Neo Scorpio Vega Greenland Instinct Raven Navi').lower().split()
+AMD_ID_LIST = '/tmp/{codename}_amdgpu.txt'
+AMD_ID_URL = 'https://downloads.solydxk.com/lkddb/{codename}_amdgpu.txt'
+AMD_ID_TIMEOUT = 5
+BUMBLEBEE = ['bumblebee-nvidia', 'primus-libs-ia32:i386']
+PAE = ['linux-headers-686-pae', 'linux-image-686-pae']
+
+# Hardware of the -t option of the ddm scripts
+TEST_DEVICES = [{'slot': 'test-amd', 'vendor': AMD, 'device': '67df', 'class': CLASS_VGA,
+                 'name': 'Advanced Micro Devices, Inc. [AMD/ATI] Ellesmere [Radeon RX 470/480]'},
+                {'slot': 'test-nvidia', 'vendor': NVIDIA, 'device': '0193', 'class': CLASS_VGA,
+                 'name': 'NVIDIA Corporation G80 [GeForce 8800 GTS]'},
+                {'slot': 'test-broadcom', 'vendor': BROADCOM, 'device': '4320', 'class': '0280',
+                 'name': 'Broadcom Corporation BCM4306 802.11bgn Wireless Network Adapter'}]
+
+
+class DriverDatabase():
+    """ Driver support database with a range index per vendor.
+        Overlapping ranges are split into sorted, non-overlapping segments
+        when loading, so a lookup is a binary search. """
+    def __init__(self, path=DRIVERS_LIST):
+        self.path = path
+        # {vendor: (starts, ends, entries)}
+        self.index = {}
+        self.load()
+
+    def load(self):
+        entries = {}
+        try:
+            with open(file=self.path, mode='r', encoding='utf-8') as db_fle:
+                lines = db_fle.readlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            line_data = line.split('#')[0].split()
+            if len(line_data) != 6:
+                continue
+            vendor, devices, pci_class, driver, backports, packages = line_data
+            first, _, last = devices.partition('-')
+            entry = {'driver': driver,
+                     'class': '' if pci_class == '*' else pci_class.lower(),
+                     'backports': backports.lower() == 'yes',
+                     'packages': packages.split(','),
+                     'first': int(first, 16),
+                     'last': int(last or first, 16)}
+            entries.setdefault(vendor.lower(), []).append(entry)
+        self.index = {vendor: self._compile(vendor_entries) for vendor, vendor_entries in entries.items()}
+
+    @staticmethod
+    def _compile(entries):
+        """ Return (starts, ends, entries) of non-overlapping segments:
+            the narrowest range (last line when equal) covers each segment """
+        bounds = sorted({entry['first'] for entry in entries} | {entry['last'] + 1 for entry in entries})
+        starts, ends, segments = [], [], []
+        for start, end in zip(bounds, bounds[1:]):
+            best = None
+            for entry in entries:
+                if entry['first'] <= start and entry['last'] >= end - 1:
+                    if best is None or entry['last'] - entry['first'] <= best['last'] - best['first']:
+                        best = entry
+            if best is None:
+                continue
+            if segments and segments[-1] is best and ends[-1] == start - 1:
+                ends[-1] = end - 1
+            else:
+                starts.append(start)
+                ends.append(end - 1)
+                segments.append(best)
+        return starts, ends, segments
+
+    def lookup(self, vendor, device, pci_class=''):
+        """ Return entry {driver, class, backports, packages, first, last} or None """
+        index = self.index.get(vendor)
+        if not index:
+            return None
+        starts, ends, entries = index
+        try:
+            device_id = int(device, 16)
+        except ValueError:
+            return None
+        i = bisect_right(starts, device_id) - 1
+        if i < 0 or device_id > ends[i]:
+            return None
+        entry = entries[i]
+        if not pci_class.startswith(entry['class']):
+            return None
+        return entry
+
+
+_DRIVER_DATABASE = None
+_AMDGPU_IDS = {}
+
+
+def get_driver_database():
+    """ Loaded once """
+    global _DRIVER_DATABASE
+    if _DRIVER_DATABASE is None:
+        _DRIVER_DATABASE = DriverDatabase()
+    return _DRIVER_DATABASE
+
+
+def _read_hex(path):
+    try:
+        with open(file=path, mode='r', encoding='utf-8') as hex_fle:
+            return hex_fle.read().strip().lower().replace('0x', '')
+    except OSError:
+        return ''
+
+
+def get_pci_devices(pci_dir=PCI_DIR):
+    """ Return list of dictionaries {slot, vendor, device, class} from sysfs """
+    devices = []
+    try:
+        slots = sorted(os.listdir(pci_dir))
+    except OSError:
+        return devices
+    for slot in slots:
+        devices.append({'slot': slot,
+                        'vendor': _read_hex(join(pci_dir, slot, 'vendor')),
+                        'device': _read_hex(join(pci_dir, slot, 'device')),
+                        'class': _read_hex(join(pci_dir, slot, 'class'))[:4]})
+    return devices
+
+
+def get_pci_names(ids, pci_ids=PCI_IDS):
+    """ Return dictionary {(vendor, device): 'Vendor name Device name'} from pci.ids
+        for the given (vendor, device) tuples """
+    names = {}
+    ids = set(ids)
+    data = ''
+    for path in pci_ids:
+        if exists(path):
+            with open(file=path, mode='r', encoding='utf-8', errors='replace') as ids_fle:
+                data = ids_fle.read()
+            break
+    next_vendor = re.compile(r'^[0-9a-f]{4}  ', re.M)
+    for vendor, device in ids:
+        vendor_name = vendor
+        device_name = device
+        start = data.find(f"\n{vendor}  ")
+        if start >= 0:
+            start += 1
+            end_line = data.find('\n', start)
+            vendor_name = data[start + 6:end_line]
+            match = next_vendor.search(data, end_line)
+            end = match.start() if match else len(data)
+            pos = data.find(f"\n\t{device}  ", end_line - 1, end)
+            if pos >= 0:
+                device_name = data[pos + 8:data.find('\n', pos + 1)]
+        names[(vendor, device)] = f"{vendor_name} {device_name}"
+    return names
+
+
+def is_pae_capable(machine=None, cpuinfo=CPUINFO):
+    """ 32-bit system with a PAE capable processor """
+    if machine is None:
+        machine = os.uname().machine
+    if machine != 'i686':
+        return False
+    try:
+        with open(file=cpuinfo, mode='r', encoding='utf-8') as cpu_fle:
+            for line in cpu_fle:
+                if line.startswith('flags'):
+                    return 'pae' in line.split(':', 1)[1].split()
+    except OSError:
+        pass
+    return False
+
+
+def get_os_description():
+    """ DISTRIB_DESCRIPTION of lsb-release or the system name and machine """
+    try:
+        with open(file=LSB_RELEASE, mode='r', encoding='utf-8') as lsb_fle:
+            for line in lsb_fle:
+                if line.startswith('DISTRIB_DESCRIPTION='):
+                    return line.split('=', 1)[1].strip().strip('"')
+    except OSError:
+        pass
+    return f"{os.uname().sysname} {os.uname().machine}"
+
+
+def get_codename():
+    """ VERSION_CODENAME of os-release (lsb_release -cs) """
+    try:
+        with open(file=OS_RELEASE, mode='r', encoding='utf-8') as os_fle:
+            for line in os_fle:
+                if line.startswith('VERSION_CODENAME='):
+                    return line.split('=', 1)[1].strip().strip('"')
+    except OSError:
+        pass
+    return getoutput('lsb_release -cs')[0]
+
+
+def get_amdgpu_ids():
+    """ Device ids of the amdgpu id list: loaded once, downloaded when it is not in /tmp """
+    codename = get_codename()
+    if codename not in _AMDGPU_IDS:
+        id_list = AMD_ID_LIST.format(codename=codename)
+        try:
+            with open(file=id_list, mode='r', encoding='utf-8') as ids_fle:
+                _AMDGPU_IDS[codename] = set(ids_fle.read().split())
+        except OSError:
+            try:
+                ids = get_value_from_url(AMD_ID_URL.format(codename=codename), timeout_secs=AMD_ID_TIMEOUT)
+            except OSError:
+                ids = None
+            # Device ids only: no error pages
+            _AMDGPU_IDS[codename] = {device_id for device_id in (ids or '').lower().split()
+                                     if re.fullmatch(r'[0-9a-f]{4}', device_id)}
+            if _AMDGPU_IDS[codename]:
+                try:
+                    write_file_atomic(id_list, '\n'.join(sorted(_AMDGPU_IDS[codename])) + '\n')
+                except OSError:
+                    pass
+    return _AMDGPU_IDS[codename]
+
+
+def get_nvidia_packages(device_ids=None):
+    """ Driver packages nvidia-detect proposes for the installed (or given) cards """
+    if not exists('/usr/bin/nvidia-detect'):
+        return []
+    packages = []
+    for line in getoutput(f"nvidia-detect {' '.join(device_ids or [])}"):
+        line = line.strip()
+        if line.startswith('nvidia-'):
+            packages.append(line.split('/')[0])
+    return packages
+
+
+def _hardware(driver, device, name, packages, backports=False):
+    return {'driver': driver,
+            'name': name,
+            'vendor': device['vendor'],
+            'device': device['device'],
+            'packages': packages,
+            'backports': backports,
+            'installed': False}
+
+
+def detect_hardware(test=False, cache=None, pci_dir=PCI_DIR, database=None):
+    """ Return list of dictionaries {driver, name, vendor, device, packages, backports, installed}
+        driver: amd, nvidia, broadcom or pae """
+    if database is None:
+        database = get_driver_database()
+    devices = TEST_DEVICES if test else get_pci_devices(pci_dir)
+
+    # Look up the devices
+    supported = []
+    for device in devices:
+        entry = database.lookup(device['vendor'], device['device'], device['class'])
+        if entry:
+            supported.append((device, entry))
+    names = get_pci_names([(device['vendor'], device['device'])
+                           for device, entry in supported if 'name' not in device])
+
+    hardware = []
+    nvidia_cards = []
+    amd_found = False
+    for device, entry in supported:
+        name = device.get('name') or names[(device['vendor'], device['device'])]
+        packages = entry['packages']
+        if entry['driver'] == 'amd':
+            # Only the first card, like ddm-amd.sh
+            if amd_found:
+                continue
+            amd_found = True
+            if packages != AMD_NEW:
+                if device['device'] in get_amdgpu_ids() \
+                   or any(code_name in name.lower() for code_name in AMD_CODE_NAMES):
+                    packages = AMD_NEW
+        elif entry['driver'] == 'nvidia':
+            nvidia_cards.append((device, entry, name))
+            continue
+        hardware.append(_hardware(entry['driver'], device, name, packages, entry['backports']))
+
+    # Nvidia: Bumblebee for Optimus, else what nvidia-detect proposes
+    if nvidia_cards:
+        optimus = any(device['vendor'] == INTEL and device['class'] == CLASS_VGA for device in devices) \
+                  and any(device['class'] == CLASS_3D for device, entry, name in nvidia_cards)
+        packages = BUMBLEBEE
+        if not optimus:
+            packages = get_nvidia_packages([device['device'] for device, entry, name in nvidia_cards]
+                                           if test else None) or nvidia_cards[0][1]['packages']
+        for device, entry, name in nvidia_cards:
+            hardware.append(_hardware('nvidia', device, name, packages, entry['backports']))
+
+    # PAE kernel (dummy ids)
+    if test or is_pae_capable():
+        hardware.append(_hardware('pae', {'vendor': 'pae0', 'device': 'pae0'},
+                                  f"{get_os_description()} PAE", PAE))
+
+    # Installed state of all driver packages from one cache
+    if hardware:
+        if cache is None:
+            cache = get_apt_cache()
+        for hw in hardware:
+            hw['installed'] = all(package in cache and cache[package].is_installed
+                                  for package in hw['packages'])
+    return hardware
+
+
+# Extra packages, purges and configuration of the ddm-*.sh scripts
+ADDITIONAL_PACKAGES = {'amd': ['build-essential', 'firmware-linux-nonfree'],
+                       'nvidia': ['build-essential', 'firmware-linux-nonfree', 'xserver-xorg-video-intel'],
+                       'broadcom': [],
+                       'pae': []}
+NVIDIA_LEGACY = ['nvidia-settings-legacy-304xx']
+NVIDIA_LEGACY_64 = ['libgl1-nvidia-legacy-304xx-glx:i386']
+# Package name prefixes (fglrx*)
+PURGE_ON_INSTALL = {'amd': ('fglrx', 'libgl1-fglrx-glx', 'amd-opencl-icd'),
+                    'nvidia': ('nvidia-xconfig',)}
+NVIDIA_DEBCONF = ['nvidia-support nvidia-support/check-xorg-conf-on-removal boolean false',
+                  'nvidia-support nvidia-support/check-running-module-version boolean true',
+                  'nvidia-installer-cleanup nvidia-installer-cleanup/delete-nvidia-installer boolean true',
+                  'nvidia-installer-cleanup nvidia-installer-cleanup/remove-conflicting-libraries boolean true',
+                  'nvidia-support nvidia-support/needs-xorg-conf-to-enable note ',
+                  'nvidia-support nvidia-support/create-nvidia-conf boolean true',
+                  'nvidia-installer-cleanup nvidia-installer-cleanup/uninstall-nvidia-installer boolean true']
+BROADCOM_MODULES = {'firmware-b43-installer': ('b43', ''),
+                    'firmware-b43legacy-installer': ('b43legacy', ''),
+                    'broadcom-sta-dkms': ('wl', 'blacklist b43 brcmsmac bcma ssb'),
+                    'firmware-brcm80211': ('brcmsmac', '')}
+BROADCOM_BLACKLIST = '/etc/modprobe.d/blacklist-broadcom.conf'
+
+
+def _installed_matching(cache, match):
+    return [pkg.name for pkg in cache if pkg.is_installed and match(pkg.name)]
+
+
+def get_driver_changes(install, purge, cache=None, user=None):
+    """ Return the package changes for one apt transaction:
+        dictionary {install, purge, debconf, pre, post}
+        install/purge: lists of dictionaries returned by detect_hardware
+        debconf: debconf-set-selections lines, pre/post: commands to run before/after apt """
+    if cache is None:
+        cache = get_apt_cache()
+    changes = {'install': [], 'purge': [], 'debconf': [], 'pre': [], 'post': []}
+
+    def add(key, packages):
+        for package in packages:
+            if package not in changes[key]:
+                changes[key].append(package)
+
+    for hw in install:
+        driver = hw['driver']
+        if driver in ('amd', 'nvidia', 'broadcom'):
+            add('install', [f"linux-headers-{os.uname().release}"])
+        add('install', ADDITIONAL_PACKAGES.get(driver, []))
+        add('install', hw['packages'])
+        if driver in PURGE_ON_INSTALL:
+            add('purge', _installed_matching(cache, lambda name: name.startswith(PURGE_ON_INSTALL[driver])))
+        if driver == 'amd' and hw['packages'] != AMD_NEW:
+            add('purge', [package for package in AMD_NEW if package in cache and cache[package].is_installed])
+        elif driver == 'nvidia':
+            changes['debconf'] += NVIDIA_DEBCONF
+            if any('legacy' in package for package in hw['packages']):
+                add('install', NVIDIA_LEGACY)
+                if os.uname().machine == 'x86_64':
+                    add('install', NVIDIA_LEGACY_64)
+            if 'bumblebee-nvidia' in hw['packages'] and user and user != 'root':
+                changes['post'] += ['groupadd bumblebee', 'groupadd video',
+                                    f'usermod -a -G bumblebee,video {user}',
+                                    'service bumblebeed restart']
+        elif driver == 'broadcom':
+            changes['debconf'] += ['b43-fwcutter b43-fwcutter/install-unconditional boolean true']
+            changes['pre'] += [f'modprobe -rf {module}' for module in ('b44', 'b43', 'b43legacy', 'ssb', 'brcmsmac')]
+            module, blacklist = BROADCOM_MODULES.get(hw['packages'][0], ('', ''))
+            if blacklist:
+                changes['post'].append(f'echo "{blacklist}" > {BROADCOM_BLACKLIST}')
+            else:
+                changes['post'].append(f'rm -f {BROADCOM_BLACKLIST}')
+            if module:
+                changes['post'].append(f'modprobe {module}')
+
+    # Like ddm-open.sh
+    for hw in purge:
+        driver = hw['driver']
+        if driver == 'amd':
+            add('purge', _installed_matching(cache, lambda name: 'amdgpu' in name and 'drm' not in name))
+        elif driver == 'nvidia':
+            add('purge', _installed_matching(cache, lambda name: 'nvidia' in name
+                                             and 'detect' not in name and 'cleanup' not in name))
+            add('purge', _installed_matching(cache, lambda name: name.startswith(('bumblebee', 'primus'))))
+            changes['post'].append('rm -f /etc/X11/xorg.conf /etc/modprobe.d/nvidia* '
+                                   '/etc/modprobe.d/blacklist-nouveau.conf')
+        elif driver == 'broadcom':
+            add('purge', [package for package in hw['packages'] if package in cache and cache[package].is_installed])
+            changes['post'].append(f'rm -f {BROADCOM_BLACKLIST}')
+        elif driver == 'pae':
+            add('purge', _installed_matching(cache, lambda name: '-pae' in name))
+
+    # Never purge what is being installed
+    changes['purge'] = [package for package in changes['purge'] if package not in changes['install']]
+    return changes
+
+
+if __name__ == '__main__':
+    # Same output as the ddm-*.sh -s option: name [vendor:device] [packages]
+    args = sys.argv[1:]
+    test = '-t' in args
+    packages_only = '-p' in args
+    drivers = [arg for arg in args if not arg.startswith('-')]
+    for hw in detect_hardware(test=test):
+        if drivers and hw['driver'] not in drivers:
+            continue
+        if packages_only:
+            print(' '.join(hw['packages']))
+        else:
+            print(f"{hw['name']} [{hw['vendor']}:{hw['device']}] [{' '.join(hw['packages'])}]")
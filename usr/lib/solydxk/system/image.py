@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
-from gi.repository import GdkPixbuf
+from imagecache import get_pixbuf
 
 
 class ImageHandler(object):
 
     def __init__(self, imagePath):
         self.imagePath = imagePath
-        self.pixbuf = GdkPixbuf.Pixbuf.new_from_file(self.imagePath)
+        # Shared pixbuf: crop and resize create new pixbufs
+        self.pixbuf = get_pixbuf(self.imagePath)
         self.width = self.pixbuf.get_width()
         self.height = self.pixbuf.get_height()
 
@@ -33,6 +34,7 @@ class ImageHandler(object):
         if width is None and height is not None:
             width = self.width / (self.height / height)
         if width is not None and height is not None:
+            from gi.repository import GdkPixbuf
             self.pixbuf = self.pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
 
     def saveImage(self, savePath, imageFormat='png'):
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+""" Process-wide cache of decoded (and scaled) images.
+
+Cached pixbufs are shared: never change them in place
+(use scale_simple, new_subpixbuf, copy... which return a new pixbuf).
+"""
+
+from collections import OrderedDict
+from os import stat
+from os.path import isfile
+from threading import Lock
+
+# Maximum memory used by the decoded pixels
+MAX_BYTES = 32 * 1024 * 1024
+
+
+class ImageCache():
+    """ LRU cache keyed by path, mtime, file size and target size """
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nr_bytes = 0
+        self.pixbufs = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, path, width=None, height=None):
+        """ Return pixbuf of path or None if path is not a file.
+            width and height: fit in that box.
+            Only height (or width): scale keeping the aspect ratio. """
+        if not path or not isfile(path):
+            return None
+        st = stat(path)
+        key = (path, st.st_mtime_ns, st.st_size, width, height)
+        with self.lock:
+            pixbuf = self.pixbufs.get(key)
+            if pixbuf is not None:
+                self.pixbufs.move_to_end(key)
+                return pixbuf
+
+        pixbuf = self._load(path, width, height)
+
+        with self.lock:
+            if key not in self.pixbufs:
+                self.pixbufs[key] = pixbuf
+                self.nr_bytes += self._size(pixbuf)
+                # Evict the least recently used, but always keep the last one
+                while self.nr_bytes > self.max_bytes and len(self.pixbufs) > 1:
+                    old_key, old_pixbuf = self.pixbufs.popitem(last=False)
+                    self.nr_bytes -= self._size(old_pixbuf)
+        return pixbuf
+
+    def clear(self):
+        with self.lock:
+            self.pixbufs.clear()
+            self.nr_bytes = 0
+
+    @staticmethod
+    def _load(path, width, height):
+        # GdkPixbuf is loaded with the first image
+        import gi
+        gi.require_version('GdkPixbuf', '2.0')
+        from gi.repository import GdkPixbuf
+        if width and height:
+            return GdkPixbuf.Pixbuf.new_from_file_at_size(path, width, height)
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+        if height:
+            width = int(pixbuf.get_width() * (height / pixbuf.get_height()))
+        elif width:
+            height = int(pixbuf.get_height() * (width / pixbuf.get_width()))
+        if width and height:
+            pixbuf = pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+        return pixbuf
+
+    @staticmethod
+    def _size(pixbuf):
+        return pixbuf.get_rowstride() * pixbuf.get_height()
+
+
+IMAGE_CACHE = ImageCache()
+
+
+def get_pixbuf(path, width=None, height=None):
+    """ Return the cached pixbuf of path (see ImageCache.get) """
+    return IMAGE_CACHE.get(path, width, height)
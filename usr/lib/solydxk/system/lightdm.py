@@ -3,21 +3,22 @@
 import os
 import re
 from glob import glob
-from utils import replace_pattern_in_file
+from utils import replace_pattern_in_file, traced, root_path
 
 GREETER_CONF = '/etc/lightdm/lightdm-gtk-greeter.conf'
 
 class LightDM():
     def __init__(self, logger_object=None):
         self.log = logger_object
+        self.greeter_conf = root_path(GREETER_CONF)
 
     def _lightdm_default_value(self, pattern, group_nr=0):
-        if not os.path.exists(GREETER_CONF):
-            self.write_log(f"LightDM configuration file not found: {GREETER_CONF}", 'warning')
+        if not os.path.exists(self.greeter_conf):
+            self.write_log(f"LightDM configuration file not found: {self.greeter_conf}", 'warning')
             return None
 
         lines = []
-        with open(file=GREETER_CONF, mode='r', encoding='utf-8') as lightdm_fle:
+        with open(file=self.greeter_conf, mode='r', encoding='utf-8') as lightdm_fle:
             lines = lightdm_fle.read().splitlines()
         for line in lines:
             # Search text for resolution
@@ -32,20 +33,23 @@ class LightDM():
     def current_background(self):
         return self._lightdm_default_value(r'^background\s*=(.*)', 1)
 
+    @traced
     def save(self, theme_name):
-        if not os.path.exists(GREETER_CONF):
-            self.write_log(f"LightDM configuration file not found: {GREETER_CONF}", 'warning')
+        if not os.path.exists(self.greeter_conf):
+            self.write_log(f"LightDM configuration file not found: {self.greeter_conf}", 'warning')
             return
 
-        # Search for background.* image
-        backgrounds = glob(fr'/usr/share/desktop-base/{theme_name}*/login/background.*')
+        # Search for background.* image (saved as path on the target system)
+        search_dir = root_path('/usr/share/desktop-base')
+        backgrounds = [path.replace(search_dir, '/usr/share/desktop-base', 1)
+                       for path in glob(fr'{search_dir}/{theme_name}*/login/background.*')]
         if backgrounds:
             breeze_theme = 'Breeze' if 'light' in theme_name else 'Breeze-Dark'
             # Save found background with theme
             replace_pattern_in_file(r'^background\s*=.*', f'background={backgrounds[0]}',
-                                    GREETER_CONF)
+                                    self.greeter_conf)
             replace_pattern_in_file(r'^theme-name\s*=.*', f'theme-name={breeze_theme}',
-                                    GREETER_CONF)
+                                    self.greeter_conf)
             self.write_log(f'LightDM background set: {backgrounds[0]}')
 
     def write_log(self, message, level='debug'):
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
+import os
 import re
 import threading
 from os.path import join, abspath, dirname, exists, basename
 from utils import getoutput, get_config_dict, shell_exec, has_string_in_file, \
                   does_package_exist, is_package_installed, \
-                  get_debian_version, get_firefox_version
+                  get_debian_version, get_firefox_version, traced, run_apt, \
+                  report_apt_progress, current_task, root_path, root_command
 
 DEFAULTLOCALE = 'en_US'
 
@@ -13,19 +15,19 @@ DEFAULTLOCALE = 'en_US'
 class LocaleInfo():
     def __init__(self):
         self.script_dir = abspath(dirname(__file__))
-        cmd = "awk '/^[^#]/{print $3}' /usr/share/zoneinfo/zone.tab | sort -k3"
+        cmd = f"awk '/^[^#]/{{print $3}}' \"{root_path('/usr/share/zoneinfo/zone.tab')}\" | sort -k3"
         self.timezones = getoutput(cmd)
         self.refresh()
 
         # Genereate locale files with the default locale if they do not exist
-        if not exists('/etc/locale.gen'):
-            shell_exec(f'echo "{DEFAULTLOCALE}.UTF-8 UTF-8" >> /etc/locale.gen')
-            shell_exec("locale-gen")
+        if not exists(root_path('/etc/locale.gen')):
+            shell_exec(f'echo "{DEFAULTLOCALE}.UTF-8 UTF-8" >> "{root_path("/etc/locale.gen")}"')
+            shell_exec(root_command("locale-gen"))
         if self.default_locale == '':
             self.default_locale = DEFAULTLOCALE
-            shell_exec("echo \"\" > /etc/default/locale")
-            shell_exec(f'update-locale LANG="{self.default_locale}.UTF-8"')
-            shell_exec(f'update-locale LANG={self.default_locale}.UTF-8')
+            shell_exec(f"echo \"\" > \"{root_path('/etc/default/locale')}\"")
+            shell_exec(root_command(f'update-locale LANG="{self.default_locale}.UTF-8"'))
+            shell_exec(root_command(f'update-locale LANG={self.default_locale}.UTF-8'))
 
     def list_timezones(self, continent=None):
         timezones = []
@@ -54,11 +56,11 @@ class LocaleInfo():
         return lan
 
     def refresh(self):
-        self.locales = getoutput("awk -F'[@. ]' '/UTF-8/{print $1}' /usr/share/i18n/SUPPORTED | uniq")
-        self.default_locale = getoutput("awk -F'[=.]' '/UTF-8/{print $2}' /etc/default/locale")[0]
-        self.available_locales = getoutput("locale -a | grep '_' | awk -F'[@ .]' '{print $1}'")
+        self.locales = getoutput(f"awk -F'[@. ]' '/UTF-8/{{print $1}}' \"{root_path('/usr/share/i18n/SUPPORTED')}\" | uniq")
+        self.default_locale = getoutput(f"awk -F'[=.]' '/UTF-8/{{print $2}}' \"{root_path('/etc/default/locale')}\"")[0]
+        self.available_locales = getoutput(root_command("locale -a") + " 2>/dev/null | grep '_' | awk -F'[@ .]' '{print $1}'")
         self.timezone_continents = self.list_timezones()
-        tz = getoutput("cat /etc/timezone 2>/dev/null")[0]
+        tz = getoutput(f"cat \"{root_path('/etc/timezone')}\" 2>/dev/null")[0]
         self.current_timezone_continent = dirname(tz)
         self.current_timezone = basename(tz)
 
@@ -80,8 +82,8 @@ class Localize(threading.Thread):
         self.timezone = timezone.strip()
         self.queue = queue
         self.user = getoutput("logname")[0]
-        self.user_dir = f"/home/{self.user}"
-        cmd = "awk -F'[=.]' '/UTF-8/{ print $2 }' /etc/default/locale"
+        self.user_dir = root_path(f"/home/{self.user}")
+        cmd = f"awk -F'[=.]' '/UTF-8/{{ print $2 }}' \"{root_path('/etc/default/locale')}\""
         self.current_default = getoutput(cmd)[0]
         self.script_dir = abspath(dirname(__file__))
         self.edition = 'all'
@@ -89,7 +91,7 @@ class Localize(threading.Thread):
         # Get configuration settings
         self.debian_version = get_debian_version()
         config = get_config_dict(join(self.script_dir, "solydxk-system.conf"))
-        self.debian_frontend = f"DEBIAN_FRONTEND={config.get('DEBIAN_FRONTEND', 'noninteractive')}"
+        self.apt_env = dict(os.environ, DEBIAN_FRONTEND=config.get('DEBIAN_FRONTEND', 'noninteractive'))
         self.apt_options = config.get('APT_OPTIONS_8', '')
         if self.debian_version == 0 or self.debian_version >= 9:
             self.apt_options = config.get('APT_OPTIONS_9', '')
@@ -102,62 +104,64 @@ class Localize(threading.Thread):
         self.max_steps = 10
         self.current_step = 0
 
+    @traced
     def run(self):
         self.set_locale()
         self.queue_progress()
-        shell_exec("apt-get update")
+        run_apt(['update'], self.queue_apt_progress, download_weight=1, env=self.apt_env)
         self.applications()
         self.language_specific()
 
     def set_locale(self):
         print((f" --> Set locale {self.default_locale}"))
         self.queue_progress()
+        locale_gen = root_path('/etc/locale.gen')
         # First, comment all languages
-        shell_exec("sed -i -e '/^[a-z]/ s/^#*/# /' /etc/locale.gen")
+        shell_exec(f"sed -i -e '/^[a-z]/ s/^#*/# /' \"{locale_gen}\"")
         # Loop through all locales
         for loc in self.locales:
             if loc[0]:
-                if has_string_in_file(loc[1], '/etc/locale.gen'):
+                if has_string_in_file(loc[1], locale_gen):
                     # Uncomment the first occurence of the locale
                     lan = loc[1].replace('.', r'\.')
-                    cmd = rf"sed -i '0,/^# *{lan}.UTF-8/{{s/^# *{lan}.UTF-8/{lan}.UTF-8/}}' /etc/locale.gen"
+                    cmd = rf"sed -i '0,/^# *{lan}.UTF-8/{{s/^# *{lan}.UTF-8/{lan}.UTF-8/}}' \"{locale_gen}\""
                     shell_exec(cmd)
                 else:
                     # Add the locale
-                    shell_exec(f'echo "{loc[1]}.UTF-8 UTF-8" >> /etc/locale.gen')
+                    shell_exec(f'echo "{loc[1]}.UTF-8 UTF-8" >> "{locale_gen}"')
 
                 # Save new default locale
                 if loc[3]:
                     self.default_locale = loc[1]
 
         # Check if at least one locale is set
-        locales = getoutput("awk -F'[@. ]' '{print $1}' < /etc/locale.gen | grep -v -E '^#|^$'")
+        locales = getoutput(f"awk -F'[@. ]' '{{print $1}}' < \"{locale_gen}\" | grep -v -E '^#|^$'")
         if locales[0] == '':
-            shell_exec(f'echo "{self.default_locale}.UTF-8 UTF-8" >> /etc/locale.gen')
+            shell_exec(f'echo "{self.default_locale}.UTF-8 UTF-8" >> "{locale_gen}"')
 
         cmd = f"echo '{self.timezone}' > /etc/timezone && " \
               f"rm /etc/localtime; ln -sf /usr/share/zoneinfo/{self.timezone} /etc/localtime && " \
               f"echo 'LANG={self.default_locale}.UTF-8' > /etc/default/locale && " \
               "dpkg-reconfigure --frontend=noninteractive locales && " \
               f"update-locale LANG={self.default_locale}.UTF-8"
-        shell_exec(cmd)
+        shell_exec(root_command(cmd))
 
         # Copy mo files for Grub if needed
         cmd = "mkdir -p /boot/grub/locale && " \
               "for F in $(find /usr/share/locale -name 'grub.mo'); do " \
               "MO=/boot/grub/locale/$(echo $F | cut -d'/' -f 5).mo; " \
               "cp -afuv $F $MO; done"
-        shell_exec(cmd)
+        shell_exec(root_command(cmd))
 
         # Cleanup old default grub settings
-        default_grub = '/etc/default/grub'
+        default_grub = root_path('/etc/default/grub')
         shell_exec(f"sed -i '/^# Set locale$/d' {default_grub} && " \
                    f"sed -i '/^LANG=/d' {default_grub} && " \
                    f"sed -i '/^LANGUAGE=/d' {default_grub} && " \
                    f"sed -i '/^GRUB_LANG=/d' {default_grub}")
 
         # Update Grub and make sure it uses the new locale
-        shell_exec(f'LANG={self.default_locale}.UTF-8 update-grub')
+        shell_exec(root_command(f'LANG={self.default_locale}.UTF-8 update-grub'))
 
         # Change user settings
         if exists(self.user_dir):
@@ -236,15 +240,13 @@ class Localize(threading.Thread):
                 packages = config.get(self.edition, '').strip()
                 if packages:
                     self.queue_progress()
-                    cmd = f'{self.debian_frontend} apt-get install {self.apt_options} {packages}'
-                    shell_exec(cmd)
+                    self.apt_install(packages)
             except Exception as detail:
                 msg = f'ERROR: {detail}'
                 print(msg)
 
     def applications(self):
         for loc in self.locales:
-            cmd_apt = f'{self.debian_frontend} apt-get install {self.apt_options}'
             locale = ''
             if loc[0]:
                 locale = loc[1]
@@ -257,7 +259,7 @@ class Localize(threading.Thread):
                 package = self.get_localized_package("kde-l10n", locale)
                 if package:
                     self.queue_progress()
-                    shell_exec(f'{cmd_apt} {package}')
+                    self.apt_install(package)
 
             # Localize LibreOffice
             if is_package_installed("libreoffice"):
@@ -265,11 +267,11 @@ class Localize(threading.Thread):
                 package = self.get_localized_package("libreoffice-l10n", locale)
                 if package:
                     self.queue_progress()
-                    shell_exec(f'{cmd_apt} libreoffice {package}')
+                    self.apt_install(f'libreoffice {package}')
                 package = self.get_localized_package("libreoffice-help", locale)
                 if package:
                     self.queue_progress()
-                    shell_exec(f'{cmd_apt} {package}')
+                    self.apt_install(package)
                 if not spellchecker:
                     package = self.get_localized_package("hunspell", locale)
                     if package == '':
@@ -277,7 +279,7 @@ class Localize(threading.Thread):
                     if package:
                         spellchecker = True
                         self.queue_progress()
-                        shell_exec(f'{cmd_apt} {package}')
+                        self.apt_install(package)
 
             # Localize AbiWord
             if is_package_installed("abiword"):
@@ -285,7 +287,7 @@ class Localize(threading.Thread):
                 package = self.get_localized_package("aspell", locale)
                 if package:
                     self.queue_progress()
-                    shell_exec(f'{cmd_apt} {package}')
+                    self.apt_install(package)
 
             # Localize Firefox
             firefox = "firefox"
@@ -300,7 +302,7 @@ class Localize(threading.Thread):
                 package = self.get_localized_package(f'firefox-{esr}l10n', locale)
                 if package:
                     self.queue_progress()
-                    shell_exec(f'{cmd_apt} {package} {firefox}')
+                    self.apt_install(f'{package} {firefox}')
                 if not spellchecker:
                     package = self.get_localized_package("hunspell", locale)
                     if package == '':
@@ -308,7 +310,7 @@ class Localize(threading.Thread):
                     if package:
                         spellchecker = True
                         self.queue_progress()
-                        shell_exec(f'{cmd_apt} {package}')
+                        self.apt_install(package)
 
             # Localize Thunderbird
             if is_package_installed("thunderbird"):
@@ -316,7 +318,7 @@ class Localize(threading.Thread):
                 package = self.get_localized_package("thunderbird-l10n", locale)
                 if package:
                     self.queue_progress()
-                    shell_exec(f'{cmd_apt} {package}')
+                    self.apt_install(package)
                 if not spellchecker:
                     package = self.get_localized_package("hunspell", locale)
                     if package == '':
@@ -324,7 +326,18 @@ class Localize(threading.Thread):
                     if package:
                         spellchecker = True
                         self.queue_progress()
-                        shell_exec(f'{cmd_apt} {package}')
+                        self.apt_install(package)
+
+    def apt_install(self, packages):
+        task = current_task()
+        if task is not None and task.cancelled:
+            return
+        run_apt(f'install {self.apt_options} {packages}', self.queue_apt_progress, env=self.apt_env)
+
+    def queue_apt_progress(self, progress):
+        # Scale the apt progress to the current step
+        progress['fraction'] = min((self.current_step + progress['fraction']) / self.max_steps, 1)
+        report_apt_progress(progress)
 
     def queue_progress(self):
         self.current_step += 1
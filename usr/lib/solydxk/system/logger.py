@@ -4,15 +4,86 @@ import os
 import pwd
 import logging
 import re
-import sys
-from shutil import move
-from dialogs import error_dialog
-from treeview import TreeViewHandler
+import atexit
+from queue import Queue, Empty, Full
+from threading import Thread, Lock
+from logging.handlers import QueueHandler
+from loghandlers import RotatingBatchFileHandler, JsonFormatter, GENERATIONS
+
+# Records waiting for the writer thread: debug records are dropped from QUEUE_SIZE,
+# other records wait for the writer up to QUEUE_FULL_TIMEOUT seconds at QUEUE_MAX_SIZE
+QUEUE_SIZE = 10000
+QUEUE_MAX_SIZE = 2 * QUEUE_SIZE
+QUEUE_FULL_TIMEOUT = 2
+# Records written before flushing the handlers
+BATCH_SIZE = 500
+
+
+class BoundedQueueHandler(QueueHandler):
+    """ QueueHandler for a queue of QUEUE_MAX_SIZE records:
+        debug records are dropped while the queue holds QUEUE_SIZE records,
+        other records make the caller wait for the writer up to QUEUE_FULL_TIMEOUT
+        seconds and are only dropped when the writer does not keep up """
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if record.levelno <= logging.DEBUG and self.queue.qsize() >= QUEUE_SIZE:
+            self.dropped += 1
+            return
+        try:
+            if self.dropped:
+                self.queue.put(logging.makeLogRecord({'name': 'log',
+                                                      'levelno': logging.WARNING,
+                                                      'levelname': 'WARNING',
+                                                      'msg': f"Log queue full: {self.dropped} messages dropped"}),
+                               timeout=QUEUE_FULL_TIMEOUT)
+                self.dropped = 0
+            self.queue.put(record, timeout=QUEUE_FULL_TIMEOUT)
+        except Full:
+            self.dropped += 1
+
+
+class LogListener(Thread):
+    """ Thread that writes the queued records in batches """
+    def __init__(self, queue, handlers):
+        super().__init__(name='LogListener', daemon=True)
+        self.queue = queue
+        self.handlers = handlers
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            for record in batch:
+                if record is None:
+                    stop = True
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+
+    def stop(self):
+        # Write what is still queued and end the thread
+        try:
+            self.queue.put(None, timeout=QUEUE_FULL_TIMEOUT)
+        except Full:
+            return
+        self.join(timeout=5)
 
 
 class Logger():
 
-    def __init__(self, logPath='', defaultLogLevel='debug', addLogTime=True, rtObject=None, parent=None, maxSizeKB=None):
+    def __init__(self, logPath='', defaultLogLevel='debug', addLogTime=True, rtObject=None, parent=None, maxSizeKB=None,
+                 generations=GENERATIONS, jsonFormat=False, showErrorDialogs=True):
         self.logPath = logPath
         if self.logPath != '':
             if self.logPath[:1] != '/':
@@ -22,19 +93,21 @@ class Logger():
         self.rtobject = rtObject
         self.typeString = self.getTypeString(self.rtobject)
         self.parent = parent
+        # Without a GUI (showErrorDialogs=False) Gtk is never imported
+        self.showErrorDialogs = showErrorDialogs
         self.maxSizeKB = maxSizeKB
+        self.tvHandler = None
+        self.rtMessages = []
+        self.rtLock = Lock()
 
+        consoleFormatter = logging.Formatter('%(levelname)-10s%(message)s')
+        handlers = []
         if self.logPath == '':
             # Log only to console
-            logging.basicConfig(level=self.defaultLevel, format='%(levelname)-10s%(message)s')
+            console = logging.StreamHandler()
+            console.setFormatter(consoleFormatter)
+            handlers.append(console)
         else:
-            if os.path.exists(self.logPath) and self.maxSizeKB is not None:
-                b = os.path.getsize(self.logPath)
-                if b > self.maxSizeKB * 1024:
-                    old = "%s.old" % self.logPath
-                    if os.path.exists(old):
-                        os.remove(old)
-                    move(self.logPath, "%s.old" % self.logPath)
             # Set basic configuration
             formatStr = '%(name)-30s%(levelname)-10s%(message)s'
             dateFmtStr = None
@@ -44,26 +117,53 @@ class Logger():
 
             # Log to file
             try:
-                logging.basicConfig(filename=self.logPath, level=self.defaultLevel, format=formatStr, datefmt=dateFmtStr)
+                # Rotated when it grows larger than maxSizeKB
+                fileHandler = RotatingBatchFileHandler(self.logPath, self.maxSizeKB, generations)
+                if jsonFormat:
+                    fileHandler.setFormatter(JsonFormatter())
+                else:
+                    fileHandler.setFormatter(logging.Formatter(formatStr, dateFmtStr))
+                handlers.append(fileHandler)
             except Exception:
                 # File is not writable: console only
-                logging.basicConfig(level=self.defaultLevel, format='%(levelname)-10s%(message)s')
+                pass
 
             # Define a Handler which writes INFO messages or higher to the console
             # Debug messages are written to a specified log file
             console = logging.StreamHandler()
-            console.setLevel(logging.INFO)
-            formatter = logging.Formatter('%(levelname)-10s%(message)s')
-            console.setFormatter(formatter)
-            logging.getLogger('').addHandler(console)
+            console.setLevel(logging.INFO if handlers else self.defaultLevel)
+            console.setFormatter(consoleFormatter)
+            handlers.append(console)
+
+        # Callers only put records on a bounded queue: the listener thread does the writing
+        self.queue = Queue(maxsize=QUEUE_MAX_SIZE)
+        self.queueHandler = BoundedQueueHandler(self.queue)
+        rootLogger = logging.getLogger('')
+        for handler in rootLogger.handlers[:]:
+            rootLogger.removeHandler(handler)
+        rootLogger.addHandler(self.queueHandler)
+        rootLogger.setLevel(self.defaultLevel)
+        self.listener = LogListener(self.queue, handlers)
+        self.listener.start()
+        atexit.register(self.close)
+
+    # Write the queued messages and stop the listener thread
+    def close(self):
+        if self.listener.is_alive():
+            self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
 
     # Write message
     # Use is_threaded=True when calling from a thread
-    def write(self, message, loggerName='log', logLevel='debug', showErrorDialog=True,  is_threaded=False):
+    # duration (seconds) is added to the record (JSON log format)
+    def write(self, message, loggerName='log', logLevel='debug', showErrorDialog=True,  is_threaded=False, duration=None):
         message = str(message).strip()
         if message != '':
             logLevel = logLevel.lower()
             myLogger = logging.getLogger(loggerName)
+            if duration is not None:
+                myLogger = logging.LoggerAdapter(myLogger, {'duration': duration})
             if logLevel == 'debug':
                 myLogger.debug(message)
             elif logLevel == 'info':
@@ -75,38 +175,59 @@ class Logger():
             elif logLevel == 'error':
                 myLogger.error(message)
                 self.rtobjectWrite(message)
-                if showErrorDialog:
-                    error_dialog(title='Error', text=message, is_threaded=is_threaded)
+                if showErrorDialog and self.showErrorDialogs:
+                    self.errorDialog('Error', message, is_threaded)
             elif logLevel == 'critical':
                 myLogger.critical(message)
                 self.rtobjectWrite(message)
-                if showErrorDialog:
-                    error_dialog(title='Critical', text=message, is_threaded=is_threaded)
+                if showErrorDialog and self.showErrorDialogs:
+                    self.errorDialog('Critical', message, is_threaded)
             elif logLevel == 'exception':
                 myLogger.exception(message)
                 self.rtobjectWrite(message)
-                if showErrorDialog:
-                    error_dialog(title='Exception', text=message, is_threaded=is_threaded)
-            # Flush now
-            sys.stdout.flush()
+                if showErrorDialog and self.showErrorDialogs:
+                    self.errorDialog('Exception', message, is_threaded)
+
+    def errorDialog(self, title, message, is_threaded):
+        from dialogs import error_dialog
+        error_dialog(title=title, text=message, is_threaded=is_threaded)
 
     # Return messge to given object
+    # Messages are collected and shown in one go from the GTK main loop
     def rtobjectWrite(self, message):
         if self.rtobject is not None and self.typeString != '':
-            if 'label' in self.typeString.lower():
-                self.rtobject.set_text(message)
-            elif 'treeview' in self.typeString.lower():
-                tvHandler = TreeViewHandler(self.rtobject)
-                tvHandler.fillTreeview(contentList=[message],
-                                       columnTypesList=['str'],
-                                       appendToExisting=True,
-                                       appendToTop=True,
-                                       fontSize=10000)
-            elif 'statusbar' in self.typeString.lower():
-                self.pushMessage(message)
-            else:
-                # For obvious reasons: do not log this...
-                print(('Return object type not implemented: %s' % self.typeString))
+            with self.rtLock:
+                self.rtMessages.append(message)
+                if len(self.rtMessages) > 1:
+                    # Already scheduled
+                    return
+            from gi.repository import GLib
+            GLib.idle_add(self.rtobjectFlush)
+
+    def rtobjectFlush(self):
+        with self.rtLock:
+            messages = self.rtMessages
+            self.rtMessages = []
+        if not messages:
+            return False
+        if 'label' in self.typeString.lower():
+            self.rtobject.set_text(messages[-1])
+        elif 'treeview' in self.typeString.lower():
+            if self.tvHandler is None:
+                from treeview import TreeViewHandler
+                self.tvHandler = TreeViewHandler(self.rtobject)
+            # Newest message on top
+            self.tvHandler.fillTreeview(contentList=messages,
+                                        columnTypesList=['str'],
+                                        appendToExisting=True,
+                                        appendToTop=True,
+                                        fontSize=10000)
+        elif 'statusbar' in self.typeString.lower():
+            self.pushMessage(messages[-1])
+        else:
+            # For obvious reasons: do not log this...
+            print(('Return object type not implemented: %s' % self.typeString))
+        return False
 
     # Return the type string of a object
     def getTypeString(self, object):
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+""" Log handlers shared by the Logger and the ddm scripts.
+    The log is rotated with gzip compressed generations: log.1.gz (newest) ... log.N.gz
+
+    Rotate from a shell script: python3 loghandlers.py /var/log/solydxk-system.log
+"""
+
+import os
+import sys
+import gzip
+import json
+import fcntl
+import logging
+from shutil import copyfileobj
+from datetime import datetime
+from os.path import join, abspath, dirname, exists
+from utils import get_config_dict
+
+# Defaults when solydxk-system.conf does not set LOG_MAX_SIZE_KB, LOG_GENERATIONS and LOG_FORMAT
+MAX_SIZE_KB = 5120
+GENERATIONS = 5
+CONF_FILE = join(abspath(dirname(__file__)), 'solydxk-system.conf')
+
+
+def get_log_config(conf_file=CONF_FILE):
+    """ Return dictionary {max_size_kb, generations, json} from the configuration file """
+    config = {}
+    if exists(conf_file):
+        config = get_config_dict(conf_file)
+    try:
+        max_size_kb = int(config.get('LOG_MAX_SIZE_KB', MAX_SIZE_KB))
+        generations = int(config.get('LOG_GENERATIONS', GENERATIONS))
+    except ValueError:
+        max_size_kb = MAX_SIZE_KB
+        generations = GENERATIONS
+    return {'max_size_kb': max_size_kb,
+            'generations': generations,
+            'json': config.get('LOG_FORMAT', 'text').lower() == 'json'}
+
+
+def rotate_log(path, max_size_kb=MAX_SIZE_KB, generations=GENERATIONS, force=False):
+    """ Compress path to path.1.gz when it is larger than max_size_kb and truncate it.
+        The file is truncated (not moved) so processes that append to it keep logging.
+        Returns True when the log was rotated. """
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return False
+    try:
+        # Only one process rotates at a time
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if not force and os.fstat(fd).st_size <= max_size_kb * 1024:
+            return False
+        if generations > 0:
+            if exists(f"{path}.{generations}.gz"):
+                os.remove(f"{path}.{generations}.gz")
+            for i in range(generations - 1, 0, -1):
+                if exists(f"{path}.{i}.gz"):
+                    os.replace(f"{path}.{i}.gz", f"{path}.{i + 1}.gz")
+            with open(fd, mode='rb', closefd=False) as log_fle, \
+                 gzip.open(f"{path}.1.gz", mode='wb') as gz_fle:
+                log_fle.seek(0)
+                copyfileobj(log_fle, gz_fle)
+        os.ftruncate(fd, 0)
+        # Uncompressed copies of the previous rotation schemes
+        for old in (f"{path}.old", f"{path}.1"):
+            if exists(old):
+                os.remove(old)
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+class BatchFileHandler(logging.FileHandler):
+    """ FileHandler that leaves flushing to the listener (once per batch) """
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class RotatingBatchFileHandler(BatchFileHandler):
+    """ BatchFileHandler that checks the file size after each flush
+        (lines appended by the ddm scripts are counted too) """
+    def __init__(self, filename, maxSizeKB=MAX_SIZE_KB, generations=GENERATIONS):
+        super().__init__(filename)
+        self.maxSizeKB = maxSizeKB
+        self.generations = generations
+
+    def flush(self):
+        super().flush()
+        if self.stream is None or not self.maxSizeKB:
+            return
+        try:
+            size = os.fstat(self.stream.fileno()).st_size
+        except (OSError, ValueError):
+            return
+        if size > self.maxSizeKB * 1024:
+            # The stream appends: after truncating it writes at the start of the file
+            rotate_log(self.baseFilename, self.maxSizeKB, self.generations)
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line: time, level, thread, operation, message and duration (seconds) """
+    def format(self, record):
+        entry = {'time': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+                 'level': record.levelname,
+                 'thread': record.threadName,
+                 'operation': record.name,
+                 'message': record.getMessage()}
+        duration = getattr(record, 'duration', None)
+        if duration is not None:
+            entry['duration'] = round(duration, 6)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} log_file")
+        sys.exit(1)
+    log_config = get_log_config()
+    rotate_log(sys.argv[1], log_config['max_size_kb'], log_config['generations'])
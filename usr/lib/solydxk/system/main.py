@@ -2,9 +2,10 @@
 # -OO: Turn on basic optimizations.  Given twice, causes docstrings to be discarded.
 
 import sys
+import atexit
 import argparse
 import traceback
-from utils import compare_package_versions, VersionComparison
+from utils import compare_package_versions, VersionComparison, SUBPROCESS_STATS
 from dialogs import error_dialog
 from solydxk_system import SolydXKSystemSettings
 
@@ -17,6 +18,10 @@ from gi.repository import Gtk, GObject
 # Handle arguments
 parser = argparse.ArgumentParser(description="SolydXK System")
 parser.add_argument('-n', '--nosplash', action="store_true", help='No startup splash.')
+parser.add_argument('--profile', nargs='?', const='/var/log/solydxk-system-trace.json', metavar='FILE',
+                    help='Write operation timings as Chrome trace events to FILE.')
+parser.add_argument('--stats', action="store_true",
+                    help='Print the slowest and most frequent commands on exit.')
 args, extra = parser.parse_known_args()
 nosplash = args.nosplash
 
@@ -39,6 +44,9 @@ def uncaught_excepthook(*args):
 
 sys.excepthook = uncaught_excepthook
 
+if args.stats:
+    atexit.register(lambda: print(SUBPROCESS_STATS.format_summary()))
+
 if __name__ == '__main__':
     # Create an instance of our GTK application
     try:
@@ -52,7 +60,7 @@ if __name__ == '__main__':
         no_splash = False
         if nosplash:
             no_splash = True
-        SolydXKSystemSettings(nosplash=no_splash)
+        SolydXKSystemSettings(nosplash=no_splash, profile=args.profile)
         Gtk.main()
     except KeyboardInterrupt:
         pass
@@ -4,9 +4,12 @@
 # https://wiki.ubuntu.com/Plymouth
 
 import re
-from os.path import exists, isfile
-from shutil import which
-from utils import getoutput, shell_exec
+from glob import glob
+from os import environ, pathsep, defpath
+from os.path import exists, isfile, relpath
+from shutil import which, copyfile
+from utils import getoutput, shell_exec, traced, get_current_aspect_ratio, \
+                  root_path, root_command, get_root
 from grub import Grub
 
 # i18n: http://docs.python.org/3/library/gettext.html
@@ -20,16 +23,20 @@ class Plymouth():
         self.grub = Grub(self.log)
         self.avl_themes_search_str = '^plymouth-theme'
         try:
-            self.set_theme_path = which('plymouth-set-default-theme')
+            # Search PATH in the configured root and keep the path on the target system
+            search_path = pathsep.join(root_path(path) for path in environ.get('PATH', defpath).split(pathsep))
+            self.set_theme_path = which('plymouth-set-default-theme', path=search_path)
+            if self.set_theme_path:
+                self.set_theme_path = '/' + relpath(self.set_theme_path, get_root())
         except:
             self.set_theme_path = None
-        self.modules_path = '/etc/initramfs-tools/modules'
+        self.modules_path = root_path('/etc/initramfs-tools/modules')
 
     # Get a list of installed Plymouth themes
     def installed_themes(self):
         if self.set_theme_path:
             cmd = f'{self.set_theme_path} --list'
-            return getoutput(cmd)
+            return getoutput(root_command(cmd))
         return []
 
     def is_plymouth_booted(self):
@@ -41,7 +48,7 @@ class Plymouth():
         # Check grub.cfg
         match = re.search(r'\/.*=[0-9a-z\-]+', cmdline)
         if match:
-            if exists(self.grub.grub_cfg):
+            if self.grub.grub_cfg and exists(self.grub.grub_cfg):
                 grubcfg_splash = getoutput(f'grep "{match.group(0)}" "{self.grub.grub_cfg}" | grep " splash"')[0]
                 if grubcfg_splash:
                     return True
@@ -53,7 +60,7 @@ class Plymouth():
             return None
         if self.set_theme_path and \
            self.is_plymouth_booted():
-            return getoutput(self.set_theme_path)[0]
+            return getoutput(root_command(self.set_theme_path))[0]
         return None
 
     # Get a list of Plymouth themes in the repositories that can be installed
@@ -102,6 +109,7 @@ class Plymouth():
         return self.grub.resolution
 
     # Save theme
+    @traced
     def save(self, theme):
         if not self.set_theme_path:
             self.write_log('Plymouth not installed - exiting', 'warning')
@@ -124,8 +132,42 @@ class Plymouth():
         # Set the theme and update initramfs
         if str(theme) != 'None':
             self.write_log(f"Set theme: {theme}")
-            shell_exec(f"{self.set_theme_path} -R {theme}")
+            shell_exec(root_command(f"{self.set_theme_path} -R {theme}"))
 
     def write_log(self, message, level='debug'):
         if self.log is not None:
             self.log.write(message, 'Plymouth', level)
+
+
+# Save the boot splash: desktop theme, Grub, Plymouth and LightDM
+def save_boot_splash(plymouth, lightdm, plymouth_theme, grub_theme, resolution):
+    splash = str(plymouth_theme) != 'None'
+
+    # Update alternatives
+    search_dir = root_path('/usr/share/desktop-base')
+    desktop_themes = glob(fr'{search_dir}/{grub_theme}*/')
+    desktop_theme = ''
+    if not desktop_themes:
+        desktop_themes = glob(fr'{search_dir}/{plymouth_theme}*/')
+    if desktop_themes:
+        desktop_theme = desktop_themes[0].rstrip("/").replace(search_dir, '/usr/share/desktop-base', 1)
+        shell_exec(root_command(rf'update-alternatives --set desktop-theme {desktop_theme}'))
+
+    # Change Grub and Plymouth background images according to screen resolution
+    ratio = get_current_aspect_ratio()
+    # Grub
+    src = root_path(f"{desktop_theme}/grub/grub-16x9.png")
+    dst = root_path(f"/usr/share/grub/themes/{grub_theme}/bg.png")
+    if ratio == '4:3':
+        src = root_path(f"{desktop_theme}/grub/grub-4x3.png")
+    if exists(src) and exists(dst):
+        copyfile(src, dst)
+
+    #Plymouth
+    dst = root_path(f"/usr/share/plymouth/themes/{plymouth_theme}/bg.png")
+    if exists(src) and exists(dst):
+        copyfile(src, dst)
+
+    plymouth.grub.save(grub_theme, resolution, splash)
+    plymouth.save(plymouth_theme)
+    lightdm.save(plymouth_theme)
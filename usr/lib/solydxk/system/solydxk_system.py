@@ -1,32 +1,35 @@
 #!/usr/bin/env python3
 
 import os
-import re
-import shutil
-from glob import glob
-from queue import Queue
 # abspath, dirname, join, expanduser, exists, basename
 from os.path import join, abspath, dirname, isdir, exists, basename
-from threading import Thread
+from threading import Lock
 from localize import LocaleInfo, Localize
 from udisks2 import Udisks2
 from logger import Logger
+from loghandlers import get_log_config
 from treeview import TreeViewHandler
 from combobox import ComboBoxHandler
-from utils import getoutput, ExecuteThreadedCommands, \
+from utils import getoutput, run_apt_commands, \
                   shell_exec, human_size, has_internet_connection, \
                   get_debian_name, in_virtual_box, get_apt_force, is_running_live, \
-                  get_device_from_uuid, get_label, is_package_installed, \
-                  get_logged_user, get_uuid, compare_package_versions, VersionComparison, \
+                  get_label, is_package_installed, \
+                  get_logged_user, get_uuid, \
                   get_current_resolution, get_resolutions, is_xfce_running, \
-                  is_process_running, has_value_in_multi_array, get_current_aspect_ratio
+                  is_process_running, has_value_in_multi_array, \
+                  MountSnapshot, clear_grub_cache, DpkgSelections, traced, TRACER, SUBPROCESS_STATS, \
+                  run_apt, NotifyQueue, TaskRunner, TaskProgress, report_apt_progress, current_task, \
+                  root_path
 from dialogs import message_dialog, question_dialog, InputDialog, \
                     warning_dialog
 from apt_sources import Apt
-from encryption import is_encrypted, create_keyfile, write_crypttab, \
-                       connect_block_device, cleanup_passphrase
+from fstab import FstabModel, CrypttabModel, uuid_device_index, resolve_uuid, save_models
+from encryption import is_encrypted, create_keyfile, update_crypttab, \
+                       connect_block_device, connect_block_devices, cleanup_passphrase
+from cleanup import get_cleanup_candidates, get_archives_size
+from hardware import detect_hardware, get_driver_changes
 from endecrypt_partitions import EnDecryptPartitions, ChangePassphrase
-from plymouth import Plymouth
+from plymouth import Plymouth, save_boot_splash
 from grub import Grub
 from splash import Splash
 from lightdm import LightDM
@@ -35,17 +38,19 @@ from lightdm import LightDM
 import gi
 gi.require_version('Gtk', '3.0')
 # from gi.repository import Gtk, GdkPixbuf, GObject, Pango, Gdk
-from gi.repository import Gtk, GLib
+from gi.repository import Gtk, Gdk, GLib
 
 # i18n: http://docs.python.org/3/library/gettext.html
 import gettext
 _ = gettext.translation('solydxk-system', fallback=True).gettext
 
 TMPMOUNT = '/mnt/solydxk-system'
+# Cancel a hanging apt-get update after 15 minutes
+APT_UPDATE_TIMEOUT = 900
 
 class SolydXKSystemSettings():
     """class for the main window"""    
-    def __init__(self, nosplash=False):
+    def __init__(self, nosplash=False, profile=None):
         # Load and install test data for the device manager
         self.test_devices = False
 
@@ -67,7 +72,11 @@ class SolydXKSystemSettings():
 
         # Init logging
         self.log_file = "/var/log/solydxk-system.log"
-        self.log = Logger(self.log_file, addLogTime=True, maxSizeKB=5120)
+        log_config = get_log_config(join(self.script_dir, 'solydxk-system.conf'))
+        self.log = Logger(self.log_file, addLogTime=True, maxSizeKB=log_config['max_size_kb'],
+                          generations=log_config['generations'], jsonFormat=log_config['json'])
+        # Operation timings to the log (and a trace event file with --profile)
+        TRACER.configure(self.log, profile)
         sep_line = '=' * 35
         self.log.write(sep_line, 'init')
         self.log.write(f'>>> Start {self.title} <<<', 'init')
@@ -91,6 +100,7 @@ class SolydXKSystemSettings():
         self.btnHoldback = builder("btnHoldback")
         self.tvHoldback = builder("tvHoldback")
         self.tvAvailable = builder("tvAvailable")
+        self.txtSearchAvailable = builder("txtSearchAvailable")
         self.tvLocale = builder("tvLocale")
         self.tvPartitions = builder("tvPartitions")
         self.lblLocaleUserInfo = builder("lblLocaleUserInfo")
@@ -117,6 +127,7 @@ class SolydXKSystemSettings():
         self.btnSaveDeviceDriver = builder("btnSaveDeviceDriver")
         self.btnHelpDeviceDriver = builder("btnHelpDeviceDriver")
         self.chkBackportsDeviceDriver = builder("chkBackportsDeviceDriver")
+        self.btnCancelTask = builder("btnCancelTask")
         self.swSplash = builder("swSplash")
         self.tvSplash = builder("tvSplash")
         self.swGrub = builder("swGrub")
@@ -127,6 +138,7 @@ class SolydXKSystemSettings():
 
         # GUI translations
         builder("btnLogDeviceDriver").set_label(_("View log"))
+        self.btnCancelTask.set_label(_("Cancel"))
         self.btnSaveBackports.set_label(_("Save backports"))
         self.btnSaveMirrors.set_label(_("Save mirrors"))
         self.btnRemoveHoldback.set_label(_("Remove"))
@@ -155,6 +167,7 @@ class SolydXKSystemSettings():
         builder("lblHoldback").set_label(_("Hold back packages"))
         builder("lblHoldbackText").set_label(_("Held back packages"))
         builder("lblAvailableText").set_label(_("Available packages"))
+        self.txtSearchAvailable.set_placeholder_text(_("Search packages"))
         builder("lblHoldbackInfo").set_label(_("Hold back individual packages.\n"
                                           "Holding back a package will prevent this package from being updated."))
         self.btnSaveLocale.set_label(_("Save locale"))
@@ -168,7 +181,9 @@ class SolydXKSystemSettings():
         builder("lblCleanupInfo").set_label(_("Remove unneeded packages\n"
                                           "Pre-selected packages are safe to remove (autoremove).\n"
                                           "Other packages: remove with caution!"))
-        builder("lblCleanupText").set_label(_("Unneeded packages"))
+        self.lblCleanupText = builder("lblCleanupText")
+        self.cleanup_text = _("Unneeded packages")
+        self.lblCleanupText.set_label(self.cleanup_text)
         builder("lblFstabMounts").set_label(_("Fstab mounts"))
         builder("lblCurrentFstabMounts").set_label(_("Fstab mounts"))
         builder("lblFstabMountsInfo").set_label(_("Mount additional partitions on boot with Fstab.\n"
@@ -195,6 +210,7 @@ class SolydXKSystemSettings():
         self.tvLocaleHandler.connect('checkbox-toggled', self.on_tvLocale_toggled)
         self.tvPartitionsHandler = TreeViewHandler(self.tvPartitions)
         self.tvCleanupHandler = TreeViewHandler(self.tvCleanup)
+        self.tvCleanupHandler.connect('checkbox-toggled', self.on_tvCleanup_toggled)
         self.tvFstabMountsHandler = TreeViewHandler(self.tvFstabMounts)
         self.cmbTimezoneContinentHandler = ComboBoxHandler(self.cmbTimezoneContinent)
         self.cmbTimezoneHandler = ComboBoxHandler(self.cmbTimezone)
@@ -207,12 +223,19 @@ class SolydXKSystemSettings():
         self.cmbSplashResolutionHandler = ComboBoxHandler(self.cmbSplashResolution)
 
         # Initialize
-        self.queue = Queue(-1)
-        self.threads = {}
+        self.queue = NotifyQueue(-1, notify=self.wake_up)
+        self.wake_up_lock = Lock()
+        self.wake_up_pending = False
+        self.runner = TaskRunner(max_workers=2)
+        self.tasks = {}
+        self.task_progress = {}
         self.exclude_suites = ['backports', 'security', 'updates']
         self.current_debian_repo = ''
         self.holdback = []
         self.available = []
+        self.selections = None
+        self.cleanup_candidates = []
+        self.archives_size = 0
         self.locales = []
         self.new_default_locale = ''
         self.partitions = []
@@ -221,7 +244,7 @@ class SolydXKSystemSettings():
         self.html_dir = join(self.share_dir, 'html')
         self.help_file = join(self.language_dir(), 'help.html')
         self.helpdd_file = join(self.language_dir(), 'helpdd.html')
-        self.udisks2 = Udisks2()
+        self._udisks2 = None
         self.keyfile_path = None
         self.debian_name = get_debian_name()
         self.encrypt_col_types = ['GdkPixbuf.Pixbuf', 'str', 'str', 'str', 'str', 'str', 'str']
@@ -291,6 +314,13 @@ class SolydXKSystemSettings():
         if not self.live:
             self.fill_treeview_fstab_partitions()
 
+    @property
+    def udisks2(self):
+        # UDisks is loaded when the partitions are first listed
+        if self._udisks2 is None:
+            self._udisks2 = Udisks2()
+        return self._udisks2
+
     # ===============================================
     # Main window functions
     # ===============================================
@@ -307,6 +337,10 @@ class SolydXKSystemSettings():
     def on_btnRemoveHoldback_clicked(self, widget):
         self.remove_holdback()
 
+    def on_txtSearchAvailable_search_changed(self, widget):
+        # Emitted by Gtk.SearchEntry after a short typing delay
+        self.tvAvailableHandler.filterRows(widget.get_text())
+
     def on_btnHoldback_clicked(self, widget):
         self.add_holdback()
 
@@ -391,6 +425,7 @@ class SolydXKSystemSettings():
     # Fstab mount functions
     # ===============================================
 
+    @traced
     def fill_treeview_fstab_partitions(self):
         fs_partitions = []
 
@@ -413,18 +448,19 @@ class SolydXKSystemSettings():
                                                firstItemIsColName=True,
                                                fontSize=12000)
 
+    @traced
     def save_fstab_mounts(self):
         changed = False
         fix_virtualbox = False
-        fstab_path = '/etc/fstab'
-        crypttab_path = '/etc/crypttab'
+        fstab_path = root_path('/etc/fstab')
+        crypttab_path = root_path('/etc/crypttab')
         crypttab_keyfile_path = '/.lukskey'
 
         self.set_buttons_state(False)
 
-        fstab_cont = []
-        with open(file=fstab_path, mode='r', encoding='utf-8') as crypttab_fle:
-            fstab_cont = crypttab_fle.readlines()
+        # Collect all changes first and write each file only once
+        fstab_model = FstabModel(fstab_path)
+        crypttab_model = CrypttabModel(crypttab_path)
 
         # Loop through the partitions
         model = self.tvFstabMounts.get_model()
@@ -466,14 +502,14 @@ class SolydXKSystemSettings():
                             # Make current user owner of the mount
                             shell_exec(f'chown {usr}:{usr} {mount}')
 
-                    # Create new line for fstab
+                    # Create new entry for fstab
                     uuid = f'UUID={uuid}' if uuid and not encrypted else device
                     fsck = 0 if fs_type in ('ntfs', 'swap', 'vfat') else 1 if mount == '/' else 2
                     opts = 'defaults,noatime' if 'ext' in fs_type else 'sw' if fs_type == 'swap' else 'defaults'
-                    new_line = f'{uuid}\t{mount}\t{fs_type}\t{opts}\t0\t{fsck}\n'
-                    fstab_cont.append(new_line)
+                    entry = fstab_model.add(uuid, mount, fs_type, opts, 0, fsck)
                     changed = True
-                    self.log.write(f'Add new line to {fstab_path}: {new_line}', 'save_fstab_mounts')
+                    self.log.write(f"Add new line to {fstab_path}: {' '.join(entry.fields())}",
+                                   'save_fstab_mounts')
 
                     if encrypted:
                         fix_virtualbox = True
@@ -490,15 +526,15 @@ class SolydXKSystemSettings():
                             # Write keyfile
                             self.log.write(f'Add device to key file {crypttab_keyfile_path}: {enc_device}',
                                            'save_fstab_mounts', 'info')
-                            create_keyfile(crypttab_keyfile_path, enc_device, passphrase)
+                            create_keyfile(root_path(crypttab_keyfile_path), enc_device, passphrase)
                         else:
                             crypttab_keyfile_path = 'none'
 
                         # Write crypttab
                         self.log.write(f'Add device to crypttab {crypttab_path}: {enc_device}',
                                        'save_fstab_mounts', 'info')
-                        write_crypttab(enc_device, fs_type, crypttab_path,
-                                       crypttab_keyfile_path, not encrypted)
+                        update_crypttab(crypttab_model, enc_device, fs_type,
+                                        crypttab_keyfile_path, not encrypted)
                 else:
                     # We should not get here
                     msg = _(f"Could not add {device} to {fstab_path}: missing fs type.")
@@ -507,32 +543,18 @@ class SolydXKSystemSettings():
                     continue
             elif not selected and fstab_mount:
                 # Remove partition line from fstab
-                for i, line in enumerate(fstab_cont):
-                    if (uuid in line or device in line) and \
-                        mount in line:
-                        self.log.write(f'Remove device from {fstab_path}: {device}',
-                                       'save_fstab_mounts', 'info')
-                        del fstab_cont[i]
-                        changed = True
-                        break
+                entry = fstab_model.find(uuid=uuid, device=device)
+                if entry:
+                    self.log.write(f'Remove device from {fstab_path}: {device}',
+                                   'save_fstab_mounts', 'info')
+                    fstab_model.remove(entry)
+                    changed = True
                 # Remove partition from crypttab
                 if encrypted and exists(crypttab_path):
                     enc_device = device.replace('/mapper', '')
-                    enc_device_uuid = get_uuid(enc_device)
-                    #print(("+++ {} exists for device {}".format(crypttab_path, enc_device)))
-                    crypttab_cont = []
-                    with open(file=crypttab_path, mode='r', encoding='utf-8') as crypttab_fle:
-                        crypttab_cont = crypttab_fle.readlines()
-                    #print(("   {}".format(''.join(crypttab_cont))))
-                    for i, line in enumerate(crypttab_cont):
-                        #print(("+++ '{}' or '{}' exists '{}'".format(enc_device, enc_device_uuid, line)))
-                        if enc_device in line or enc_device_uuid in line:
-                            self.log.write(f'Remove device from crypttab {crypttab_path}: {enc_device}',
-                                           'save_fstab_mounts', 'info')
-                            del crypttab_cont[i]
-                            with open(file=crypttab_path, mode='w', encoding='utf-8') as crypttab_fle:
-                                crypttab_fle.write(''.join(crypttab_cont))
-                            break
+                    self.log.write(f'Remove device from crypttab {crypttab_path}: {enc_device}',
+                                   'save_fstab_mounts', 'info')
+                    crypttab_model.remove(device=enc_device, uuid=get_uuid(enc_device))
 
             # Get the next in line
             itr = model.iter_next(itr)
@@ -546,16 +568,16 @@ class SolydXKSystemSettings():
                     shell_exec(f"sed -i 's/ *splash *//g' {self.grub.grub_default}")
                     shell_exec(f"sed -i 's/ *splash *//g' {self.grub.grub_cfg}")
 
-        if changed:
-            # Save fstab
-            with open(file=fstab_path, mode='w', encoding='utf-8') as crypttab_fle:
-                crypttab_fle.write(''.join(fstab_cont))
-
+        errors = save_models([fstab_model, crypttab_model])
+        if errors:
+            msg = _("Could not save fstab:") + '\n' + '\n'.join(errors)
+            self.log.write(msg, 'save_fstab_mounts', 'error')
+            warning_dialog(self.btnSaveFstabMounts.get_label(), msg)
+        elif changed:
             # Log fstab and crypttab
-            self.log.write(''.join(fstab_cont), 'save_fstab_mounts', 'info')
+            self.log.write(fstab_model.content(), 'save_fstab_mounts', 'info')
             if exists(crypttab_path):
-                with open(file=crypttab_path, mode='r', encoding='utf-8') as crypttab_fle:
-                    self.log.write(crypttab_fle.read(), 'save_fstab_mounts', 'info')
+                self.log.write(crypttab_model.content(), 'save_fstab_mounts', 'info')
 
             # Show a message
             msg = _("Changes were made to fstab.\n"
@@ -572,98 +594,89 @@ class SolydXKSystemSettings():
     # ===============================================
 
     def install_device_drivers(self):
-        # Save selected hardware
-        arguments = []
-
+        # Compare the selected state with the installed state:
+        # this decides whether we should install or purge the drivers
+        install = []
+        purge = []
         model = self.tvDeviceDriver.get_model()
         itr = model.get_iter_first()
         while itr is not None:
-            action = 'no change'
             selected = model.get_value(itr, 0)
             device = model.get_value(itr, 2)
-            manufacturer_id = ''
-
-            # Check currently selected state with initial state
-            # This decides whether we should install or purge the drivers
-            for hardware in self.hardware[1:]:
-                self.log.write(f'Device = {device} in {hardware[2]}', 'install_device_drivers')
-                if device in hardware[2]:
-                    hw_driver = hardware[3]
-                    manufacturer_id = hardware[4]
-                    if hardware[0] and not selected:
-                        action = 'purge'
-                    elif not hardware[0] and selected:
-                        action = 'install'
+            for hardware in self.hardware:
+                if device in hardware['name']:
+                    if hardware['installed'] and not selected:
+                        purge.append(hardware)
+                        self.log.write(f"purge: {device} ({hardware['vendor']})", 'install_device_drivers')
+                    elif not hardware['installed'] and selected:
+                        install.append(hardware)
+                        self.log.write(f"install: {device} ({hardware['vendor']})", 'install_device_drivers')
                     break
+            itr = model.iter_next(itr)
+
+        if not install and not purge:
+            return
+        if install and not has_internet_connection():
+            title = _("No internet connection")
+            msg = _("You need an internet connection to install the additional software.\n"
+                    "Please, connect to the internet and try again.")
+            warning_dialog(title, msg)
+            return
 
-            self.log.write(f'{action}: {device} ({manufacturer_id})', 'install_device_drivers')
-
-            # Install/purge selected driver
-            option = ''
-            if action == 'install':
-                option = '-i'
-            elif action == 'purge':
-                option = '-p'
-
-            if option:
-                driver = ''
-                # Run the manufacturer specific bash script
-                if manufacturer_id == '1002':
-                    driver = 'amd'
-                elif manufacturer_id == '10de':
-                    driver = 'nvidia '
-                    # If nvidia-detect needs a drivers from the backports repository
-                    # and the user didn't select the backports check box,
-                    # force the use of backports to install the appropriate drivers
-                    if 'backports' in hw_driver and not self.chkBackports.get_active():
-                        option = f"-b {option}"
-                elif manufacturer_id == '14e4':
-                    driver = 'broadcom '
-                elif 'pae' in manufacturer_id:
-                    driver = 'pae '
-                if driver:
-                    arguments.append(f"{option} {driver}")
+        # Warn for use of Backports
+        use_backports = False
+        if install and self.chkBackportsDeviceDriver.get_active():
+            answer = question_dialog(self.chkBackportsDeviceDriver.get_label(),
+                    _("You have selected to install drivers from the backports repository whenever they are available.\n\n"
+                      "Although you can run more up to date software using the backports repository,\n"
+                      "you introduce a greater risk of breakage doing so.\n\n"
+                      "Are you sure you want to continue?"))
+            if not answer:
+                self.chkBackportsDeviceDriver.set_active(False)
+                return True
+            use_backports = True
+        # The driver support database (or nvidia-detect) says the packages need backports
+        if any(hardware['backports'] or 'backports' in ' '.join(hardware['packages']) for hardware in install):
+            use_backports = True
+        backports = self.apt.get_repo_suite('backports') if use_backports else ''
+
+        # All package changes in one apt transaction
+        changes = get_driver_changes(install, purge, user=get_logged_user())
+        self.log.write(f"Driver changes: {changes}", 'install_device_drivers', 'info')
+
+        # Run driver installation in a thread and show progress
+        name = 'driver'
+        self.set_buttons_state(False)
+        self.start_task(name, self.run_driver_transaction, changes, backports, cancellable=False)
+
+    @traced
+    def run_driver_transaction(self, changes, backports=''):
+        # Runs in a thread: apt progress is put on the queue
+        # Interactive debconf questions in a GUI frontend (like ddm -g)
+        env = dict(os.environ, DEBIAN_FRONTEND='gnome')
+        if not self.test_devices:
+            for selection in changes['debconf']:
+                shell_exec(f"echo '{selection}' | debconf-set-selections")
+            if changes['install']:
+                run_apt(['update'], report_apt_progress, download_weight=1, env=env)
+            if current_task().cancelled:
+                return
+            for cmd in changes['pre']:
+                shell_exec(cmd)
 
-            # Get the next in line
-            itr = model.iter_next(itr)
+        # Install and purge (package name followed by -) at once
+        arguments = ['install', '--purge'] + get_apt_force().split()
+        if backports:
+            arguments += ['-t', backports]
+        if self.test_devices:
+            arguments.append('--simulate')
+        arguments += changes['install'] + [f'{package}-' for package in changes['purge']]
+        returncode = run_apt(arguments, report_apt_progress, env=env)
+        self.log.write(f"apt-get returned: {returncode}", 'run_driver_transaction')
 
-        # Execute the command
-        if arguments:
-            if '-i' in arguments and not has_internet_connection:
-                title = _("No internet connection")
-                msg = _("You need an internet connection to install the additional software.\n"
-                        "Please, connect to the internet and try again.")
-                warning_dialog(title, msg)
-            else:
-                # Warn for use of Backports
-                if self.chkBackportsDeviceDriver.get_active():
-                    answer = question_dialog(self.chkBackportsDeviceDriver.get_label(),
-                            _("You have selected to install drivers from the backports repository whenever they are available.\n\n"
-                              "Although you can run more up to date software using the backports repository,\n"
-                              "you introduce a greater risk of breakage doing so.\n\n"
-                              "Are you sure you want to continue?"))
-                    if not answer:
-                        self.chkBackportsDeviceDriver.set_active(False)
-                        return True
-                    arguments.append('-b')
-
-                # Testing
-                if self.test_devices:
-                    arguments.append('-t')
-
-                command = f"ddm {' '.join(arguments)}"
-                self.log.write(f'Command to execute: {command}', 'install_device_drivers')
-
-                # Run driver installation in a thread and show progress
-                name = 'driver'
-                self.set_buttons_state(False)
-                # Pass -g to let the ddm script know it is run from a GUI
-                thread = ExecuteThreadedCommands(f'{command} -g', self.queue)
-                self.threads[name] = thread
-                thread.daemon = True
-                thread.start()
-                self.queue.join()
-                GLib.timeout_add(250, self.check_thread, name)
+        if returncode == 0 and not self.test_devices:
+            for cmd in changes['post']:
+                shell_exec(cmd)
 
     # This method is fired by the TreeView.checkbox-toggled event
     def on_tvDeviceDriver_toggled(self, obj, path, colNr, toggleValue):
@@ -680,51 +693,20 @@ class SolydXKSystemSettings():
             warning_dialog(title, msg)
             model[itr][0] = True
 
-    def fill_hw(self, driver_name, hw_lst):
-        # Expected lspci output plus drivers:
-        # driver name [manufacturer id:device id] [driver-1 driver-2 etc]
-        regexp = r'(.*)\[([0-9a-z]{4}):([0-9a-z]{4})\]\s+\[([0-9a-z\-]*)'
-        for hardware in hw_lst:
-            match = re.search(regexp, hardware)
-            if match:
-                #Check if driver is installed (check for multiple drivers)
-                installed = False
-                drivers = match.group(4).split(' ')
-                for drv in drivers:
-                    if is_package_installed(drv):
-                        installed = True
-                    else:
-                        break
-                # Save the information
-                self.hardware.append([installed, join(self.share_dir,
-                                    f'images/{driver_name}.png'), match.group(1),
-                                    match.group(4), match.group(2), match.group(3)])
-
+    @traced
     def fill_treeview_device_driver(self):
         # Fill a list with supported hardware
-        self.hardware = []
-        self.hardware.append([_("Install"), '', _("Device"), 'driver', 'manid', 'deviceid'])
-
         # Use test data (check /usr/lib/solydxk/scripts/ddm-*.sh)
-        tst = ''
-        if self.test_devices:
-            tst = '-t -f'
-
-        # Fill with supported hardware
-        self.fill_hw('amd', getoutput(f'ddm -i amd -s {tst}'))
-        self.fill_hw('nvidia', getoutput(f'ddm -i nvidia -s {tst}'))
-        self.fill_hw('broadcom', getoutput(f'ddm -i broadcom -s {tst}'))
-        self.fill_hw('pae', getoutput(f'ddm -i pae -s {tst}'))
+        self.hardware = detect_hardware(test=self.test_devices)
+        self.log.write(f"Hardware: {self.hardware}", 'fill_treeview_device_driver')
 
-        print((self.hardware))
-
-        # columns: checkbox, image (logo), device, driver
+        # columns: checkbox, image (logo), device
         column_types = ['bool', 'GdkPixbuf.Pixbuf', 'str']
-
-        # Keep some info from the user
-        show_hardware = []
+        show_hardware = [[_("Install"), '', _("Device")]]
         for hardware in self.hardware:
-            show_hardware.append([hardware[0], hardware[1], hardware[2]])
+            show_hardware.append([hardware['installed'],
+                                  join(self.share_dir, f"images/{hardware['driver']}.png"),
+                                  hardware['name']])
 
         # Fill treeview
         self.tvDeviceDriverHandler.fillTreeview(contentList=show_hardware,
@@ -736,6 +718,7 @@ class SolydXKSystemSettings():
     # Encryption functions
     # ===============================================
 
+    @traced
     def save_my_partitions(self):
         # Get selected partition paths from tvPartitions
         self.my_partitions = []
@@ -851,13 +834,10 @@ class SolydXKSystemSettings():
                and is_package_installed('cryptsetup-initramfs'):
                 # Run encrypt/decrypt in separate thread
                 self.set_buttons_state(False)
-                thread = EnDecryptPartitions(self.my_partitions, backup_partition,
-                                             self.encrypt, self.my_passphrase, self.queue, self.log)
-                self.threads[name] = thread
-                thread.daemon = True
-                thread.start()
-                self.queue.join()
-                GLib.timeout_add(5, self.check_thread, name)
+                # Interrupting encryption leaves the partition unusable: do not cancel
+                endecrypt = EnDecryptPartitions(self.my_partitions, backup_partition,
+                                                self.encrypt, self.my_passphrase, self.queue, self.log)
+                self.start_task(name, endecrypt.run, cancellable=False)
             else:
                 # Show a warning message
                 msg = _("Could not install cryptsetup/cryptsetup-initramfs.")
@@ -887,19 +867,10 @@ class SolydXKSystemSettings():
         self.changed_devices = []
         name = 'changepassphrase'
         self.set_buttons_state(False)
-        thread = ChangePassphrase(self.my_partitions, self.my_passphrase, self.queue, self.log)
-        self.threads[name] = thread
-        thread.daemon = True
-        thread.start()
-        self.queue.join()
-        GLib.timeout_add(250, self.check_thread, name)
-
-    def is_active_swap_partition(self, device):
-        out = getoutput(f'grep "{device}" /proc/swaps')[0]
-        if out:
-            return True
-        return False
+        change_passphrase = ChangePassphrase(self.my_partitions, self.my_passphrase, self.queue, self.log)
+        self.start_task(name, change_passphrase.run, cancellable=False)
 
+    @traced
     def fill_partitions(self, check_encryptable=True, include_flash=False):
         # Exclude these device paths
         exclude_devices = ['/dev/sr0', '/dev/sr1', '/dev/cdrom', '/dev/dvd',
@@ -910,6 +881,7 @@ class SolydXKSystemSettings():
         self.partitions = []
         tmp_partitions = []
         self.udisks2.fill_devices(include_flash=include_flash)
+        snapshot = self.udisks2.snapshot
         for device_path in self.udisks2.devices:
             if device_path not in exclude_devices:
                 device = self.udisks2.devices[device_path]
@@ -917,7 +889,7 @@ class SolydXKSystemSettings():
                 if not '/boot' in device['mount_point'] and \
                    device['mount_point'] != '/' and \
                    device['mount_point'] != '/home' and \
-                   not self.is_active_swap_partition(device_path):
+                   not snapshot.is_swap(device_path):
                     tmp_partitions.append({'device': device_path,
                                                 'old_device': device_path,
                                                 'fs_type': device['fs_type'],
@@ -937,9 +909,24 @@ class SolydXKSystemSettings():
         # Reset failed mount devices
         self.failed_mount_devices = []
 
+        # Unlock all encrypted partitions with a single passphrase
+        self.unlock_partitions(tmp_partitions)
+
+        # Mount or connect the partitions once and parse each fstab only once
+        fstab_paths = self.connect_partitions(tmp_partitions, check_encryptable)
+        fstab_models = {fstab_path: FstabModel(fstab_path) for fstab_path in fstab_paths}
+        crypttab_models = {}
+        uuid_devices = uuid_device_index()
+        partitions_by_name = {}
+        for partition in tmp_partitions:
+            partitions_by_name.setdefault(basename(partition['device']), partition)
+
         for partition in tmp_partitions:
             # Get fstab information
-            fstab_path, fstab_device, fstab_mount, fstab_cont, crypttab_path, keyfile_path = self.partition_configuration_info(partition, tmp_partitions, check_encryptable)
+            fstab_path, fstab_device, fstab_mount, fstab_cont, crypttab_path, keyfile_path = \
+                self.partition_configuration_info(partition, fstab_models, crypttab_models,
+                                                  uuid_devices, partitions_by_name)
+            fstab_model = fstab_models.get(fstab_path)
 
             # Do not add encrypted partitions that failed to connect (bad passphrase)
             if 'crypt' in partition['fs_type']:
@@ -955,13 +942,9 @@ class SolydXKSystemSettings():
             # Only add swap and root if /boot is configured in fstab
             can_encrypt = False
             if fstab_mount == '/' or fstab_mount == 'swap':
-                # Check for /boot partition in fstab_cont
-                pattern = re.compile(r'.*\s/boot\s')
-                lines = pattern.findall(fstab_cont)
-                for line in lines:
-                    if line[:1] != '#':
-                        can_encrypt = True
-                        break
+                # Check for /boot partition in fstab
+                if fstab_model and fstab_model.has_mount_point('/boot'):
+                    can_encrypt = True
             elif fstab_mount == '/boot':
                 self.boot_partition = partition
             elif not '/boot' in fstab_mount:
@@ -974,6 +957,7 @@ class SolydXKSystemSettings():
         # Sort the list with dictionaries
         self.partitions = sorted(self.partitions, key=lambda k: k['device'])
 
+    @traced
     def fill_treeview_partition(self):
         # Get available partitions
         self.fill_partitions(include_flash=True)
@@ -1073,57 +1057,37 @@ class SolydXKSystemSettings():
 
         return bak_partition
 
-    def sort_fstab(self, fstab_path):
-        # Sort the contents of fstab
-        cont = ''
-        sort_lst = []
-        sorted_lst = []
-        fstab_lines = []
-
-        with open(file=fstab_path, mode='r', encoding='utf-8') as fstab_fle:
-            fstab_lines = fstab_fle.readlines()
-
-        for line in fstab_lines:
-            line = line.strip()
-            if line[0:1] == '#':
-                line_added = False
-                if not sorted_lst:
-                    # First line in fstab is commented
-                    sorted_lst.append(line)
-                    line_added = True
-                if sort_lst:
-                    # Sort list on mount point
-                    sort_lst = sorted(sort_lst, key=lambda x: x[1])
-                for sort_line in sort_lst:
-                    # Add sorted line to list
-                    sorted_lst.append('\t'.join(sort_line))
-                # Cleanup before next iteration
-                sort_lst = []
-                if not line_added:
-                    # Add empty line for readability
-                    sorted_lst.append('')
-                    # Add comment
-                    sorted_lst.append(line)
-            else:
-                # Add mount device line
-                lst = line.split()
-                if len(lst) == 6:
-                    sort_lst.append(lst)
-
-        # Add left overs
-        if sort_lst:
-            sort_lst = sorted(sort_lst, key=lambda x: x[1])
-        for sort_line in sort_lst:
-            sorted_lst.append('\t'.join(sort_line))
+    def unlock_partitions(self, partitions):
+        # Collect the encrypted partitions that still need a passphrase
+        locked_partitions = []
+        for partition in partitions:
+            if partition['encrypted'] \
+               and not partition['mount_point'] \
+               and not partition['passphrase'] \
+               and not 'mapper' in partition['device'] \
+               and partition['fs_type'] != 'swap' \
+               and partition['device'] not in self.failed_mount_devices:
+                locked_partitions.append(partition)
+        if not locked_partitions:
+            return
 
-        # Create the sorted fstab contents
-        if sorted_lst:
-            cont = '\n'.join(sorted_lst) + '\n'
+        # Ask once and try the passphrase on all devices at the same time
+        devices = [partition['device'] for partition in locked_partitions]
+        passphrase = self.passphrase_dialog('\n'.join(devices))
+        if not passphrase:
+            return
+        connected = connect_block_devices(devices, passphrase)
 
-        return cont
+        # Partitions that did not unlock are asked for separately later on
+        for partition in locked_partitions:
+            mapped_device, filesystem = connected.get(partition['device'], ('', ''))
+            if mapped_device:
+                self.log.write(f"Unlocked {partition['device']} to {mapped_device} ({filesystem})",
+                               'unlock_partitions', 'info')
+                partition['passphrase'] = passphrase
 
-    def partition_configuration_info(self, partition, partitions, check_encryptable):
-        fstab_paths = ['/etc/fstab']
+    def connect_partitions(self, partitions, check_encryptable):
+        fstab_paths = [root_path('/etc/fstab')]
 
         # Search for fstab file if you're in a live session
         for partition in partitions:
@@ -1136,18 +1100,17 @@ class SolydXKSystemSettings():
                 device = ''
                 filesystem = ''
 
-                if partition['encrypted'] and not partition['passphrase'] and not 'mapper' in partition['device']:
+                if partition['encrypted'] and not 'mapper' in partition['device']:
                     # This is an encrypted, not mounted partition.
-                    # Ask the user for the passphrase
-                    current_passphrase = self.passphrase_dialog(partition['device'])
+                    # Use the passphrase that unlocked it or ask the user for the passphrase
+                    current_passphrase = partition['passphrase']
+                    if not current_passphrase:
+                        current_passphrase = self.passphrase_dialog(partition['device'])
 
                 if check_encryptable:
                     # Mount the partition when working in encryption
                     device, mount, filesystem = self.temp_mount(partition, current_passphrase)
-                    #print((">>>> p1 = %s" % str(p)))
-                    #print(("     mount = %s" % mount))
                     if mount:
-                        #print((">>>> Save %s: mount=%s, fs_type=%s" % (device, mount, filesystem)))
                         partition['mount_point'] = mount
                         # Get free_size from mapped path
                         total, free, used = self.udisks2.get_mount_size(mount)
@@ -1162,21 +1125,17 @@ class SolydXKSystemSettings():
                             fstab_paths.append(fstab_path)
                     else:
                         show_error = True
-                        #print((">>>> Could not mount %s (%s)" % (p['device'], p['fs_type'])))
                         if partition['fs_type'] == 'swap' or partition['fs_type'] == '':
                             # Don't show error
                             show_error = False
                         self.log.write(self.mount_error.format(partition['device']),
-                                       'get_partition_configuration_info', 'error', show_error)
+                                       'connect_partitions', 'error', show_error)
                         if partition['device'] not in self.failed_mount_devices:
                             self.failed_mount_devices.append(partition['device'])
 
                 elif current_passphrase is not None:
                     # Not in encryption: connect the block device but do not mount
                     device, filesystem = connect_block_device(partition['device'], current_passphrase)
-
-                    #print((">>>> p2 = %s" % str(p)))
-                    #print(("     device = %s" % device))
                     if device:
                         # Save information
                         partition['fs_type'] = filesystem
@@ -1184,98 +1143,71 @@ class SolydXKSystemSettings():
                         partition['device'] = device
                     else:
                         show_error = True
-                        #print((">>>> Could not connect block device %s (%s)" % (p['device'], p['fs_type'])))
                         if partition['fs_type'] == 'swap' or partition['fs_type'] == '':
                             # Don't show error
                             show_error = False
                         self.log.write(self.mount_error.format(partition['device']),
-                                       'get_partition_configuration_info', 'error', show_error)
+                                       'connect_partitions', 'error', show_error)
                         if partition['device'] not in self.failed_mount_devices:
                             self.failed_mount_devices.append(partition['device'])
 
+        return fstab_paths
+
+    def partition_configuration_info(self, partition, fstab_models, crypttab_models,
+                                     uuid_devices, partitions_by_name):
         if partition['device'] not in self.failed_mount_devices:
+            fstab_device = partition['old_device'].replace('/dev/mapper', '/dev')
+            if not 'mapper' in fstab_device:
+                fstab_device = fstab_device.replace('/dev', '/dev/mapper')
+
             # Check if given partition is listed in /etc/fstab
-            for fstab_path in fstab_paths:
-                fstab_cont = self.sort_fstab(fstab_path)
-                fstab_mount = ''
-
-                fstab_device = partition['old_device'].replace('/dev/mapper', '/dev')
-                if not 'mapper' in fstab_device:
-                    fstab_device = fstab_device.replace('/dev', '/dev/mapper')
-
-                regexp = rf"^\s*(UUID={partition['old_uuid']}|{partition['old_device']}|{fstab_device})\s+(\S+)"
-                #print(("++++ regexp = %s" % regexp))
-                match = re.search(regexp, fstab_cont, re.M)
-                if match:
-                    fstab_device = match.group(1)
-                    fstab_mount = match.group(2)
-                if fstab_mount:
-                    # Set fs_type for swap partitions
-                    if fstab_mount == 'swap':
-                        partition['fs_type'] = 'swap'
-
-                    # Get encryption information
-                    crypttab_path = ''
-                    keyfile_path = ''
-                    #print(("**** crypttab partition: %s" % str(partition)))
-                    if partition['encrypted']:
-                        crypttab_path = fstab_path.replace('fstab', 'crypttab')
-                        #print(("++++ crypttab_path=%s" % crypttab_path))
-                        if exists(crypttab_path):
-                            lines = []
-                            with open(file=crypttab_path, mode='r', 
-                                      encoding='utf-8') as crypttab_fle:
-                                lines = crypttab_fle.readlines()
-                            for line in lines:
-                                line = line.strip()
-                                line_data = line.split()
-                                #print(("++++ lineData=%s" % str(lineData)))
-
-                                if len(line_data) <= 1:
-                                    continue
-
-                                match = re.search(r'[0-9a-z]{8}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{4}-[0-9a-z]{12}',
-                                                  line_data[1])
-                                if match:
-                                    crypttab_uuid = match.group(0)
-                                    #print(("++++ crypttab_uuid=%s" % crypttab_uuid))
-                                    device = get_device_from_uuid(crypttab_uuid)
-                                    #print(("++++ device=%s, partition['device']=%s" % (device, partition['device'])))
-                                    if basename(device) == basename(partition['device']):
-                                        # Get crypttab data
-                                        crypttab_keyfile_path = line_data[2]
-                                        if crypttab_keyfile_path == 'none':
-                                            crypttab_keyfile_path = ''
-                                        if crypttab_keyfile_path:
-                                            # Search the keyfile path
-                                            crypttab_keyfile_dir = dirname(crypttab_keyfile_path)
-                                            esc_dir = crypttab_keyfile_dir.replace('/', r'\/')
-                                            regexp = rf"([0-9a-z-/]+)\s+{esc_dir}\s+"
-                                            #print(("++++ regexp = %s" % regexp))
-                                            match = re.search(regexp, fstab_cont)
-                                            if match:
-                                                keyfile_device = match.group(1)
-                                                if keyfile_device[:1] != '/':
-                                                    keyfile_device = get_device_from_uuid(keyfile_device)
-                                                #print(("++++ keyfile_device = %s" % keyfile_device))
-                                                #print(self.partitions)
-                                                for partition in self.partitions:
-                                                    #print(("    ++++ bn_device = %s, bn_keyfile_device = %s" % (basename(p['device']), basename(keyfile_device))))
-                                                    if basename(partition['device']) == basename(keyfile_device):
-                                                        keyfile_path = join(partition['mount_point'], crypttab_keyfile_path.lstrip('/'))
-                                                        #print(("        ++++ keyfile_path = %s" % keyfile_path))
-                                                        break
-                                        break
-                    return (fstab_path, fstab_device, fstab_mount, fstab_cont, crypttab_path, keyfile_path)
+            for fstab_path, fstab_model in fstab_models.items():
+                entry = fstab_model.find(uuid=partition['old_uuid'],
+                                         device=partition['old_device'],
+                                         mapped_device=fstab_device)
+                if not entry or not entry.mount_point:
+                    continue
+                fstab_device = entry.device
+                fstab_mount = entry.mount_point
+
+                # Set fs_type for swap partitions
+                if fstab_mount == 'swap':
+                    partition['fs_type'] = 'swap'
+
+                # Get encryption information
+                crypttab_path = ''
+                keyfile_path = ''
+                if partition['encrypted']:
+                    crypttab_path = fstab_path.replace('fstab', 'crypttab')
+                    if exists(crypttab_path):
+                        if crypttab_path not in crypttab_models:
+                            crypttab_models[crypttab_path] = CrypttabModel(crypttab_path, uuid_devices)
+                        crypttab_entry = crypttab_models[crypttab_path].find(partition['device'])
+                        if crypttab_entry and crypttab_entry.keyfile not in ('', 'none'):
+                            # Search the partition with the keyfile
+                            crypttab_keyfile_path = crypttab_entry.keyfile
+                            keyfile_entry = fstab_model.by_mount.get(dirname(crypttab_keyfile_path))
+                            if keyfile_entry:
+                                keyfile_device = keyfile_entry.device
+                                if keyfile_device[:1] != '/':
+                                    keyfile_device = resolve_uuid(keyfile_device, uuid_devices)
+                                keyfile_partition = partitions_by_name.get(basename(keyfile_device))
+                                if keyfile_partition:
+                                    keyfile_path = join(keyfile_partition['mount_point'],
+                                                        crypttab_keyfile_path.lstrip('/'))
+                return (fstab_path, fstab_device, fstab_mount, fstab_model.sorted_content(),
+                        crypttab_path, keyfile_path)
 
         # Nothing found
         return ('', '', '', '', '', '')
 
+    @traced
     def write_partition_configuration(self, keyfile_only=False):
         keyfile_path = ''
         crypttab_keyfile_path = None
         encrypt_info = []
-        saved_fstabs = {}
+        fstab_models = {}
+        crypttab_models = {}
         grub_partitions = []
         root_devices = []
 
@@ -1298,15 +1230,17 @@ class SolydXKSystemSettings():
             if not '/dev/mapper' in partition['device']:
                 device = f"UUID={partition['uuid']}"
 
-            # Check if fstab contents has changed before
-            try:
-                fstab_cont = saved_fstabs[partition['fstab_path']]
-            except:
-                fstab_cont = partition['fstab_cont']
+            # Collect all changes per fstab and crypttab file
+            fstab_path = partition['fstab_path']
+            if fstab_path not in fstab_models:
+                fstab_models[fstab_path] = FstabModel(fstab_path)
+            crypttab_path = partition['crypttab_path'] or fstab_path.replace('fstab', 'crypttab')
+            if crypttab_path not in crypttab_models:
+                crypttab_models[crypttab_path] = CrypttabModel(crypttab_path)
+            crypttab_model = crypttab_models[crypttab_path]
 
             # Rewrite this device in fstab
-            fstab_cont = re.sub(partition['fstab_device'], device, fstab_cont)
-            saved_fstabs[partition['fstab_path']] = fstab_cont
+            fstab_models[fstab_path].replace_device(partition['fstab_device'], device)
 
             # Save configuration information
             skip_keyfile_config = False
@@ -1321,7 +1255,8 @@ class SolydXKSystemSettings():
             info_dict = {}
             info_dict['device'] = partition['device']
             info_dict['fs_type'] = partition['fs_type']
-            info_dict['fstab_path'] = partition['fstab_path']
+            info_dict['fstab_path'] = fstab_path
+            info_dict['crypttab_path'] = crypttab_path
             info_dict['keyfile_path'] = ''
             info_dict['crypttab_keyfile_path'] = ''
             info_dict['passphrase'] = partition['passphrase']
@@ -1340,10 +1275,9 @@ class SolydXKSystemSettings():
             if not partition['encrypted'] and not keyfile_only:
                 # Remove device from crypttab
                 base_name = basename(partition['device'])
-                self.log.write(f"Remove {base_name} from {partition['crypttab_path']}",
+                self.log.write(f"Remove {base_name} from {crypttab_path}",
                                'write_partition_configuration', 'info')
-                cmd = f"sed -i '/^{base_name} /d' {partition['crypttab_path']}"
-                shell_exec(cmd)
+                crypttab_model.remove(device=base_name)
 
                 # Remove any references of a key file when the key file is on this decrypted and unsafe partition
                 lukskey = join(partition['mount_point'], '.lukskey')
@@ -1351,63 +1285,52 @@ class SolydXKSystemSettings():
                     self.log.write(f"Remove {lukskey} from unencrypted and unsafe {partition['device']}",
                                    'write_partition_configuration', 'info')
                     os.remove(lukskey)
-                self.log.write(f"Remove {lukskey} references from {partition['crypttab_path']}",
+                self.log.write(f"Remove {lukskey} references from {crypttab_path}",
                                'write_partition_configuration', 'info')
-                cmd = f"sed -i 's#{lukskey}#none#g' {partition['crypttab_path']}"
-                shell_exec(cmd)
+                crypttab_model.replace_keyfile(lukskey, 'none')
+
+        # Create the key files and collect the crypttab changes
+        for enc_dict in encrypt_info:
+            # Key file
+            if enc_dict['keyfile_path']:
+                passphrase = self.my_passphrase
+                if keyfile_only and enc_dict['passphrase']:
+                    passphrase = enc_dict['passphrase']
+                if passphrase:
+                    create_keyfile(enc_dict['keyfile_path'],
+                                   enc_dict['device'].replace('/mapper', ''),
+                                   passphrase)
+
+            if not keyfile_only:
+                # Crypttab
+                update_crypttab(crypttab_models[enc_dict['crypttab_path']],
+                                enc_dict['device'].replace('/mapper', ''),
+                                enc_dict['fs_type'],
+                                enc_dict['crypttab_keyfile_path'],
+                                not self.encrypt)
 
-            # Write the new content to the fstab files, the key files and crypttab files
-            saved_fstab = ''
+        if not keyfile_only:
+            # Validate and write each fstab and crypttab file once
+            errors = save_models(list(fstab_models.values()) + list(crypttab_models.values()),
+                                 sort_fstab=True)
+            if errors:
+                # Do not install Grub without a valid fstab and crypttab
+                self.log.write('\n'.join(errors), 'write_partition_configuration', 'error', True)
+                return False
+
+            # Logging
             sep_line = '=' * 10
-            for enc_dict in encrypt_info:
-                if not keyfile_only and saved_fstab != enc_dict['fstab_path']:
-                    saved_fstab = enc_dict['fstab_path']
-                    # Logging
-                    self.log.write(f"{sep_line} blkid {sep_line}",
-                                   'write_partition_configuration', 'info')
-                    self.log.write('\n'.join(getoutput("blkid")),
-                                   'write_partition_configuration', 'info')
-                    self.log.write(f"{sep_line} {enc_dict['fstab_path']} {sep_line}",
-                                   'write_partition_configuration', 'info')
-                    self.log.write(saved_fstabs[enc_dict['fstab_path']],
+            self.log.write(f"{sep_line} blkid {sep_line}",
+                           'write_partition_configuration', 'info')
+            self.log.write('\n'.join(getoutput("blkid")),
+                           'write_partition_configuration', 'info')
+            for path, model in list(fstab_models.items()) + list(crypttab_models.items()):
+                if exists(path):
+                    self.log.write(f"{sep_line} {path} {sep_line}",
                                    'write_partition_configuration', 'info')
+                    self.log.write(model.content(), 'write_partition_configuration', 'info')
                     self.log.write('=' * 25, 'write_partition_configuration', 'info')
 
-                    # Fstab
-                    with open(file=enc_dict['fstab_path'], mode='w', encoding='utf-8') as fstab_fle:
-                        fstab_fle.write(saved_fstabs[enc_dict['fstab_path']])
-
-                # Key file
-                if enc_dict['keyfile_path']:
-                    passphrase = self.my_passphrase
-                    if keyfile_only and enc_dict['passphrase']:
-                        passphrase = enc_dict['passphrase']
-                    if passphrase:
-                        create_keyfile(enc_dict['keyfile_path'],
-                                       enc_dict['device'].replace('/mapper', ''),
-                                       passphrase)
-
-                #print(("++++ keyfile_only=%s" % str(keyfile_only)))
-                if not keyfile_only:
-                    # Crypttab
-                    #print(("++++ Start write_crypttab"))
-                    write_crypttab(enc_dict['device'].replace('/mapper', ''),
-                                   enc_dict['fs_type'],
-                                   partition['crypttab_path'],
-                                   enc_dict['crypttab_keyfile_path'],
-                                   not self.encrypt)
-
-                    # Log crypttab
-                    if exists(partition['crypttab_path']):
-                        self.log.write(f"{sep_line} {partition['crypttab_path']} {sep_line}",
-                                       'write_partition_configuration', 'info')
-                        with open(file=partition['crypttab_path'],
-                                  mode='r',
-                                  encoding='utf-8') as fstab_fle:
-                            self.log.write(fstab_fle.read(),
-                                           'write_partition_configuration', 'info')
-                        self.log.write('=' * 25, 'write_partition_configuration', 'info')
-
         # Get the grub path to fix VirtualBox by disabling Plymouth
         if in_virtual_box() and self.encrypt:
             grub_path = ''
@@ -1447,11 +1370,15 @@ class SolydXKSystemSettings():
                     cmd = f"grub-install --force {root_device.rstrip('0123456789')};"
                 cmd += "update-initramfs -u;update-grub;exit"
                 shell_exec(f"chroot-partition {root_device} \"{passphrase}\" \"{cmd}\"")
+            # Partitions were formatted and Grub (re-)installed: detect Grub again
+            clear_grub_cache()
+        return True
 
     # ===============================================
     # Localization functions
     # ===============================================
 
+    @traced
     def save_locale(self):
         # Collect information
         if has_internet_connection():
@@ -1470,19 +1397,15 @@ class SolydXKSystemSettings():
             # Run localization in a thread and show progress
             name = 'localize'
             self.set_buttons_state(False)
-            thread = Localize(locales, timezone, self.queue)
-            self.threads[name] = thread
-            thread.daemon = True
-            thread.start()
-            # TODO: why is queue.join sometimes blocking the thread but not always?
-            #self.queue.join()
-            GLib.timeout_add(250, self.check_thread, name)
+            localize = Localize(locales, timezone, self.queue)
+            self.start_task(name, localize.run, cancellable=False)
         else:
             title = self.title
             msg = _(f"{title} cannot download and install the software localization packages\n"
                     "Please repeat this process when you established an internet connection.")
             warning_dialog(self.btnSaveLocale.get_label(), msg)
 
+    @traced
     def fill_treeview_locale(self):
         self.locales = [[self.installed_title, self.locale_title,
                          self.language_title, self.default_title]]
@@ -1504,11 +1427,13 @@ class SolydXKSystemSettings():
         col_type_lst = ['bool', 'str', 'str', 'bool']
         self.tvLocaleHandler.fillTreeview(self.locales, col_type_lst, select_row, 400, True)
 
+    @traced
     def fill_cmb_timezone_continent(self):
         self.cmbTimezoneContinentHandler.fillComboBox(self.locale_info.timezone_continents,
                                                       self.locale_info.current_timezone_continent)
         self.fill_cmb_timezone(self.cmbTimezoneContinentHandler.getValue())
 
+    @traced
     def fill_cmb_timezone(self, timezone_continent):
         timezones = self.locale_info.list_timezones(timezone_continent)
         self.cmbTimezoneHandler.fillComboBox(timezones,
@@ -1543,95 +1468,61 @@ class SolydXKSystemSettings():
     # Hold back functions
     # ===============================================
 
+    @traced
     def fill_treeview_holdback(self):
-        holdback_pcks = []
-        self.holdback = getoutput("env LANG=C dpkg --get-selections | grep hold$ | awk '{print $1}'")
-        for pck in self.holdback:
-            if pck != '':
-                holdback_pcks.append([False, pck.strip()])
+        # Read the dpkg selections once for both hold back treeviews
+        self.selections = DpkgSelections()
+        self.holdback = sorted(self.selections.hold)
+        holdback_pcks = [[False, pck] for pck in self.holdback]
         # Fill treeview
         col_type_lst = ['bool', 'str']
         self.tvHoldbackHandler.fillTreeview(holdback_pcks, col_type_lst, 0, 400, False)
 
+    @traced
     def fill_treeview_available(self):
-        self.available = []
-        lst = getoutput("env LANG=C dpkg --get-selections | grep install$ | awk '{print $1}'")
-        for pck in lst:
-            self.available.append([False, pck.strip()])
+        if self.selections is None:
+            self.selections = DpkgSelections()
+        self.available = [[False, pck] for pck in sorted(self.selections.install)]
         # Fill treeview
         col_type_lst = ['bool', 'str']
-        self.tvAvailableHandler.fillTreeview(self.available, col_type_lst, 0, 400, False)
+        self.tvAvailableHandler.fillTreeview(self.available, col_type_lst, 0, 400, False,
+                                             filterColNr=1)
+        self.tvAvailableHandler.filterRows(self.txtSearchAvailable.get_text())
+
+    def move_holdback(self, packages, hold):
+        # Apply the hold change at once and only move the changed rows
+        moved = self.selections.set_hold(packages, hold)
+        if not moved:
+            return
+        from_handler, to_handler = self.tvAvailableHandler, self.tvHoldbackHandler
+        if not hold:
+            from_handler, to_handler = to_handler, from_handler
+        from_handler.removeRowsByValue(moved)
+        to_handler.insertRowsSorted([[False, pck] for pck in moved])
+        self.holdback = sorted(self.selections.hold)
+        self.available = [[False, pck] for pck in sorted(self.selections.install)]
 
     def add_holdback(self):
         packages = self.tvAvailableHandler.getToggledValues()
-        for pck in packages:
-            self.log.write(f"Hold back package: {pck}", 'add_holdback')
-            shell_exec(f"echo '{pck} hold' | dpkg --set-selections")
-        self.fill_treeview_holdback()
-        self.fill_treeview_available()
+        self.log.write(f"Hold back packages: {' '.join(packages)}", 'add_holdback')
+        self.move_holdback(packages, True)
 
     def remove_holdback(self):
         packages = self.tvHoldbackHandler.getToggledValues()
-        for pck in packages:
-            self.log.write(f"Remove hold back from: {pck}", 'remove_holdback')
-            shell_exec(f"echo '{pck} install' | dpkg --set-selections")
-        self.fill_treeview_holdback()
-        self.fill_treeview_available()
+        self.log.write(f"Remove hold back from: {' '.join(packages)}", 'remove_holdback')
+        self.move_holdback(packages, False)
 
     # ===============================================
     # Mirror functions
     # ===============================================
 
+    @traced
     def save_backports(self):
-        sources_changed = False
-        backports_name = f"{self.debian_name}-backports"
-
-        if self.chkEnableBackports.get_active():
-            self.backports = self.apt.get_backports(exclude_disabled=False)
-            # Check which regular repository is enabled
-            debian_domain = ''
-            match = re.search(r"([a-z0-9\.]+)debian\.org", self.current_debian_repo)
-            if match:
-                debian_domain = f"{match.group(1)}debian.org"
-            # Create backports line for sources.list
-            if self.debian_name and debian_domain:
-                for backport_source in self.backports:
-                    if debian_domain in backport_source['source-entry'].uri:
-
-                        # Enable disabled backports repo
-                        self.apt.set_disable(apt_source=backport_source, disabled=False)
-                        self.apt.save(self.backports)
-
-                        self.log.write('Enable existing source: ' \
-                                       f"{backport_source['source-entry'].uri}",
-                                       'save_backport')
-                        sources_changed = True
-                        break
-                if not sources_changed:
-                    # Add new backports repo
-                    new_apt_source = self.apt.new_apt_source(types=['deb'],
-                                                             uri=f"https://{debian_domain}/debian/",
-                                                             suites=[backports_name],
-                                                             comps=self.apt.distro_comps['debian']
-                                                             )
-                    self.backports.append(new_apt_source)
-                    self.apt.save(self.backports)
-
-                    sources_changed = True
-        else:
-            # Comment the backports repository entry in sources.list
-            self.backports = self.apt.get_backports()
-            for backport_source in self.backports:
-                if backports_name in backport_source['suites']:
-
-                    # Disable the backports repo
-                    self.apt.set_disable(apt_source=backport_source, disabled=True)
-                    self.apt.save(self.backports)
-
-                    self.log.write('Disable existing source: ' \
-                                   f"{backport_source['source-entry'].uri}",
-                                   'save_backport')
-                    sources_changed = True
+        enable = self.chkEnableBackports.get_active()
+        changed = self.apt.set_backports(enable, self.debian_name, self.current_debian_repo)
+        for uri in changed:
+            self.log.write(f"{'Enable' if enable else 'Disable'} backports source: {uri}", 'save_backport')
+        sources_changed = bool(changed)
 
         # Update the apt cache
         if sources_changed:
@@ -1639,12 +1530,8 @@ class SolydXKSystemSettings():
                 # Run update in a thread and show progress
                 name = 'updatebp'
                 self.set_buttons_state(False)
-                thread = ExecuteThreadedCommands("apt-get update", self.queue)
-                self.threads[name] = thread
-                thread.daemon = True
-                thread.start()
-                self.queue.join()
-                GLib.timeout_add(250, self.check_thread, name)
+                self.start_task(name, run_apt_commands, [['update']], report_apt_progress, 1,
+                                timeout=APT_UPDATE_TIMEOUT)
             else:
                 msg = _("Could not update the apt cache.\n"
                         "Please update the apt cache manually with: apt-get update")
@@ -1661,6 +1548,7 @@ class SolydXKSystemSettings():
         else:
             self.chkBackportsDeviceDriver.set_sensitive(False)
 
+    @traced
     def fill_treeview_mirrors(self):
         # Fill mirror list
         if len(self.mirrors) > 1:
@@ -1673,6 +1561,7 @@ class SolydXKSystemSettings():
         else:
             self.nbPref.get_nth_page(1).set_visible(False)
 
+    @traced
     def save_mirrors(self):
         # Safe mirror settings
         replace_repos = []
@@ -1738,12 +1627,8 @@ class SolydXKSystemSettings():
                     # Run update in a thread and show progress
                     name = 'updatebp'
                     self.set_buttons_state(False)
-                    thread = ExecuteThreadedCommands("apt-get update", self.queue)
-                    self.threads[name] = thread
-                    thread.daemon = True
-                    thread.start()
-                    self.queue.join()
-                    GLib.timeout_add(250, self.check_thread, name)
+                    self.start_task(name, run_apt_commands, [['update']], report_apt_progress, 1,
+                                    timeout=APT_UPDATE_TIMEOUT)
                 else:
                     msg = _("Could not update the apt cache.\n"
                             "Please update the apt cache manually with: apt-get update")
@@ -1785,111 +1670,66 @@ class SolydXKSystemSettings():
     # Cleanup functions
     # ===============================================
 
+    @traced
     def fill_treeview_cleanup(self):
+        # Get autoremovable, orphaned and old kernel packages in one apt cache pass
+        self.cleanup_candidates = get_cleanup_candidates(exclude=self.holdback)
+        # Downloaded packages removed by apt-get clean
+        self.archives_size = get_archives_size()
         pck_data = []
-        # Get list of packages from autoremove and obsolete
-        for pck in self.autoremove_packages():
-            if pck not in self.holdback:
-                pck_data.append([True, pck])
-        for pck in self.obsolete_packages():
-            if (pck not in self.holdback and
-                not any(pck in x for x in pck_data)):
-                pck_data.append([False, pck])
-        for pck in self.old_kernel_packages():
-            if (pck not in self.holdback and
-                not any(pck in x for x in pck_data)):
-                pck_data.append([False, pck])
+        for candidate in self.cleanup_candidates:
+            pck_data.append([candidate['preselect'], candidate['package'],
+                             human_size(candidate['installed_size'])])
         # Fill treeview
-        col_type_lst = ['bool', 'str']
+        col_type_lst = ['bool', 'str', 'str']
         self.tvCleanupHandler.fillTreeview(pck_data, col_type_lst, 0, 400, False)
+        self.update_cleanup_size()
 
-    def autoremove_packages(self):
-        ret = []
-        # Create approriate command
-        # Use env LANG=C to ensure the output of dist-upgrade is always en_US
-        cmd = "env LANG=C apt-get autoremove --assume-no | grep -E '^ '"
-        lst = getoutput(cmd)
-
-        # Loop through each line and fill the package lists
-        for line in lst:
-            packages = line.split()
-            for package in packages:
-                package = package.strip().replace('*', '')
-                if package and package not in ret:
-                    ret.append(package)
-        return ret
-
-    def obsolete_packages(self):
-        obs_exec = 'deborphan'
-        if not is_package_installed('deborphan'):
-            # Alternative for deborphan
-            if is_package_installed('aptitude'):
-                obs_exec = "aptitude -F%p search '~o (~slibs|~soldlibs|~sintrospection) !~Rdepends:.*'"
-            else:
-                return []
-        obs_pcks = getoutput(obs_exec)
-        if len(obs_pcks) == 1 and obs_pcks[0] == '':
-            obs_pcks = []
-        return obs_pcks
-
-    def old_kernel_packages(self):
-        kernel_packages = []
-        # Check booted kernel version
-        regexp = r'[0-9][0-9\.\-]+[0-9]'
-        cur_version = getoutput(f"uname -r | egrep -o '{regexp}'")[0]
-        #cur_version = getoutput("ls -al / | grep -e '\svmlinuz\s' | egrep -o '%s'" % regexp)[0]
-        # Get kernel packages not with cur_version
-        cmd = f"dpkg-query -f '${{binary:Package}}\n' -W | grep -E 'linux-image-[0-9]|linux-headers-[0-9]' | grep -v '{cur_version}' | egrep -v '[a-z]-486|[a-z]-686|[a-z]-586'"
-        packages = getoutput(cmd)
-        # Check version number of found kernel packages
-        for pck in packages:
-            match = re.search(regexp, pck)
-            if match:
-                if compare_package_versions(match.group(0), cur_version) == VersionComparison.SMALLER:
-                    # Add to the kernel_packages list
-                    kernel_packages.append(pck)
-
-        if kernel_packages:
-            # Add kbuild packages
-            del_string = '.0'
-            try:
-                kbuild_version = cur_version[:cur_version.index('-')]
-            except:
-                kbuild_version = cur_version
-            while kbuild_version.endswith(del_string):
-                kbuild_version = kbuild_version[:-len(del_string)]
-            kbuild_packages = getoutput(f"dpkg-query -f '${{binary:Package}}\n' -W | grep linux-kbuild | grep -v '{kbuild_version}'")
-            for pkg in kbuild_packages:
-                if pkg:
-                    kernel_packages.append(pkg)
-        return kernel_packages
+    # This method is fired by the TreeView.checkbox-toggled event
+    def on_tvCleanup_toggled(self, obj, path, col_nr, toggle_value):
+        self.update_cleanup_size()
 
-    def remove_unneeded_packages(self):
-        force = get_apt_force()
+    def get_selected_cleanup_packages(self):
         packages = []
-        # Build list with selected packages
         model = self.tvCleanup.get_model()
         itr = model.get_iter_first()
         while itr is not None:
             if model.get_value(itr, 0):
                 packages.append(model.get_value(itr, 1))
             itr = model.iter_next(itr)
+        return packages
+
+    def get_cleanup_size(self, packages):
+        # Return reclaimable space (KB) of the given packages and the apt cache
+        sizes = {candidate['package']: candidate['installed_size']
+                 for candidate in self.cleanup_candidates}
+        return sum(sizes.get(package, 0) for package in packages) + self.archives_size
+
+    def update_cleanup_size(self):
+        total = self.get_cleanup_size(self.get_selected_cleanup_packages())
+        self.lblCleanupText.set_label(_(f"{self.cleanup_text}: {human_size(total)} to free "
+                                        f"(apt cache: {human_size(self.archives_size)})"))
+
+    @traced
+    def remove_unneeded_packages(self):
+        force = get_apt_force()
+        # Build list with selected packages
+        packages = self.get_selected_cleanup_packages()
         if packages:
+            self.log.write(f"Remove {len(packages)} packages and clean the apt cache: "
+                           f"{human_size(self.get_cleanup_size(packages))} to free",
+                           'remove_unneeded_packages', 'info')
             # Run cleanup in a thread and show progress
             name = 'cleanup'
             self.set_buttons_state(False)
-            cmd = f"apt-get {force} clean; apt-get purge {force} {' '.join(packages)}"
-            thread = ExecuteThreadedCommands(cmd, self.queue)
-            self.threads[name] = thread
-            thread.daemon = True
-            thread.start()
-            self.queue.join()
-            GLib.timeout_add(250, self.check_thread, name)
+            self.start_task(name, run_apt_commands, [['purge'] + force.split() + packages, ['clean']],
+                            report_apt_progress, cancellable=False)
 
     # ===============================================
     # Boot splash functions
     # ===============================================
 
+    @traced
     def fill_treeview_installed_plymouth(self):
         themes = [[False, 'None']]
         cursor = 0
@@ -1907,6 +1747,7 @@ class SolydXKSystemSettings():
         col_type_lst = ['bool', 'str']
         self.tvSplashHandler.fillTreeview(themes, col_type_lst, cursor, 400, False)
 
+    @traced
     def fill_treeview_installed_grub(self):
         themes = [[False, 'None']]
         cursor = 0
@@ -1924,6 +1765,7 @@ class SolydXKSystemSettings():
         col_type_lst = ['bool', 'str']
         self.tvGrubHandler.fillTreeview(themes, col_type_lst, cursor, 400, False)
 
+    @traced
     def fill_cmb_splash_resolution(self):
         sel_res = '1024x768'
         cur_res = self.plymouth.current_resolution()
@@ -1981,111 +1823,104 @@ class SolydXKSystemSettings():
         plymouth_theme = self.tvSplashHandler.getToggledValues()[0]
         grub_theme = self.tvGrubHandler.getToggledValues()[0]
         resolution = self.cmbSplashResolutionHandler.getValue()
-        splash = str(plymouth_theme) != 'None'
-
-        # Update alternatives
-        desktop_themes = glob(fr'/usr/share/desktop-base/{grub_theme}*/')
-        desktop_theme = ''
-        if not desktop_themes:
-            desktop_themes = glob(fr'/usr/share/desktop-base/{plymouth_theme}*/')
-        if desktop_themes:
-            desktop_theme = desktop_themes[0].rstrip("/")
-            shell_exec(rf'update-alternatives --set desktop-theme {desktop_theme}')
-
-        # Change Grub and Plymouth background images according to screen resolution
-        ratio = get_current_aspect_ratio()
-        # Grub
-        src = f"{desktop_theme}/grub/grub-16x9.png"
-        dst = f"/usr/share/grub/themes/{grub_theme}/bg.png"
-        if ratio == '4:3':
-            src = f"{desktop_theme}/grub/grub-4x3.png"
-        if exists(src) and exists(dst):
-            shutil.copyfile(src, dst)
-
-        #Plymouth
-        dst = f"/usr/share/plymouth/themes/{plymouth_theme}/bg.png"
-        if exists(src) and exists(dst):
-            shutil.copyfile(src, dst)
-
-        self.grub.save(grub_theme, resolution, splash)
-        self.plymouth.save(plymouth_theme)
-        self.lightdm.save(plymouth_theme)
+        save_boot_splash(self.plymouth, self.lightdm, plymouth_theme, grub_theme, resolution)
 
     def save(self):
         name = 'splash'
         self.set_buttons_state(False)
-        thread = Thread(target=self.boot_splash_multi_threading)
-        self.threads[name] = thread
-        thread.daemon = True
-        thread.start()
-        GLib.timeout_add(250, self.check_thread, name)
+        self.start_task(name, self.boot_splash_multi_threading, cancellable=False)
 
     # ===============================================
     # General functions
     # ===============================================
 
+    def start_task(self, name, target, *args, timeout=None, cancellable=True):
+        # Run target in the task runner: workers wake up the main loop through the queue
+        # and when they are done, there is only a pulse timer while there is no real progress
+        # Only downloads (apt-get update) should be cancellable: killing dpkg leaves half installed packages
+        task = self.runner.submit(name, target, *args, queue=self.queue,
+                                  timeout=timeout, cancellable=cancellable)
+        self.tasks[name] = task
+        task.future.add_done_callback(lambda future: self.wake_up())
+        self.set_cancel_state()
+        if name in ['update', 'cleanup', 'driver', 'splash']:
+            GLib.timeout_add(250, self.pulse_thread, name)
+
+    def task_title(self, name):
+        # User facing title of a task: the label of the button that started it
+        buttons = {'cleanup': self.btnCleanup,
+                   'driver': self.btnSaveDeviceDriver,
+                   'localize': self.btnSaveLocale,
+                   'splash': self.btnSaveSplash,
+                   'changepassphrase': self.btnChangePassphrase}
+        if name == 'updatebp':
+            # Started by saving the backports or the mirrors
+            return _("Update the apt cache")
+        if name == 'endecrypt':
+            return self.btnEncrypt.get_label() if self.encrypt else self.btnDecrypt.get_label()
+        if name in buttons:
+            return buttons[name].get_label()
+        return self.title
+
+    def set_cancel_state(self):
+        self.btnCancelTask.set_visible(any(task.cancellable for task in self.tasks.values()))
+
+    def on_btnCancelTask_clicked(self, widget):
+        for task in self.runner.cancel_all():
+            self.log.write(f"Cancel {task.name}", 'on_btnCancelTask_clicked', 'warning')
+        self.btnCancelTask.set_visible(False)
+
+    def wake_up(self):
+        # Called from the worker threads: schedule one idle callback for all pending items
+        with self.wake_up_lock:
+            if self.wake_up_pending:
+                return
+            self.wake_up_pending = True
+        GLib.idle_add(self.process_threads)
+
+    def process_threads(self):
+        with self.wake_up_lock:
+            self.wake_up_pending = False
+        for name in list(self.tasks):
+            # A dialog of an ended task runs a nested main loop
+            if name in self.tasks:
+                self.check_thread(name)
+        return False
+
+    def pulse_thread(self, name):
+        # Stop pulsing when the thread ended or reports real progress
+        if name not in self.tasks or name in self.task_progress:
+            return False
+        self.update_progress(0.1, True)
+        return True
+
     def check_thread(self, name):
-        if self.threads[name].is_alive():
-            if name in ['update', 'cleanup', 'driver', 'splash']:
-                self.update_progress(0.1, True)
-            if not self.queue.empty():
-                ret = self.queue.get()
-                self.queue.task_done()
-                if ret:
-                    self.log.write(f"Queue returns: {ret}", 'check_thread')
-                    if name == 'localize':
-                        if ret[0] > 0 and ret[1] > 0:
-                            self.update_progress(1 / (ret[0] / ret[1]))
-                        else:
-                            self.update_progress(0)
-                    elif name == 'endecrypt':
-                        # Queue returns list: [fraction, error_code, partition_index, partition, message]
-                        self.endecrypt_success = True
-                        self.update_progress(ret[0])
-                        if ret[1] > 0:
-                            self.log.write(str(ret[4]), name, 'error')
-                            self.endecrypt_success = False
-                        if ret[2] is not None and ret[3] is not None:
-                            # Replace old partition with new partition in my_partitions
-                            self.my_partitions[ret[2]] = ret[3]
-                    elif name == 'changepassphrase':
-                        # Queue returns list: [fraction, error_code, partition_index, partition, message]
-                        self.update_progress(ret[0])
-                        if ret[1] > 0:
-                            self.log.write(str(ret[4]), name, 'error')
-                        if ret[2] is not None and ret[3] is not None:
-                            # Replace old partition with new partition in my_partitions
-                            self.my_partitions[ret[2]] = ret[3]
-                            self.changed_devices.append(ret[3]['device'].replace('/mapper', ''))
+        task = self.tasks[name]
+        alive = not task.done()
+        # Handle everything that is on the queue
+        ret = self.get_queue_item(name)
+        while ret is not None:
+            if ret:
+                self.handle_queue_item(name, ret)
+            ret = self.get_queue_item(name)
+        if alive:
             return True
 
-        # Thread is done
-        print((f"Thread {name} ended"))
-        if not self.queue.empty():
-            ret = self.queue.get()
-            self.queue.task_done()
-            if ret:
-                self.log.write(f"Queue returns: {ret}", 'check_thread')
-                if name == 'endecrypt':
-                    # Queue returns list: [fraction, error_code, partition, message]
-                    self.endecrypt_success = True
-                    self.update_progress(ret[0])
-                    if ret[1] > 0:
-                        self.log.write(str(ret[4]), name, 'error')
-                        self.endecrypt_success = False
-                    if ret[2] is not None and ret[3] is not None:
-                        # Replace old partition with new partition in my_partitions
-                        self.my_partitions[ret[2]] = ret[3]
-                elif name == 'changepassphrase':
-                    # Queue returns list: [fraction, error_code, partition_index, partition, message]
-                    self.update_progress(ret[0])
-                    if ret[1] > 0:
-                        self.log.write(str(ret[4]), name, 'error')
-                    if ret[2] is not None and ret[3] is not None:
-                        # Replace old partition with new partition in my_partitions
-                        self.my_partitions[ret[2]] = ret[3]
-                        self.changed_devices.append(ret[3]['device'].replace('/mapper', ''))
-        del self.threads[name]
+        # Task is done
+        print((f"Task {name} ended"))
+        del self.tasks[name]
+        self.set_cancel_state()
+        progress = self.task_progress.pop(name, None)
+        if progress:
+            if isinstance(progress.data, dict) and progress.data.get('status') == 'pmerror':
+                self.log.write(f"{progress.data['package']}: {progress.message}", name, 'error')
+            self.update_progress(0, text='')
+        if task.cancelled:
+            msg = _("Timed out") if task.timed_out else _("Cancelled")
+            self.log.write(f"{name}: {msg}", 'check_thread', 'warning')
+            warning_dialog(self.task_title(name), msg)
+        elif task.future.exception() is not None:
+            self.log.write(f"{name}: {task.future.exception()}", 'check_thread', 'error')
 
         if 'update' in name:
             self.mirrors = self.list_mirrors()
@@ -2096,6 +1931,10 @@ class SolydXKSystemSettings():
             self.fill_treeview_cleanup()
             self.update_progress(0)
             self.set_buttons_state(True)
+        elif name == 'driver':
+            self.fill_treeview_device_driver()
+            self.update_progress(0)
+            self.set_buttons_state(True)
         elif name in ['localize', 'splash']:
             msg = _("You need to reboot your system for the new settings to take affect.")
             message_dialog(_("Reboot"), msg)
@@ -2104,11 +1943,12 @@ class SolydXKSystemSettings():
         elif name == 'endecrypt':
             if self.endecrypt_success:
                 # Write all needed configuration
-                self.write_partition_configuration()
-
-                # Ask to reboot
                 answer = False
-                if self.encrypt:
+                if not self.write_partition_configuration():
+                    warning_dialog(_("Configuration"),
+                                   _("Could not write fstab and crypttab: Grub was not updated.\n"
+                                     "Check the log file before you restart your computer."))
+                elif self.encrypt:
                     answer = question_dialog(_("Encryption done"),
                                             _("Encryption has finished.\n\n"
                                               "Do you want to restart your computer?"))
@@ -2137,6 +1977,47 @@ class SolydXKSystemSettings():
 
         return False
 
+    def handle_queue_item(self, name, ret):
+        self.log.write(f"Queue returns: {ret}", 'check_thread')
+        if name == 'localize':
+            if ret[0] > 0 and ret[1] > 0:
+                self.update_progress(1 / (ret[0] / ret[1]))
+            else:
+                self.update_progress(0)
+        elif name == 'endecrypt':
+            # Queue returns list: [fraction, error_code, partition_index, partition, message]
+            self.endecrypt_success = True
+            self.update_progress(ret[0])
+            if ret[1] > 0:
+                self.log.write(str(ret[4]), name, 'error')
+                self.endecrypt_success = False
+            if ret[2] is not None and ret[3] is not None:
+                # Replace old partition with new partition in my_partitions
+                self.my_partitions[ret[2]] = ret[3]
+        elif name == 'changepassphrase':
+            # Queue returns list: [fraction, error_code, partition_index, partition, message]
+            self.update_progress(ret[0])
+            if ret[1] > 0:
+                self.log.write(str(ret[4]), name, 'error')
+            if ret[2] is not None and ret[3] is not None:
+                # Replace old partition with new partition in my_partitions
+                self.my_partitions[ret[2]] = ret[3]
+                self.changed_devices.append(ret[3]['device'].replace('/mapper', ''))
+
+    def get_queue_item(self, name):
+        # TaskProgress (e.g. apt status, see run_apt) moves the progress bar,
+        # return the first other item on the queue or None
+        while not self.queue.empty():
+            ret = self.queue.get()
+            self.queue.task_done()
+            if isinstance(ret, TaskProgress):
+                self.task_progress[ret.name] = ret
+                if ret.fraction is not None:
+                    self.update_progress(ret.fraction, text=f"{ret.fraction * 100:.0f}% {ret.message}")
+                continue
+            return ret
+        return None
+
     def set_buttons_state(self, enable):
         self.btnSaveBackports.set_sensitive(enable)
         self.btnSaveMirrors.set_sensitive(enable)
@@ -2180,7 +2061,7 @@ class SolydXKSystemSettings():
                             "for the encrypted partition")
         return InputDialog(title=passphrase_title,
                            text=f"{passphrase_text}:\n\n<b>{device_path}</b>",
-                           is_password=True).show()
+                           is_password=True).show_dialog()
 
     def update_progress(self, step=-1, pulse=False, text=None):
         if step >= 0 and step <= 1:
@@ -2192,6 +2073,7 @@ class SolydXKSystemSettings():
         else:
             self.progressbar.pulse()
         if text is not None:
+            self.progressbar.set_show_text(bool(text))
             self.progressbar.set_text(str(text))
 
     def temp_mount(self, partition, passphrase=None):
@@ -2201,10 +2083,8 @@ class SolydXKSystemSettings():
 
     def temp_unmount_all(self):
         # Unmount temp mounts and remove
-        tmp_mounts = getoutput(f"grep '{TMPMOUNT}' /proc/mounts | awk '{{print $1,$2}}'")
-        for tmp_mount in tmp_mounts:
+        for device, mount in MountSnapshot().get_mounts(TMPMOUNT):
             try:
-                device, mount = tmp_mount.split()
                 try:
                     if self.udisks2.unmount_device(device):
                         self.log.write(f"Remove temporary mount point: {mount}",
@@ -2218,7 +2098,24 @@ class SolydXKSystemSettings():
             except:
                 pass
 
+    # Ctrl+Shift+D: show the subprocess statistics
+    def on_windowPref_key_press_event(self, widget, event):
+        modifiers = Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK
+        if (event.state & modifiers) == modifiers and event.keyval in (Gdk.KEY_D, Gdk.KEY_d):
+            self.show_subprocess_stats()
+            return True
+        return False
+
+    def show_subprocess_stats(self):
+        stats = SUBPROCESS_STATS.format_summary()
+        self.log.write(stats, 'show_subprocess_stats')
+        message_dialog(title=_('Subprocess statistics'),
+                       text=_('Executed commands'),
+                       text2=f"<tt>{GLib.markup_escape_text(stats)}</tt>")
+
     # Close the gui
     def on_windowPref_destroy(self, widget):
+        # Cancels the downloads only: running installs and purges are finished
+        self.runner.shutdown()
         self.temp_unmount_all()
         Gtk.main_quit()
@@ -31,6 +31,7 @@ gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk
 from threading import Thread
 from os.path import exists
+from imagecache import get_pixbuf
 
 
 class Splash(Thread):
@@ -55,7 +56,7 @@ class Splash(Thread):
         self.window.add(overlay)
         if exists(self.background_image):
             # Window will adjust to image size automatically
-            bg = Gtk.Image.new_from_file(self.background_image)
+            bg = Gtk.Image.new_from_pixbuf(get_pixbuf(self.background_image))
             overlay.add(bg)
         else:
             # Set window dimensions
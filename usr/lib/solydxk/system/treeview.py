@@ -4,8 +4,8 @@
 import gi
 gi.require_version('Gtk', '3.0')
 
-import os
 from gi.repository import Gtk, GObject, GdkPixbuf
+from imagecache import get_pixbuf
 
 # Treeview needs subclassing of gobject
 # http://www.pygtk.org/articles/subclassing-gobject/sub-classing-gobject-in-python.htm
@@ -16,6 +16,45 @@ from gi.repository import Gtk, GObject, GdkPixbuf
 #self.myTreeView.connect('checkbox-toggled', self.myCallback)
 
 
+# Column type names used by callers and their list store types
+COLUMN_TYPES = {'str': str, 'bool': bool, 'int': int, 'GdkPixbuf.Pixbuf': GdkPixbuf.Pixbuf}
+
+class TrigramIndex():
+    """ Lowercase trigram index for substring search in many short values """
+    def __init__(self, values=None):
+        self.trigrams = {}
+        self.values = set()
+        for value in values or []:
+            self.add(value)
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, value):
+        self.values.add(value)
+        for trigram in self._trigrams(value.lower()):
+            self.trigrams.setdefault(trigram, set()).add(value)
+
+    def remove(self, value):
+        self.values.discard(value)
+        for trigram in self._trigrams(value.lower()):
+            self.trigrams.get(trigram, set()).discard(value)
+
+    def search(self, text):
+        """ Return the set of values that contain text (case insensitive) """
+        text = text.strip().lower()
+        if not text:
+            return set(self.values)
+        if len(text) < 3:
+            return {value for value in self.values if text in value.lower()}
+        # Start with the smallest trigram set and verify the candidates
+        candidate_sets = sorted((self.trigrams.get(trigram, set())
+                                 for trigram in self._trigrams(text)), key=len)
+        candidates = set.intersection(*candidate_sets) if candidate_sets else set()
+        return {value for value in candidates if text in value.lower()}
+
+
 class TreeViewHandler(GObject.GObject):
 
     __gsignals__ = {
@@ -27,17 +66,37 @@ class TreeViewHandler(GObject.GObject):
         GObject.GObject.__init__(self)
         self.log = loggerObject
         self.treeview = treeView
+        # Type-ahead filter: see fillTreeview(filterColNr)
+        self.filterModel = None
+        self.filterColNr = -1
+        self.filterIndex = None
+        self.filterIters = {}
+        self.filterMatches = None
+        self.filterText = ''
+
+    # Return the list store, also when the treeview shows a filter model
+    def getModel(self):
+        model = self.treeview.get_model()
+        if isinstance(model, Gtk.TreeModelFilter):
+            return model.get_model()
+        return model
+
+    # Convert a path of the treeview to a path in the list store
+    def toModelPath(self, path):
+        if self.treeview.get_model() is self.filterModel and self.filterModel is not None:
+            return self.filterModel.convert_path_to_child_path(Gtk.TreePath(path))
+        return path
 
     # Clear treeview
     def clearTreeView(self):
-        liststore = self.treeview.get_model()
+        liststore = self.getModel()
         if liststore is not None:
             liststore.clear()
             self.treeview.set_model(liststore)
 
     # General function to fill a treeview
     # Set setCursorWeight to 400 if you don't want bold font
-    def fillTreeview(self, contentList, columnTypesList, setCursor=0, setCursorWeight=400, firstItemIsColName=False, appendToExisting=False, appendToTop=False, fontSize=10000, fixedImgHeight=None, multipleSelection=False):
+    def fillTreeview(self, contentList, columnTypesList, setCursor=0, setCursorWeight=400, firstItemIsColName=False, appendToExisting=False, appendToTop=False, fontSize=10000, fixedImgHeight=None, multipleSelection=False, filterColNr=-1):
         # Check if this is a multi-dimensional array
         multiCols = self.isListOfLists(contentList)
         colNameList = []
@@ -46,109 +105,60 @@ class TreeViewHandler(GObject.GObject):
             # Empty treeview
             self.clearTreeView()
 
-        liststore = self.treeview.get_model()
+        # A filterable list store has an extra visible column after weight and font size
+        filterable = filterColNr >= 0
+        liststore = self.getModel()
         if liststore is None or not appendToExisting:
-            # Dirty but need to dynamically create a list store
             for col in self.treeview.get_columns():
                 self.treeview.remove_column(col)
-            dynListStore = 'Gtk.ListStore('
-            for i in range(len(columnTypesList)):
-                dynListStore += str(columnTypesList[i]) + ', '
-            dynListStore += 'int, int)'
-            msg = "Create list store eval string: %(eval)s" % { "eval": dynListStore }
-            print(msg)
+            # Data columns followed by weight and font size
+            gtypes = [COLUMN_TYPES.get(str(colType), str) for colType in columnTypesList]
+            gtypes += [int, int]
+            if filterable:
+                gtypes.append(bool)
+            liststore = Gtk.ListStore(*gtypes)
             if self.log:
-                self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-            liststore = eval(dynListStore)
+                self.log.write(f"Create list store: {columnTypesList}", 'self.treeview.fillTreeview', 'debug')
 
         # Create list with column names
         if not appendToExisting:
             if multiCols:
-                #for i in range(len(contentList[0])):
                 for i in range(len(columnTypesList)):
                     if firstItemIsColName and len(contentList) > 0:
-                        msg = "First item is column name (multi-column list): %(iscolname)s" % { "iscolname": contentList[0][i] }
-                        print(msg)
-                        if self.log:
-                            self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
                         colNameList.append(contentList[0][i])
                     else:
                         colNameList.append('Column ' + str(i))
             else:
                 if firstItemIsColName and len(contentList) > 0:
-                    msg = "First item is column name (single-column list): %(iscolname)s" % { "iscolname": contentList[0] }
-                    print(msg)
-                    if self.log:
-                        self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
                     colNameList.append(contentList[0])
                 else:
                     colNameList.append('Column 0')
-
-            msg = "Create column names: %(cols)s" % { "cols": str(colNameList) }
-            print(msg)
             if self.log:
-                self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-
-        # Add data to the list store
-        for i in range(len(contentList)):
-            # Skip first row if that is a column name
-            skip = False
-            if firstItemIsColName and i == 0:
-                msg = "First item is column name: skip first item"
-                print(msg)
-                if self.log:
-                    self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-                skip = True
-
-            if not skip:
-                weight = 400
-                weightRow = setCursor
-                if firstItemIsColName:
-                    weightRow += 1
-                if i == weightRow:
-                    weight = setCursorWeight
-                if multiCols:
-                    # Dynamically add data for multi-column list store
-                    if appendToTop:
-                        dynListStoreAppend = 'liststore.insert(0, ['
-                    else:
-                        dynListStoreAppend = 'liststore.append(['
-                    for j in range(len(contentList[i])):
-                        val = str(contentList[i][j]).strip()
-                        if str(columnTypesList[j]) == 'str':
-                            # Make sure it's a single line
-                            val = '"' + val.replace('\n', ' ').replace('\r', '').replace('"', '\\"') + '"'
-                        if str(columnTypesList[j]) == 'GdkPixbuf.Pixbuf':
-                            if os.path.isfile(val):
-                                if fixedImgHeight:
-                                    pb = GdkPixbuf.Pixbuf.new_from_file(val)
-                                    nw = pb.get_width() * (fixedImgHeight / pb.get_height())
-                                    val = 'GdkPixbuf.Pixbuf.new_from_file("%(val)s").scale_simple(%(width)s, %(height)s, GdkPixbuf.InterpType.BILINEAR)' % { "val": val, "width": nw, "height": fixedImgHeight }
-                                else:
-                                    val = 'GdkPixbuf.Pixbuf.new_from_file("%(val)s")' % { "val": val }
-                            else:
-                                val = None
-                        dynListStoreAppend += '%s, ' % val
-                    dynListStoreAppend += '%s, %s])' % (str(weight), fontSize)
-
-                    msg = "Add data to list store: %(data)s" % { "data": dynListStoreAppend }
-                    #print(msg)
-                    if self.log:
-                        self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-                    eval(dynListStoreAppend)
-                else:
-                    if appendToTop:
-                        msg = "Add data to top of list store: %(totop)s" % { "totop": str(contentList[i]) }
-                        #print(msg)
-                        if self.log:
-                            self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-                        liststore.insert(0, [contentList[i], weight, fontSize])
-                    else:
-                        msg = "Add data to bottom of list store: %(tobottom)s" % { "tobottom": str(contentList[i]) }
-                        #print(msg)
-                        if self.log:
-                            self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-                        liststore.append([contentList[i], weight, fontSize])
+                self.log.write(f"Create column names: {colNameList}", 'self.treeview.fillTreeview', 'debug')
+
+        # Detach the model while adding the data to the list store
+        self.treeview.set_model(None)
+        position = 0 if appendToTop else -1
+        nrCols = len(columnTypesList) if multiCols else 1
+        columns = list(range(nrCols + 2 + (1 if filterable else 0)))
+        weightRow = setCursor + 1 if firstItemIsColName else setCursor
+        # Only look up each image once per fill
+        pixbufs = {}
+        start = 1 if firstItemIsColName else 0
+        for i in range(start, len(contentList)):
+            weight = setCursorWeight if i == weightRow else 400
+            if multiCols:
+                values = [self._convertValue(val, str(columnTypesList[j]), fixedImgHeight, pixbufs)
+                          for j, val in enumerate(contentList[i][:nrCols])]
+            else:
+                values = [contentList[i]]
+            values += [weight, fontSize]
+            if filterable:
+                values.append(True)
+            liststore.insert_with_valuesv(position, columns, values)
+        if self.log:
+            self.log.write(f"Added {len(contentList) - start} rows to list store",
+                           'self.treeview.fillTreeview', 'debug')
 
         # Create columns
         if not appendToExisting:
@@ -164,57 +174,40 @@ class TreeViewHandler(GObject.GObject):
                 if colFound == '':
                     # Build renderer and attributes to define the column
                     # Possible attributes for text: text, foreground, background, weight
-                    attr = ', text=' + str(i) + ', weight=' + str(len(colNameList)) + ', size=' + str(len(colNameList) + 1)
-                    renderer = 'Gtk.CellRendererText()'  # an object that renders text into a Gtk.TreeView cell
-                    if str(columnTypesList[i]) == 'bool':
-                        renderer = 'Gtk.CellRendererToggle()'  # an object that renders a toggle button into a TreeView cell
-                        attr = ', active=' + str(i)
-                    if str(columnTypesList[i]) == 'GdkPixbuf.Pixbuf':
-                        renderer = 'Gtk.CellRendererPixbuf()'  # an object that renders a pixbuf into a Gtk.TreeView cell
-                        attr = ', pixbuf=' + str(i)
-                    dynCol = 'Gtk.TreeViewColumn("' + str(colNameList[i]) + '", ' + renderer + attr + ')'
-
-                    msg = "Create column: %(col)s" % { "col": dynCol }
-                    print(msg)
-                    if self.log:
-                        self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-                    col = eval(dynCol)
-
-                    # Get the renderer of the column and add type specific properties
-                    rend = col.get_cells()[0]
-                    #if str(columnTypesList[i]) == 'str':
-                        # TODO: Right align text in column - add parameter to function
-                        #rend.set_property('xalign', 1.0)
-                    if str(columnTypesList[i]) == 'bool':
+                    colType = str(columnTypesList[i])
+                    if colType == 'bool':
+                        # Renders a toggle button into a TreeView cell
+                        rend = Gtk.CellRendererToggle()
+                        col = Gtk.TreeViewColumn(str(colNameList[i]), rend, active=i)
                         # If checkbox column, add toggle function
-                        msg = "Check box found: add toggle function"
-                        #print(msg)
-                        if self.log:
-                            self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
                         rend.connect('toggled', self.tvchk_on_toggle, liststore, i)
+                    elif colType == 'GdkPixbuf.Pixbuf':
+                        # Renders a pixbuf into a TreeView cell
+                        rend = Gtk.CellRendererPixbuf()
+                        col = Gtk.TreeViewColumn(str(colNameList[i]), rend, pixbuf=i)
+                    else:
+                        # Renders text into a TreeView cell
+                        rend = Gtk.CellRendererText()
+                        col = Gtk.TreeViewColumn(str(colNameList[i]), rend, text=i,
+                                                 weight=len(colNameList),
+                                                 size=len(colNameList) + 1)
 
                     # Let the last colum fill the treeview
                     if i == len(colNameList):
-                        msg = "Last column fills treeview: %(colnr)d" % { "colnr": i }
-                        #print(msg)
-                        if self.log:
-                            self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
                         col.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
 
                     # Finally add the column
                     self.treeview.append_column(col)
-                    msg = "Column added: %(col)s" % { "col": col.get_title() }
-                    print(msg)
-                    if self.log:
-                        self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
-                else:
-                    msg = "Column already exists: %(col)s" % { "col": colFound }
-                    print(msg)
                     if self.log:
-                        self.log.write(msg, 'self.treeview.fillTreeview', 'debug')
+                        self.log.write(f"Column added: {col.get_title()}", 'self.treeview.fillTreeview', 'debug')
 
         # Add liststore, set cursor and set the headers
-        self.treeview.set_model(liststore)
+        if filterable:
+            self.setFilterModel(liststore, filterColNr, len(columnTypesList) + 2)
+            self.treeview.set_model(self.filterModel)
+        else:
+            self.filterModel = None
+            self.treeview.set_model(liststore)
         if setCursor >= 0:
             self.treeview.set_cursor(setCursor)
         self.treeview.set_headers_visible(firstItemIsColName)
@@ -236,15 +229,66 @@ class TreeViewHandler(GObject.GObject):
             if multipleSelection:
                 selection.set_mode(Gtk.SelectionMode.MULTIPLE)
 
+    # Convert a content value to the type of its list store column
+    def _convertValue(self, val, colType, fixedImgHeight=None, pixbufs=None):
+        if colType == 'GdkPixbuf.Pixbuf':
+            path = str(val).strip()
+            if pixbufs is None:
+                return get_pixbuf(path, height=fixedImgHeight)
+            if path not in pixbufs:
+                pixbufs[path] = get_pixbuf(path, height=fixedImgHeight)
+            return pixbufs[path]
+        if colType == 'bool':
+            if isinstance(val, str):
+                return val.strip() == 'True'
+            return bool(val)
+        if colType == 'int':
+            return int(val)
+        # Make sure it's a single line
+        return str(val).strip().replace('\n', ' ').replace('\r', '')
+
+    # Index the values of colNr and show the list store through a filter on visibleColNr
+    def setFilterModel(self, liststore, colNr, visibleColNr):
+        self.filterColNr = colNr
+        self.filterIters = {}
+        itr = liststore.get_iter_first()
+        while itr is not None:
+            # List store iters persist as long as the row exists
+            self.filterIters[liststore.get_value(itr, colNr)] = itr
+            itr = liststore.iter_next(itr)
+        self.filterIndex = TrigramIndex(self.filterIters.keys())
+        self.filterMatches = None
+        self.filterText = ''
+        self.filterModel = liststore.filter_new()
+        self.filterModel.set_visible_column(visibleColNr)
+
+    # Only show rows that contain text: only rows that change visibility are touched
+    def filterRows(self, text):
+        if self.filterModel is None:
+            return
+        liststore = self.filterModel.get_model()
+        visibleColNr = liststore.get_n_columns() - 1
+        matches = None if not text.strip() else self.filterIndex.search(text)
+        allValues = self.filterIndex.values
+        oldMatches = allValues if self.filterMatches is None else self.filterMatches
+        newMatches = allValues if matches is None else matches
+        for value in oldMatches ^ newMatches:
+            itr = self.filterIters.get(value)
+            if itr is not None:
+                liststore.set_value(itr, visibleColNr, value in newMatches)
+        self.filterMatches = matches
+        self.filterText = text.strip().lower()
+
     def tvchk_on_toggle(self, cell, path, liststore, colNr, *ignore):
         #print((">> tvchk_on_toggle: path={0}, colNr={1}".format(path, colNr)))
         if path is not None:
+            path = self.toModelPath(path)
             itr = liststore.get_iter(path)
             toggled = liststore[itr][colNr]
             liststore[itr][colNr] = not toggled
             # Raise the custom trigger
             # parameters: path, column number, toggle value
-            self.emit('checkbox-toggled', path, colNr, not toggled)
+            self.emit('checkbox-toggled', str(path), colNr, not toggled)
 
     # Get the selected value in a treeview
     def getSelectedValue(self, colNr=0):
@@ -316,24 +360,97 @@ class TreeViewHandler(GObject.GObject):
         return self.treeview.get_model().get_n_columns()
 
     def delRow(self, rowNr=None):
+        model = self.getModel()
         if rowNr is None:
-            (model, pathList) = self.treeview.get_selection().get_selected_rows()
-            for path in pathList:
-                it = model.get_iter(path)
+            (viewModel, pathList) = self.treeview.get_selection().get_selected_rows()
+            # Remove from the bottom up to keep the paths valid
+            for path in reversed(pathList):
+                it = model.get_iter(self.toModelPath(path))
+                self._forgetRow(model, it)
                 model.remove(it)
         else:
-            model = self.treeview.get_model()
-            it = model.get_iter(rowNr)
+            it = model.get_iter(self.toModelPath(rowNr))
+            self._forgetRow(model, it)
             model.remove(it)
 
     def addRow(self, rowList):
-        model = self.treeview.get_model()
-        model.append(rowList)
-        self.treeview.set_model(model)
+        model = self.getModel()
+        if self.filterModel is not None:
+            value = rowList[self.filterColNr]
+            it = model.append(list(rowList) + [self._isVisible(value)])
+            self._indexRow(value, it)
+        else:
+            model.append(rowList)
+
+    # New rows are matched against the current filter text
+    def _isVisible(self, value):
+        if self.filterMatches is None:
+            return True
+        if self.filterText in value.lower():
+            self.filterMatches.add(value)
+            return True
+        return False
+
+    def _indexRow(self, value, it):
+        if self.filterModel is not None:
+            self.filterIters[value] = it
+            self.filterIndex.add(value)
+
+    def _forgetRow(self, model, it):
+        if self.filterModel is not None:
+            value = model.get_value(it, self.filterColNr)
+            self.filterIters.pop(value, None)
+            self.filterIndex.remove(value)
+            if self.filterMatches is not None:
+                self.filterMatches.discard(value)
+
+    # Remove all rows with a value in values (one pass)
+    def removeRowsByValue(self, values, colNr=1):
+        values = set(values)
+        model = self.getModel()
+        if model is not None and values:
+            if self.filterModel is not None and colNr == self.filterColNr:
+                # Indexed: no need to walk the list store
+                for value in values:
+                    itr = self.filterIters.get(value)
+                    if itr is not None:
+                        self._forgetRow(model, itr)
+                        model.remove(itr)
+                return
+            itr = model.get_iter_first()
+            while itr is not None:
+                if model.get_value(itr, colNr) in values:
+                    self._forgetRow(model, itr)
+                    # remove() moves itr to the next row
+                    if not model.remove(itr):
+                        break
+                else:
+                    itr = model.iter_next(itr)
+
+    # Insert rows in a list store that is sorted on colNr (binary search per row)
+    def insertRowsSorted(self, rows, colNr=1, weight=400, fontSize=10000):
+        model = self.getModel()
+        if model is None:
+            return
+        for row in rows:
+            low = 0
+            high = len(model)
+            while low < high:
+                mid = (low + high) // 2
+                if model[mid][colNr] < row[colNr]:
+                    low = mid + 1
+                else:
+                    high = mid
+            if self.filterModel is not None:
+                value = row[self.filterColNr]
+                itr = model.insert(low, list(row) + [weight, fontSize, self._isVisible(value)])
+                self._indexRow(value, itr)
+            else:
+                model.insert(low, list(row) + [weight, fontSize])
 
     def getToggledValues(self, toggleColNr=0, valueColNr=1):
         values = []
-        model = self.treeview.get_model()
+        model = self.getModel()
         if model is not None:
             itr = model.get_iter_first()
             while itr is not None:
@@ -345,19 +462,18 @@ class TreeViewHandler(GObject.GObject):
     # Toggle check box in row
     def treeviewToggleRows(self, toggleColNrList, pathList=None):
         if pathList is None:
-            (model, pathList) = self.treeview.get_selection().get_selected_rows()
-        else:
-            model = self.treeview.get_model()
+            (viewModel, pathList) = self.treeview.get_selection().get_selected_rows()
+        model = self.getModel()
         # Toggle the check boxes in the given column in the selected rows (=pathList)
         if model is not None:
             for path in pathList:
                 for colNr in toggleColNrList:
-                    it = model.get_iter(path)
+                    it = model.get_iter(self.toModelPath(path))
                     model[it][colNr] = not model[it][colNr]
 
     # Deselect all drivers, except PAE
     def treeviewToggleAll(self, toggleColNrList=[0], toggleValue=False, excludeColNr=-1, excludeValue=''):
-        model = self.treeview.get_model()
+        model = self.getModel()
         if model is not None:
             itr = model.get_iter_first()
             while itr is not None:
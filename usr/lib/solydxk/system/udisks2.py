@@ -7,15 +7,19 @@ from os.path import exists, join, basename
 import re
 import os
 from os import makedirs
-from utils import getoutput, shell_exec, has_grub, get_uuid, \
-                  get_mount_points, get_filesystem, get_label
+from utils import shell_exec, has_grub, get_uuid, \
+                  get_filesystem, get_label, MountSnapshot
 from encryption import get_status, is_encrypted, \
-                       is_connected, connect_block_device
+                       connect_block_device
 
-import gi
-# Make sure the right UDisks version is loaded
-gi.require_version('UDisks', '2.0')
-from gi.repository import UDisks, GLib
+
+def get_udisks_client():
+    """ Return a new UDisks client: UDisks is loaded on first use """
+    import gi
+    # Make sure the right UDisks version is loaded
+    gi.require_version('UDisks', '2.0')
+    from gi.repository import UDisks
+    return UDisks.Client.new_sync(None)
 
 
 # Subclass dict class to overwrite the __missing__() method
@@ -30,18 +34,22 @@ class Tree(dict):
 class Udisks2():
     def __init__(self):
         super(Udisks2, self).__init__()
+        from gi.repository import GLib
         self.no_options = GLib.Variant('a{sv}', {})
         self.read_only = GLib.Variant('a{sv}', {'options': GLib.Variant('s', 'ro')})
         self.no_interaction = GLib.Variant('a{sv}',
                                            {'auth.no_user_interaction': GLib.Variant('b', True)})
         self.devices = Tree()
+        self.snapshot = MountSnapshot()
 
     # Create multi-dimensional dictionary with drive/device/deviceinfo
     def fill_devices(self, include_drives=True, include_flash=True):
 
         self.devices.clear()
+        # Read swaps and mounts once for all devices
+        self.snapshot.refresh()
 
-        client = UDisks.Client.new_sync(None)
+        client = get_udisks_client()
         manager = client.get_object_manager()
 
         for obj in manager.get_objects():
@@ -125,7 +133,7 @@ class Udisks2():
                             mount_points = device_fs.get_cached_property('MountPoints').get_bytestring_array()
                             if not mount_points:
                                 # It can be manually mounted (with mount command)
-                                mount_points = get_mount_points(device_path)
+                                mount_points = self.snapshot.get_mount_points(device_path)
                             if not mount_points:
                                 # If not mounted, temporary mount it to get needed info
                                 mount_points = self._mount_filesystem(device_fs, read_only=True)
@@ -180,25 +188,25 @@ class Udisks2():
 
     def _get_block(self, device_path):
         obj_path = self._get_object_path(device_path)
-        client = UDisks.Client.new_sync(None)
+        client = get_udisks_client()
         dev = client.get_object(obj_path)
         return dev.get_block()
 
     def _get_filesystem(self, device_path):
         obj_path = self._get_object_path(device_path)
-        client = UDisks.Client.new_sync(None)
+        client = get_udisks_client()
         dev = client.get_object(obj_path)
         return dev.get_filesystem()
 
     def _get_partition(self, device_path):
         obj_path = self._get_object_path(device_path)
-        client = UDisks.Client.new_sync(None)
+        client = get_udisks_client()
         dev = client.get_object(obj_path)
         return dev.get_partition()
 
     def _get_drive(self, device_path):
         obj_path = self._get_object_path(device_path)
-        client = UDisks.Client.new_sync(None)
+        client = get_udisks_client()
         manager = client.get_object_manager()
         dev = client.get_object(obj_path)
         block = dev.get_block()
@@ -248,10 +256,9 @@ class Udisks2():
         return devices
 
     def is_mounted(self, device_path):
-        ret = getoutput(f"grep '{device_path} ' /proc/mounts")[0]
-        if device_path in ret:
-            return True
-        return False
+        # Refresh: this is checked right after (un)mounting
+        self.snapshot.refresh()
+        return self.snapshot.is_mounted(device_path)
 
     def mount_device(self, device_path, mount_point=None,
                      filesystem=None, options=None, passphrase=None):
@@ -264,9 +271,9 @@ class Udisks2():
         if passphrase is None:
             passphrase = ''
 
-        # Connect encrypted partition
-        if passphrase:
-            if is_encrypted(device_path) and not is_connected(device_path):
+        # Connect encrypted partition (or use the mapping unlocked earlier in this session)
+        if passphrase and not '/dev/mapper' in device_path:
+            if is_encrypted(device_path):
                 device_path, filesystem = connect_block_device(device_path, passphrase)
 
         # Do not mount swap partition
@@ -400,16 +407,18 @@ class Udisks2():
         mapper_path = ''
         mount_points = []
         mapper = '/dev/mapper'
-        mapper_name = getoutput(f"ls {mapper} | grep {basename(partition_path)}$")[0]
+        mapper_names = os.listdir(mapper) if exists(mapper) else []
+        mapper_name = next((name for name in mapper_names
+                            if name.endswith(basename(partition_path))), '')
         if not mapper_name:
             uuid = get_uuid(partition_path)
             if uuid:
-                mapper_name = getoutput(f"ls {mapper} | grep {uuid}$")[0]
+                mapper_name = next((name for name in mapper_names if name.endswith(uuid)), '')
         if mapper_name:
             mapper_path = join(mapper, mapper_name)
             if exists(mapper_path):
                 mount_point = ''
-                mount_points = get_mount_points(mapper_path)
+                mount_points = self.snapshot.get_mount_points(mapper_path)
                 if mount_points:
                     # Just return the first mount point
                     mount_point = mount_points[0]
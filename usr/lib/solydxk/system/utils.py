@@ -7,18 +7,29 @@ from urllib.request import ProxyHandler, HTTPBasicAuthHandler, Request, \
     build_opener, HTTPHandler, install_opener, urlopen
 from urllib.error import URLError, HTTPError
 from random import choice
+import os
 import re
+import tempfile
 import threading
+import signal
 import operator
+import time
+import json
+import atexit
+import functools
+import sys
+import shlex
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
 import filecmp
 import numbers
 import socket
 import pwd
 from enum import Enum
 from os import walk, listdir
-from os.path import exists, isdir, expanduser,  splitext,  dirname, islink
+from os.path import exists, isdir, expanduser,  splitext,  dirname, islink, join
 from packaging.version import Version, InvalidVersion
-import apt
 
 
 # Debian testing uses names, not numbers
@@ -39,43 +50,296 @@ deb_name[5] = "lenny"
 deb_name[4] = "etch"
 
 
+class Tracer():
+    """ Collect operation timings (see Trace and traced) for the log
+        and, with --profile, as Chrome trace events """
+    def __init__(self):
+        self.log = None
+        self.profile_path = None
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start = time.perf_counter()
+
+    def configure(self, log=None, profile_path=None):
+        """ Write traces to log and, when given, a trace event file on exit """
+        self.log = log
+        if profile_path and not self.profile_path:
+            atexit.register(self.write_profile)
+        self.profile_path = profile_path
+
+    def active_traces(self):
+        """ Traces of the current thread that are running """
+        if not hasattr(self.local, 'traces'):
+            self.local.traces = []
+        return self.local.traces
+
+    def add_event(self, name, category, start, duration, args=None):
+        if not self.profile_path:
+            return
+        event = {'name': name,
+                 'cat': category,
+                 'ph': 'X',
+                 'ts': round((start - self.start) * 1000000),
+                 'dur': round(duration * 1000000),
+                 'pid': os.getpid(),
+                 'tid': threading.get_ident(),
+                 'args': args or {}}
+        with self.lock:
+            self.events.append(event)
+
+    def write_profile(self):
+        """ Write the events as Chrome trace event JSON (chrome://tracing, Perfetto) """
+        if not self.profile_path:
+            return
+        with self.lock:
+            events = list(self.events)
+        try:
+            with open(file=self.profile_path, mode='w', encoding='utf-8') as profile_fle:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, profile_fle)
+        except OSError as detail:
+            print((f"write_profile exception: {detail}"))
+
+
+TRACER = Tracer()
+
+
+class Trace():
+    """ Context manager that records wall time, subprocess count and subprocess time
+
+        with Trace('fill_partitions'):
+            ...
+    """
+    def __init__(self, name):
+        self.name = name
+        self.subprocesses = 0
+        self.subprocess_time = 0.0
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        TRACER.active_traces().append(self)
+        return self
+
+    def __exit__(self, *args):
+        self.duration = time.perf_counter() - self.start
+        TRACER.active_traces().remove(self)
+        if TRACER.log is not None:
+            TRACER.log.write(f"{self.name}: {self.duration:.3f}s, {self.subprocesses} subprocesses "
+                             f"({self.subprocess_time:.3f}s)", self.name, 'debug', duration=self.duration)
+        TRACER.add_event(self.name, 'operation', self.start, self.duration,
+                         {'subprocesses': self.subprocesses,
+                          'subprocess_time': round(self.subprocess_time, 6)})
+        return False
+
+
+def traced(func):
+    """ Decorator: run func in a Trace named after the function """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with Trace(func.__qualname__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class SubprocessStats():
+    """ Ring buffer with the last executed commands:
+        dictionaries {command, caller, duration, returncode, output_size} """
+    def __init__(self, size=1000):
+        self.records = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, command, caller, duration, returncode, output_size=0):
+        with self.lock:
+            self.records.append({'command': str(command),
+                                 'caller': caller,
+                                 'duration': duration,
+                                 'returncode': returncode,
+                                 'output_size': output_size})
+
+    def summary(self, nr=10):
+        """ Return dictionary {count, duration, slowest, frequent}
+            frequent: dictionaries {program, count, duration, callers} """
+        with self.lock:
+            records = list(self.records)
+        programs = {}
+        for record in records:
+            words = record['command'].split()
+            program = os.path.basename(words[0]) if words else ''
+            stats = programs.setdefault(program, {'program': program, 'count': 0,
+                                                  'duration': 0.0, 'callers': set()})
+            stats['count'] += 1
+            stats['duration'] += record['duration']
+            stats['callers'].add(record['caller'])
+        return {'count': len(records),
+                'duration': sum(record['duration'] for record in records),
+                'slowest': sorted(records, key=lambda x: x['duration'], reverse=True)[:nr],
+                'frequent': sorted(programs.values(), key=lambda x: (x['count'], x['duration']), reverse=True)[:nr]}
+
+    def format_summary(self, nr=10):
+        """ Return the summary as text """
+        summary = self.summary(nr)
+        lines = [f"{summary['count']} commands in {summary['duration']:.3f}s", '', 'Slowest:']
+        for record in summary['slowest']:
+            lines.append(f"{record['duration']:8.3f}s  rc={record['returncode']}  "
+                         f"{record['output_size']:>7}B  {record['caller']}  {record['command'][:80]}")
+        lines += ['', 'Most frequent:']
+        for stats in summary['frequent']:
+            lines.append(f"{stats['count']:5}x {stats['duration']:8.3f}s  {stats['program']}  "
+                         f"({', '.join(sorted(stats['callers'])[:3])})")
+        return '\n'.join(lines)
+
+
+SUBPROCESS_STATS = SubprocessStats()
+
+
+def get_caller():
+    """ Return file:function:line of the first caller outside this module and subprocess """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename in (__file__, subprocess.__file__):
+        frame = frame.f_back
+    if frame is None:
+        return ''
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+def record_subprocess(command, start, returncode, output_size=0, caller=None):
+    """ Account a finished subprocess to the running traces of this thread
+        and add it to SUBPROCESS_STATS """
+    duration = time.perf_counter() - start
+    for trace in TRACER.active_traces():
+        trace.subprocesses += 1
+        trace.subprocess_time += duration
+    TRACER.add_event(str(command), 'subprocess', start, duration, {'returncode': returncode})
+    SUBPROCESS_STATS.add(command, caller or get_caller(), duration, returncode, output_size)
+
+
+class TracedPopen(subprocess.Popen):
+    """ Popen that records the subprocess once it has finished
+        In a task (see TaskRunner) the subprocess gets its own process group
+        which is killed when the task is cancelled. trace=False: caller records. """
+    def __init__(self, *args, trace=True, **kwargs):
+        self.trace_start = time.perf_counter()
+        self.trace_recorded = not trace
+        self.trace_caller = get_caller()
+        self.task = current_task()
+        if self.task is not None:
+            kwargs.setdefault('start_new_session', True)
+        super().__init__(*args, **kwargs)
+        if self.task is not None:
+            self.task.add_process(self)
+
+    def _record(self):
+        if self.returncode is not None and self.task is not None:
+            self.task.remove_process(self)
+        if not self.trace_recorded and self.returncode is not None:
+            self.trace_recorded = True
+            record_subprocess(self.args, self.trace_start, self.returncode, caller=self.trace_caller)
+
+    def poll(self):
+        returncode = super().poll()
+        self._record()
+        return returncode
+
+    def wait(self, timeout=None):
+        returncode = super().wait(timeout)
+        self._record()
+        return returncode
+
+
 def shell_exec_popen(command, kwargs=None):
     """ Execute a command with Popen (returns the returncode attribute) """
     if not kwargs:
         kwargs = {}
     print((f"Executing: {command}"))
     # return subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, **kwargs)
-    return subprocess.Popen(command,
-                            shell=True,
-                            bufsize=0,
-                            stdout=subprocess.PIPE,
-                            universal_newlines=True,
-                            **kwargs)
+    return TracedPopen(command,
+                       shell=True,
+                       bufsize=0,
+                       stdout=subprocess.PIPE,
+                       universal_newlines=True,
+                       **kwargs)
 
 
 def shell_exec(command, wait=False):
     """ Execute a command (returns the returncode attribute) """
     print((f"Executing: {command}"))
-    if wait:
-        return subprocess.check_call(command, shell=True)
-    return subprocess.call(command, shell=True)
+    start = time.perf_counter()
+    returncode = None
+    try:
+        with TracedPopen(command, shell=True, trace=False) as process:
+            returncode = process.wait()
+        if wait and returncode:
+            raise subprocess.CalledProcessError(returncode, command)
+    finally:
+        record_subprocess(command, start, returncode)
+    return returncode
 
 
 def getoutput(command, timeout=None):
     """ Return command output (list) """
+    start = time.perf_counter()
+    returncode = 0
+    output_size = 0
     try:
-        output = subprocess.check_output(
-            command, shell=True, timeout=timeout).decode('utf-8').strip().split('\n')
+        with TracedPopen(command, shell=True, stdout=subprocess.PIPE, trace=False) as process:
+            try:
+                output = process.communicate(timeout=timeout)[0]
+            except subprocess.TimeoutExpired:
+                process.kill()
+                raise
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command)
+        output_size = len(output)
+        output = output.decode('utf-8').strip().split('\n')
     except Exception as detail:
         print((f'getoutput exception: {detail}'))
+        returncode = getattr(detail, 'returncode', None)
         output = ['']
+    record_subprocess(command, start, returncode, output_size)
     return output
 
 
 def chroot_exec(command, target):
     """ Excecute command in chroot """
-    command = command.replace('"', "'").strip()  # FIXME
-    return shell_exec(f'chroot {target}/ /bin/sh -c "{command}"')
+    return shell_exec(chroot_command(command, target))
+
+
+def chroot_command(command, target):
+    """ Return the shell command that runs command in chroot target """
+    return f"chroot {shlex.quote(target.rstrip('/') + '/')} /bin/sh -c {shlex.quote(command.strip())}"
+
+
+# Root of the configured system: / or a mounted image or chroot.
+# Set with set_root or the SOLYDXK_SYSTEM_ROOT environment variable.
+_ROOT = os.path.abspath(os.environ.get('SOLYDXK_SYSTEM_ROOT') or '/')
+
+
+def set_root(root):
+    """ Configure the system mounted at root (None or / for the running system) """
+    global _ROOT
+    _ROOT = os.path.abspath(root or '/')
+
+
+def get_root():
+    """ Return the root of the configured system """
+    return _ROOT
+
+
+def root_path(path):
+    """ Return the path of an absolute system path in the configured root """
+    if _ROOT == '/' or not path.startswith('/'):
+        return path
+    return join(_ROOT, path.lstrip('/'))
+
+
+def root_command(command):
+    """ Return command run in the configured root: tools that change
+        the system (update-grub, dpkg, apt-get) run in a chroot """
+    if _ROOT == '/':
+        return command
+    return chroot_command(command, _ROOT)
 
 
 def memoize(func):
@@ -235,10 +499,16 @@ def compare_package_versions(package_version_1, package_version_2):
         return VersionComparison.INVALID
 
 
+def get_apt_cache():
+    """ Return a new apt cache of the configured root: python-apt is imported on first use """
+    import apt
+    return apt.Cache(rootdir=None if _ROOT == '/' else _ROOT)
+
+
 def does_package_exist(package_name):
     """ Check if a package exists """
     try:
-        return bool(apt.Cache()[package_name])
+        return bool(get_apt_cache()[package_name])
     except KeyError:
         return False
 
@@ -246,18 +516,18 @@ def does_package_exist(package_name):
 def is_package_installed(package_name):
     """ Check if a package is installed """
     try:
-        return apt.Cache()[package_name].is_installed
+        return get_apt_cache()[package_name].is_installed
     except KeyError:
         return False
 
 
 def get_package_version(package_name, candidate=False):
     """ Get package version (default=installed) """
-    if not does_package_exist(package_name=package_name):
+    cache = get_apt_cache()
+    if package_name not in cache:
         return ''
-    if candidate:
-        return apt.Cache()[package_name].candidate.version
-    return apt.Cache()[package_name].installed.version
+    version = cache[package_name].candidate if candidate else cache[package_name].installed
+    return version.version if version else ''
 
 
 def validate_package_version(package_name, min_package_version):
@@ -275,7 +545,7 @@ def has_newer_in_backports(package_name, backports_repository):
     installed_version = get_package_version(package_name=package_name)
     if not installed_version:
         return False
-    for version in apt.Cache()[package_name].versions:
+    for version in get_apt_cache()[package_name].versions:
         for origin in version.origins:
             if backports_repository in origin.archive:
                 if Version(version.version) > Version(installed_version):
@@ -517,6 +787,106 @@ def get_apt_force():
     return force
 
 
+class AptStatusParser():
+    """ Parse the APT::Status-Fd lines of apt-get:
+        dlstatus:<item>:<percent>:<message>
+        pmstatus:<package>:<percent>:<message>
+        pmerror:<package>:<percent>:<message>
+        pmconffile:<conffile>:<percent>:<message>
+        The download phase takes download_weight of the total progress. """
+    def __init__(self, download_weight=0.5):
+        self.download_weight = download_weight
+        self.downloaded = False
+
+    def parse(self, line):
+        """ Return dictionary {status, package, percent, fraction, message} or None """
+        parts = line.rstrip('\n').split(':', 3)
+        if len(parts) < 4:
+            return None
+        status, package, percent, message = parts
+        try:
+            percent = float(percent)
+        except ValueError:
+            return None
+        if status == 'dlstatus':
+            self.downloaded = True
+            package = ''
+            fraction = percent / 100 * self.download_weight
+        elif status in ('pmstatus', 'pmerror', 'pmconffile'):
+            fraction = percent / 100
+            if self.downloaded:
+                fraction = self.download_weight + fraction * (1 - self.download_weight)
+        else:
+            return None
+        return {'status': status,
+                'package': package,
+                'percent': percent,
+                'fraction': min(max(fraction, 0.0), 1.0),
+                'message': message.strip()}
+
+    def parse_stream(self, lines):
+        """ Generator of progress dictionaries for an iterable of status lines """
+        for line in lines:
+            progress = self.parse(line)
+            if progress is not None:
+                yield progress
+
+
+def stream_apt_status(status_fle, callback=None, download_weight=0.5):
+    """ Parse status lines from a file object (APT::Status-Fd pipe or recorded transcript)
+        and call callback(progress) for each. Returns the last progress dictionary. """
+    progress = None
+    parser = AptStatusParser(download_weight)
+    for progress in parser.parse_stream(status_fle):
+        if callback is not None:
+            callback(progress)
+    return progress
+
+
+def run_apt(arguments, callback=None, download_weight=0.5, env=None):
+    """ Run apt-get with APT::Status-Fd and call callback(progress) for each status line
+        (see AptStatusParser). arguments: list or string.
+        Returns the return code of apt-get. """
+    if isinstance(arguments, str):
+        arguments = shlex.split(arguments)
+    read_fd, write_fd = os.pipe()
+    # The status pipe is inherited through chroot
+    command = [] if _ROOT == '/' else ['chroot', _ROOT]
+    command += ['apt-get',
+                '-o', f'APT::Status-Fd={write_fd}',
+                '-o', 'Dpkg::Progress-Fancy=0',
+                '-o', 'Dpkg::Use-Pty=0'] + list(arguments)
+    print((f"Executing: {' '.join(command)}"))
+    try:
+        process = TracedPopen(command, pass_fds=(write_fd,), env=env)
+    except OSError as detail:
+        print((f'run_apt exception: {detail}'))
+        os.close(read_fd)
+        return 100
+    finally:
+        os.close(write_fd)
+    with os.fdopen(read_fd, mode='r', encoding='utf-8', errors='replace') as status_fle:
+        stream_apt_status(status_fle, callback, download_weight)
+    return process.wait()
+
+
+def run_apt_commands(commands, callback=None, download_weight=0.5, env=None):
+    """ Run apt-get commands (see run_apt), each command gets an equal share of the progress fraction.
+        Stops when the current task is cancelled. Returns the return codes. """
+    returncodes = []
+    nr_commands = len(commands)
+    for index, arguments in enumerate(commands):
+        task = current_task()
+        if task is not None and task.cancelled:
+            break
+        def scale_progress(progress, index=index):
+            progress['fraction'] = (index + progress['fraction']) / nr_commands
+            if callback is not None:
+                callback(progress)
+        returncodes.append(run_apt(arguments, scale_progress, download_weight, env))
+    return returncodes
+
+
 def get_apt_cache_locked_program():
     """ Return the program that is locking apt cache """
     apt_packages = ["dpkg", "apt-get", "synaptic", "adept", "adept-notifier"]
@@ -531,7 +901,7 @@ def get_installed_file_path(file_name):
     """ Return the program that is locking apt cache """
     if not file_name:
         return ''
-    return getoutput(f"dpkg -S {file_name} | awk '{{print $NF;}}'")[0]
+    return getoutput(f"dpkg --root={shlex.quote(_ROOT)} -S {file_name} | awk '{{print $NF;}}'")[0]
 
 
 def get_debian_name():
@@ -546,11 +916,12 @@ def get_debian_name():
 def get_debian_version():
     """ Get Debian's version number (float) """
     version = 0
-    if exists('/etc/debian_version'):
-        cmd = "grep -oP '^[a-z0-9]+' /etc/debian_version"
+    debian_version = root_path('/etc/debian_version')
+    if exists(debian_version):
+        cmd = f"grep -oP '^[a-z0-9]+' {debian_version}"
         version = str_to_nr(getoutput(cmd)[0].strip())
     if not version:
-        cmd = "grep -Ei 'version=|version_id=|release=' /etc/*release | grep -oP '[0-9]+'"
+        cmd = f"grep -Ei 'version=|version_id=|release=' {root_path('/etc')}/*release | grep -oP '[0-9]+'"
         versions = getoutput(cmd)
         for version in versions:
             if is_numeric(version):
@@ -596,6 +967,36 @@ def replace_pattern_in_file(pattern, replace_string, file, append_if_not_exists=
             with open(file=file, mode='w', encoding='utf-8') as target_fle:
                 target_fle.write(cont)
 
+
+def write_file_atomic(file, cont):
+    """ Write cont to a temporary file, fsync it and rename it over file
+        so that file is never left half written.
+        A symlinked file is resolved: the link target is replaced, not the link """
+    file = os.path.realpath(file)
+    file_dir = dirname(file)
+    mode = 0o644
+    if exists(file):
+        mode = os.stat(file).st_mode & 0o7777
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file)}.", dir=file_dir)
+    try:
+        with os.fdopen(fd, mode='w', encoding='utf-8') as tmp_fle:
+            tmp_fle.write(cont)
+            tmp_fle.flush()
+            os.fsync(tmp_fle.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file)
+    except OSError:
+        if exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Make the rename itself durable
+    dir_fd = os.open(file_dir, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
 def get_nr_files_in_dir(path, recursive=True):
     """ Return number of files in path """
     total = 0
@@ -624,14 +1025,65 @@ def get_user_home():
     return expanduser(f"~{get_logged_user()}")
 
 
+# Cached has_grub results: {path: (device identity, result)}
+GRUB_CACHE = {}
+
+
+def get_device_identity(path):
+    """ Return an identifier of the device and its partition table:
+        major:minor, disk sequence number, size and udev partition table UUID """
+    dev_id = get_dev_id(path)
+    if not dev_id:
+        return ''
+    identity = [dev_id]
+    sys_dir = os.path.realpath(f"/sys/dev/block/{dev_id}")
+    for attr_path in (join(sys_dir, 'diskseq'), join(dirname(sys_dir), 'diskseq'),
+                      join(sys_dir, 'size')):
+        try:
+            with open(file=attr_path, mode='r', encoding='utf-8') as attr_fle:
+                identity.append(attr_fle.read().strip())
+        except OSError:
+            identity.append('')
+    try:
+        with open(file=f"/run/udev/data/b{dev_id}", mode='r', encoding='utf-8') as udev_fle:
+            for line in udev_fle:
+                if line.startswith('E:ID_PART_TABLE_UUID='):
+                    identity.append(line.strip().split('=', 1)[1])
+                    break
+    except OSError:
+        pass
+    return '|'.join(identity)
+
+
 def has_grub(path):
     """ Return if path (device or partition) has grub installed """
-    cmd = f"dd bs=512 count=1 if={path} 2>/dev/null | strings"
-    out = ' '.join(getoutput(cmd)).upper()
-    if "GRUB" in out:
+    identity = get_device_identity(path)
+    cached = GRUB_CACHE.get(path)
+    if identity and cached and cached[0] == identity:
+        return cached[1]
+    # Read the boot sector and search the GRUB signature
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            boot_sector = os.read(fd, 512)
+        finally:
+            os.close(fd)
+    except OSError:
+        return False
+    grub = b'GRUB' in boot_sector.upper()
+    if grub:
         print((f"Grub installed on {path}"))
-        return True
-    return False
+    if identity:
+        GRUB_CACHE[path] = (identity, grub)
+    return grub
+
+
+def clear_grub_cache(path=None):
+    """ Forget cached has_grub results (after grub-install) """
+    if path is None:
+        GRUB_CACHE.clear()
+    else:
+        GRUB_CACHE.pop(path, None)
 
 
 def get_uuid(partition_path):
@@ -663,7 +1115,155 @@ def get_label(partition_path):
 
 def get_swap_device():
     """ Return the swap device """
-    return getoutput("grep '/' /proc/swaps | awk '{print $1}'")[0]
+    swaps = MountSnapshot().swaps
+    return swaps[0] if swaps else ''
+
+
+class DpkgSelections():
+    """ Snapshot of dpkg --get-selections: sets of held back and installed packages """
+    def __init__(self):
+        self.refresh()
+
+    def refresh(self):
+        self.hold = set()
+        self.install = set()
+        for line in getoutput(f"env LANG=C dpkg --root={shlex.quote(_ROOT)} --get-selections"):
+            fields = line.split()
+            if len(fields) != 2:
+                continue
+            if fields[1] == 'hold':
+                self.hold.add(fields[0])
+            elif fields[1] == 'install':
+                self.install.add(fields[0])
+
+    def set_hold(self, packages, hold=True):
+        """ Hold (or unhold) packages with a single apt-mark call.
+            Returns the packages that were moved. """
+        packages = sorted(set(packages) & (self.install if hold else self.hold))
+        if not packages:
+            return []
+        action = 'hold' if hold else 'unhold'
+        if shell_exec(root_command(f"apt-mark {action} {' '.join(packages)}")) != 0:
+            # Something went wrong: read the real state
+            before = set(self.hold)
+            self.refresh()
+            return sorted(before ^ self.hold)
+        if hold:
+            self.install.difference_update(packages)
+            self.hold.update(packages)
+        else:
+            self.hold.difference_update(packages)
+            self.install.update(packages)
+        return packages
+
+
+def get_dev_id(device):
+    """ Return major:minor of a block device or an empty string """
+    try:
+        rdev = os.stat(device).st_rdev
+    except (OSError, ValueError):
+        return ''
+    if not rdev:
+        return ''
+    return f"{os.major(rdev)}:{os.minor(rdev)}"
+
+
+class MountSnapshot():
+    """ Active swap devices and mounts, read once from /proc/swaps and /proc/self/mountinfo.
+        Devices can be given as path, major:minor or UUID(=...) """
+    def __init__(self, swaps_path='/proc/swaps',
+                 mountinfo_path='/proc/self/mountinfo',
+                 uuid_dir='/dev/disk/by-uuid'):
+        self.swaps_path = swaps_path
+        self.mountinfo_path = mountinfo_path
+        self.uuid_dir = uuid_dir
+        self.refresh()
+
+    def refresh(self):
+        self.swaps = []
+        self.swap_ids = set()
+        # List of (device, mount_point, fs_type, major:minor)
+        self.mounts = []
+        self.mount_points = set()
+        self.mounted_ids = set()
+        self._uuid_ids = None
+
+        try:
+            with open(file=self.swaps_path, mode='r', encoding='utf-8') as swaps_fle:
+                # Skip the header
+                for line in swaps_fle.readlines()[1:]:
+                    fields = line.split()
+                    if fields and fields[0][:1] == '/':
+                        self.swaps.append(fields[0])
+        except OSError:
+            pass
+        self.swap_ids = {self._id(device) for device in self.swaps} - {''}
+
+        try:
+            with open(file=self.mountinfo_path, mode='r', encoding='utf-8') as mountinfo_fle:
+                for line in mountinfo_fle:
+                    fields = line.split()
+                    if '-' not in fields:
+                        continue
+                    sep = fields.index('-')
+                    mount_point = self._unescape(fields[4])
+                    device = self._unescape(fields[sep + 2])
+                    self.mounts.append((device, mount_point, fields[sep + 1], fields[2]))
+                    self.mount_points.add(mount_point)
+                    if device[:1] == '/':
+                        self.mounted_ids.add(fields[2])
+        except OSError:
+            pass
+
+    @staticmethod
+    def _unescape(value):
+        # Spaces and tabs are octal escaped in mountinfo
+        return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), value)
+
+    def _id(self, device):
+        """ Return major:minor of a device path, major:minor or UUID """
+        if re.match(r'^[0-9]+:[0-9]+$', device):
+            return device
+        uuid = device.replace('UUID=', '')
+        if device.startswith('UUID=') or device[:1] != '/':
+            if self._uuid_ids is None:
+                self._uuid_ids = {}
+                if isdir(self.uuid_dir):
+                    for link in listdir(self.uuid_dir):
+                        self._uuid_ids[link] = get_dev_id(join(self.uuid_dir, link))
+            return self._uuid_ids.get(uuid, '')
+        return get_dev_id(device)
+
+    def is_swap(self, device):
+        """ Return if device is an active swap device """
+        if device in self.swaps:
+            return True
+        dev_id = self._id(device)
+        return bool(dev_id) and dev_id in self.swap_ids
+
+    def is_mounted(self, device_or_mount_point):
+        """ Return if a device or a mount point is mounted """
+        if device_or_mount_point in self.mount_points:
+            return True
+        if self.get_mount_points(device_or_mount_point):
+            return True
+        dev_id = self._id(device_or_mount_point)
+        return bool(dev_id) and dev_id in self.mounted_ids
+
+    def get_mount_points(self, device):
+        """ Return mount points of device (list) """
+        mount_points = [mount[1] for mount in self.mounts if mount[0] == device]
+        if not mount_points:
+            dev_id = self._id(device)
+            if dev_id and dev_id in self.mounted_ids:
+                mount_points = [mount[1] for mount in self.mounts
+                                if mount[3] == dev_id and mount[0][:1] == '/']
+        return mount_points
+
+    def get_mounts(self, mount_point_prefix):
+        """ Return list of (device, mount_point) mounted under mount_point_prefix """
+        return [(mount[0], mount[1]) for mount in self.mounts
+                if mount[1].startswith(mount_point_prefix)]
 
 def has_value_in_multi_array(value, multi_array, index=None):
     """ Check if value exist in multi-dimensional array """
@@ -689,44 +1289,150 @@ def aspect_ratio(width, height):
     except Exception:
         return None
 
-class ExecuteThreadedCommands(threading.Thread):
-    """ Class to run commands in a thread and return the output in a queue """
+class NotifyQueue(Queue):
+    """ Queue that calls notify() after every put, e.g. to wake up the GUI main loop """
 
-    def __init__(self, commandList, queue=None, return_output=False):
-        threading.Thread.__init__(self)
+    def __init__(self, maxsize=0, notify=None):
+        super().__init__(maxsize)
+        self.notify = notify
 
-        self._commands = commandList
-        self._queue = queue
-        self._return_output = return_output
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        if self.notify is not None:
+            self.notify()
 
-    def run(self):
-        if isinstance(self._commands, (list, tuple)):
-            for cmd in self._commands:
-                self.exec_cmd(cmd)
-        else:
-            self.exec_cmd(self._commands)
 
-    def exec_cmd(self, cmd):
-        """ Execute a given command """
-        if self._return_output:
-            ret = getoutput(cmd)
-        else:
-            ret = shell_exec(cmd)
-        if self._queue is not None:
-            self._queue.put(ret)
+TaskProgress = namedtuple('TaskProgress', ['name', 'fraction', 'message', 'data'])
+_TASK_LOCAL = threading.local()
+CANCEL_KILL_DELAY = 5
+
+
+def current_task():
+    """ Return the task (see TaskRunner) running in this thread or None """
+    return getattr(_TASK_LOCAL, 'task', None)
+
 
+def report_progress(fraction=None, message='', data=None):
+    """ Put TaskProgress of the current task on its queue (no task: do nothing) """
+    task = current_task()
+    if task is not None:
+        task.progress(fraction, message, data)
 
-class ExecuteThreadedFunction(threading.Thread):
-    """ Class to run a function in a thread and return the output in a queue """
 
-    def __init__(self, target, queue=None, *args):
-        threading.Thread.__init__(self)
+def report_apt_progress(progress):
+    """ Callback for run_apt: report the apt progress dictionary as task progress """
+    report_progress(progress['fraction'], progress['message'], progress)
 
-        self._target = target
-        self._args = args
-        self._queue = queue
 
-    def run(self):
-        out = self._target(*self._args)
-        if self._queue is not None:
-            self._queue.put(out)
+def kill_process_group(process, sig=signal.SIGTERM):
+    """ Send sig to the process group of a process started with start_new_session """
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class Task():
+    """ A function submitted to a TaskRunner
+        cancel() stops a pending task and kills the process groups of a running task:
+        the function can check task.cancelled to stop early """
+
+    def __init__(self, name, queue=None, timeout=None, cancellable=True):
+        self.name = name
+        self.queue = queue
+        self.timeout = timeout
+        self.cancellable = cancellable
+        self.future = None
+        self.timed_out = False
+        self._cancel_event = threading.Event()
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def progress(self, fraction=None, message='', data=None):
+        if self.queue is not None:
+            self.queue.put(TaskProgress(self.name, fraction, message, data))
+
+    def add_process(self, process):
+        with self._lock:
+            self._processes.add(process)
+        if self.cancelled:
+            kill_process_group(process)
+
+    def remove_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def cancel(self):
+        """ Returns False if the task cannot be cancelled """
+        if not self.cancellable:
+            return False
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            kill_process_group(process)
+        if processes:
+            # Kill what ignored SIGTERM
+            timer = threading.Timer(CANCEL_KILL_DELAY, self._kill, args=(processes,))
+            timer.daemon = True
+            timer.start()
+        return True
+
+    def _kill(self, processes):
+        for process in processes:
+            if process.poll() is None:
+                kill_process_group(process, signal.SIGKILL)
+
+    def _time_out(self):
+        self.timed_out = True
+        self.cancel()
+
+
+class TaskRunner():
+    """ Run functions in a bounded thread pool
+        submit() returns a Task: task.future has the result or the exception """
+
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task')
+        self.tasks = []
+
+    def submit(self, name, target, *args, queue=None, timeout=None, cancellable=True, **kwargs):
+        task = Task(name, queue, timeout, cancellable)
+        self.tasks = [t for t in self.tasks if not t.done()] + [task]
+        task.future = self.executor.submit(self._run, task, target, args, kwargs)
+        return task
+
+    @staticmethod
+    def _run(task, target, args, kwargs):
+        if task.cancelled:
+            return None
+        _TASK_LOCAL.task = task
+        timer = None
+        if task.timeout:
+            timer = threading.Timer(task.timeout, task._time_out)
+            timer.daemon = True
+            timer.start()
+        try:
+            return target(*args, **kwargs)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            _TASK_LOCAL.task = None
+
+    def cancel_all(self):
+        """ Cancel all cancellable tasks, returns the cancelled tasks """
+        return [task for task in self.tasks if not task.done() and task.cancel()]
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            self.cancel_all()
+        self.executor.shutdown(wait=False)